@@ -1,24 +1,40 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file, send_from_directory, Response, stream_with_context
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from functools import wraps
 import pyodbc
 import os
 import datetime
-import random
-import uuid
 import io
 import json
 
-# ReportLab imports
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
 from io import BytesIO
 
+from db_pool import init_pool, get_pool, get_db_connection
+from schema import get_schema
+from query_plans import get_plan
+from order_writer import write_order, order_lines
+from order_ids import next_order_id
+from stock import reserve_stock, InsufficientStock, parse_stock, supports_stock, stock_column, set_stock
+from order_search import OrderFilter, search_orders, order_summary, encode_order_cursor, decode_order_cursor
+from sales_rollup import live_stats
+from events import get_broker, stream_events
+from catalog import get_catalog, get_catalog_cache, invalidate_catalog, catalog_response
+from product_search import search_products
+from product_page import ProductListing, fetch_product_page, count_products, category_counts, products_by_id
+from image_variants import get_image_processor
+from upload_store import stage_upload, acquire_blob, release_blob, is_blob_name
+from upload_gc import get_upload_sweeper
+from assets import init_assets, serve_asset
+from invoice_pdf import get_pdf_cache, warm_invoice
+from pdf_render import render_pdf, get_renderer
+from report_stream import stream_orders_report
+from order_export import FORMATS as EXPORT_FORMATS, parse_date_range, stream_export
+from order_service import get_order, get_order_cache
+from page_cache import immutable_order_page
+from cli import register_commands
+from migrations import migrate, ensure_migrated
+
 app = Flask(__name__)
 app.config.from_pyfile('config.py')
 
@@ -36,214 +52,33 @@ if not os.path.exists('static/images'):
 # Global connection variable
 conn = None
 
-# Create DB connection for SQL Server
-def get_db_connection():
-    try:
-        # Try Windows Authentication first with master database
-        conn_str = (f'DRIVER={app.config["SQL_SERVER_DRIVER"]};'
-                   f'SERVER={app.config["SQL_SERVER"]};'
-                   f'DATABASE=master;'
-                   f'Trusted_Connection=yes;')
-        conn = pyodbc.connect(conn_str)
-        
-        # Create the BMS database if it doesn't exist
-        cursor = conn.cursor()
-        cursor.execute("IF NOT EXISTS (SELECT * FROM sys.databases WHERE name = 'BMS') CREATE DATABASE BMS")
-        conn.commit()
-        conn.close()
-        
-        # Now connect to the BMS database
-        conn_str = (f'DRIVER={app.config["SQL_SERVER_DRIVER"]};'
-                   f'SERVER={app.config["SQL_SERVER"]};'
-                   f'DATABASE={app.config["DATABASE"]};'
-                   f'Trusted_Connection=yes;')
-        conn = pyodbc.connect(conn_str)
-        return conn
-    except:
-        try:
-            # Try SQL Server Authentication with master database first
-            conn_str = (f'DRIVER={app.config["SQL_SERVER_DRIVER"]};'
-                       f'SERVER={app.config["SQL_SERVER"]};'
-                       f'DATABASE=master;'
-                       f'UID={app.config["SQL_USERNAME"]};'
-                       f'PWD={app.config["SQL_PASSWORD"]};')
-            conn = pyodbc.connect(conn_str)
-            
-            # Create the BMS database if it doesn't exist
-            cursor = conn.cursor()
-            cursor.execute("IF NOT EXISTS (SELECT * FROM sys.databases WHERE name = 'BMS') CREATE DATABASE BMS")
-            conn.commit()
-            conn.close()
-            
-            # Now connect to the BMS database
-            conn_str = (f'DRIVER={app.config["SQL_SERVER_DRIVER"]};'
-                       f'SERVER={app.config["SQL_SERVER"]};'
-                       f'DATABASE={app.config["DATABASE"]};'
-                       f'UID={app.config["SQL_USERNAME"]};'
-                       f'PWD={app.config["SQL_PASSWORD"]};')
-            conn = pyodbc.connect(conn_str)
-            return conn
-        except pyodbc.Error as e:
-            print(f"Database connection error: {str(e)}")
-            raise
+# Pooled DB connections for SQL Server - one checkout per request,
+# returned to the pool when the app context tears down
+init_pool(app)
+
+# Management commands (flask bench-order-write, ...)
+register_commands(app)
+
+# Versioned static URLs served with immutable caching
+init_assets(app)
 
-# Initialize the database
+# Initialize the database - the schema itself lives in migrations.py
 def init_db():
     with app.app_context():
         conn = get_db_connection()
-        cursor = conn.cursor()
+        applied = migrate(conn)
         
-        # Check if users table exists, if not create it
-        cursor.execute("""
-        IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'users')
-        BEGIN
-            CREATE TABLE users (
-                id INT IDENTITY(1,1) PRIMARY KEY,
-                username NVARCHAR(100) NOT NULL UNIQUE,
-                password NVARCHAR(255) NOT NULL,
-                role NVARCHAR(50) NOT NULL
-            )
-        END
-        """)
-        
-        # Check if products table exists, if not create it
-        cursor.execute("""
-        IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'products')
-        BEGIN
-            CREATE TABLE products (
-                id INT IDENTITY(1,1) PRIMARY KEY,
-                name NVARCHAR(255) NOT NULL,
-                quantity NVARCHAR(100) NOT NULL,
-                price DECIMAL(10,2) NOT NULL,
-                image NVARCHAR(255),
-                image_filename NVARCHAR(255),
-                category NVARCHAR(50) DEFAULT 'General',
-                active BIT DEFAULT 1
-            )
-        END
-        """)
-        
-        # Check if orders table exists, if not create it
-        cursor.execute("""
-        IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'orders')
-        BEGIN
-            CREATE TABLE orders (
-                id INT IDENTITY(1,1) PRIMARY KEY,
-                order_id NVARCHAR(50) NOT NULL UNIQUE,
-                customer_name NVARCHAR(255) NOT NULL,
-                customer_email NVARCHAR(255),
-                customer_phone NVARCHAR(50),
-                subtotal_amount DECIMAL(10,2) DEFAULT 0,
-                discount_applied BIT DEFAULT 0,
-                discount_amount DECIMAL(10,2) DEFAULT 0,
-                total_amount DECIMAL(10,2) NOT NULL,
-                total_price DECIMAL(10,2) NOT NULL,
-                payment_method NVARCHAR(50),
-                order_date DATETIME NOT NULL,
-                created_by INT
-            )
-        END
-        """)
-        
-        # Check if order_items table exists, if not create it
-        cursor.execute("""
-        IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'order_items')
-        BEGIN
-            CREATE TABLE order_items (
-                id INT IDENTITY(1,1) PRIMARY KEY,
-                order_id NVARCHAR(50) NOT NULL,
-                product_id INT NOT NULL,
-                product_name NVARCHAR(255),
-                quantity INT NOT NULL,
-                unit_price DECIMAL(10,2) NOT NULL,
-                total_price DECIMAL(10,2) NOT NULL,
-                price DECIMAL(10,2) NOT NULL
-            )
-        END
-        """)
-        
-        # Add missing columns to existing tables
-        try:
-            # Add columns to orders table if they don't exist
-            cursor.execute("""
-            IF NOT EXISTS (SELECT * FROM sys.columns WHERE object_id = OBJECT_ID('orders') AND name = 'subtotal_amount')
-                ALTER TABLE orders ADD subtotal_amount DECIMAL(10,2) DEFAULT 0
-            """)
-            
-            cursor.execute("""
-            IF NOT EXISTS (SELECT * FROM sys.columns WHERE object_id = OBJECT_ID('orders') AND name = 'discount_applied')
-                ALTER TABLE orders ADD discount_applied BIT DEFAULT 0
-            """)
-            
-            cursor.execute("""
-            IF NOT EXISTS (SELECT * FROM sys.columns WHERE object_id = OBJECT_ID('orders') AND name = 'discount_amount')
-                ALTER TABLE orders ADD discount_amount DECIMAL(10,2) DEFAULT 0
-            """)
-            
-            cursor.execute("""
-            IF NOT EXISTS (SELECT * FROM sys.columns WHERE object_id = OBJECT_ID('orders') AND name = 'customer_email')
-                ALTER TABLE orders ADD customer_email NVARCHAR(255)
-            """)
-            
-            cursor.execute("""
-            IF NOT EXISTS (SELECT * FROM sys.columns WHERE object_id = OBJECT_ID('orders') AND name = 'customer_phone')
-                ALTER TABLE orders ADD customer_phone NVARCHAR(50)
-            """)
-            
-            cursor.execute("""
-            IF NOT EXISTS (SELECT * FROM sys.columns WHERE object_id = OBJECT_ID('orders') AND name = 'payment_method')
-                ALTER TABLE orders ADD payment_method NVARCHAR(50)
-            """)
-            
-            cursor.execute("""
-            IF NOT EXISTS (SELECT * FROM sys.columns WHERE object_id = OBJECT_ID('orders') AND name = 'created_by')
-                ALTER TABLE orders ADD created_by INT
-            """)
-            
-            # Add columns to order_items table if they don't exist
-            cursor.execute("""
-            IF NOT EXISTS (SELECT * FROM sys.columns WHERE object_id = OBJECT_ID('order_items') AND name = 'product_name')
-                ALTER TABLE order_items ADD product_name NVARCHAR(255)
-            """)
-            
-            cursor.execute("""
-            IF NOT EXISTS (SELECT * FROM sys.columns WHERE object_id = OBJECT_ID('order_items') AND name = 'unit_price')
-                ALTER TABLE order_items ADD unit_price DECIMAL(10,2) NOT NULL DEFAULT 0
-            """)
-            
-            cursor.execute("""
-            IF NOT EXISTS (SELECT * FROM sys.columns WHERE object_id = OBJECT_ID('order_items') AND name = 'total_price')
-                ALTER TABLE order_items ADD total_price DECIMAL(10,2) NOT NULL DEFAULT 0
-            """)
-            
-            # Add columns to products table if they don't exist
-            cursor.execute("""
-            IF NOT EXISTS (SELECT * FROM sys.columns WHERE object_id = OBJECT_ID('products') AND name = 'image_filename')
-                ALTER TABLE products ADD image_filename NVARCHAR(255)
-            """)
-            
-            cursor.execute("""
-            IF NOT EXISTS (SELECT * FROM sys.columns WHERE object_id = OBJECT_ID('products') AND name = 'category')
-                ALTER TABLE products ADD category NVARCHAR(50) DEFAULT 'General'
-            """)
-            
-            cursor.execute("""
-            IF NOT EXISTS (SELECT * FROM sys.columns WHERE object_id = OBJECT_ID('products') AND name = 'active')
-                ALTER TABLE products ADD active BIT DEFAULT 1
-            """)
-            
-        except Exception as e:
-            print(f"Error adding columns: {e}")
-        
-        # Check if default admin user exists, if not create it
-        cursor.execute("SELECT COUNT(*) FROM users WHERE username = 'admin'")
-        if cursor.fetchone()[0] == 0:
-            password_hash = generate_password_hash('admin123')
-            cursor.execute('INSERT INTO users (username, password, role) VALUES (?, ?, ?)', 
-                         ('admin', password_hash, 'admin'))
-        
-        conn.commit()
+        # Columns may have just been added - refresh the cached schema
+        get_schema().load(conn)
         conn.close()
+        return applied
+
+# Bring the database up to date before the first request this process serves
+@app.before_request
+def ensure_database_schema():
+    ensure_migrated(app)
+    # Orphaned uploads are cleaned up in the background, not by the product routes
+    get_upload_sweeper(app)
 
 # Login required decorator
 def login_required(f):
@@ -347,99 +182,151 @@ def admin_dashboard():
         product_count = cursor.fetchone()[0]
         print(f"Product count: {product_count}")  # Debug
         
-        cursor.execute('SELECT COUNT(*) FROM orders')
-        order_count = cursor.fetchone()[0]
-        
-        # Fix: Use total_price instead of total_amount
-        cursor.execute('SELECT ISNULL(SUM(total_price), 0) FROM orders')
-        total_revenue = cursor.fetchone()[0]
-        
         cursor.execute('SELECT COUNT(*) FROM users')
         user_count = cursor.fetchone()[0]
         
-        # Get today's stats
-        today_start = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        # Fix: Use total_price instead of total_amount
-        cursor.execute('SELECT ISNULL(SUM(total_price), 0) FROM orders WHERE order_date >= ?', (today_start,))
-        today_sales = cursor.fetchone()[0]
-        
-        cursor.execute('SELECT COUNT(*) FROM orders WHERE order_date >= ?', (today_start,))
-        today_orders = cursor.fetchone()[0]
+        # Order and sales figures come from the rollup, not the orders table
+        stats = live_stats(conn)
         
         conn.close()
         
         print("Rendering dashboard template")  # Debug
         return render_template('admin/dashboard.html',
                               product_count=product_count,
-                              order_count=order_count,
-                              total_revenue=total_revenue,
+                              order_count=stats['order_count'],
+                              total_revenue=stats['total_revenue'],
                               user_count=user_count,
-                              today_sales=today_sales,
-                              today_orders=today_orders)
+                              today_sales=stats['today_sales'],
+                              today_orders=stats['today_orders'],
+                              sales_growth=stats['growth'])
     except Exception as e:
         print(f"Dashboard error: {str(e)}")  # Debug
         flash(f'Dashboard error: {str(e)}', 'error')
         return redirect(url_for('login'))
 
+@app.route('/admin/api/live-stats')
+@login_required
+@admin_required
+def api_live_stats():
+    conn = get_db_connection()
+    stats = live_stats(conn)
+    conn.close()
+    return jsonify(stats)
+
+@app.route('/admin/events')
+@login_required
+@admin_required
+def admin_events():
+    # Server-Sent Events stream of new orders for the dashboard and history pages
+    return Response(stream_events(get_broker(), app.config['EVENTS_KEEPALIVE']),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/admin/api/pool-stats')
+@login_required
+@admin_required
+def pool_stats():
+    return jsonify(get_pool().stats())
+
+@app.route('/admin/api/catalog-cache-stats')
+@login_required
+@admin_required
+def catalog_cache_stats():
+    return jsonify(get_catalog_cache().stats())
+
+@app.route('/admin/api/pdf-cache-stats')
+@login_required
+@admin_required
+def pdf_cache_stats():
+    return jsonify(dict(get_pdf_cache().stats(), renderer=get_renderer().stats()))
+
+@app.route('/admin/api/order-cache-stats')
+@login_required
+@admin_required
+def order_cache_stats():
+    return jsonify(get_order_cache().stats())
+
+@app.route('/admin/api/orders')
+@login_required
+@admin_required
+def api_orders():
+    # Filtered, paginated order search - see order_search.py for the parameters
+    try:
+        criteria = OrderFilter.from_args(request.args)
+        conn = get_db_connection()
+        orders, next_cursor = search_orders(conn, criteria, page_size_arg(), request.args.get('after'))
+        conn.close()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'orders': [order_summary(row) for row in orders],
+        'next_cursor': next_cursor
+    })
+
 @app.route('/admin/products')
 @login_required
 @admin_required
 def product_list():
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
         
-        # Check if category column exists
-        cursor.execute("""
-        SELECT COUNT(*) FROM sys.columns 
-        WHERE object_id = OBJECT_ID('products') AND name = 'category'
-        """)
-        category_exists = cursor.fetchone()[0] > 0
-        
-        if category_exists:
-            # Include category in the query
-            cursor.execute('SELECT id, name, quantity, price, image, category FROM products WHERE active = 1 ORDER BY category, name')
-            products = cursor.fetchall()
-            
-            # Convert to list of dictionaries for easier template handling
-            products_list = []
-            for product in products:
-                products_list.append({
-                    'id': product[0],
-                    'name': product[1],
-                    'quantity': product[2],
-                    'price': product[3],
-                    'image': product[4],
-                    'category': product[5] if product[5] else 'General'
-                })
-        else:
-            # Fallback for databases without category column
-            cursor.execute('SELECT id, name, quantity, price, image FROM products WHERE active = 1 ORDER BY name')
-            products = cursor.fetchall()
-            
-            # Convert to list of dictionaries
-            products_list = []
-            for product in products:
-                products_list.append({
-                    'id': product[0],
-                    'name': product[1],
-                    'quantity': product[2],
-                    'price': product[3],
-                    'image': product[4],
-                    'category': 'General'  # Default category
-                })
+        # Only the first page is sent; the browser pages, filters and searches through the APIs below
+        products, next_cursor = fetch_product_page(conn, ProductListing(), app.config['PRODUCTS_PAGE_SIZE'])
+        total_products = count_products(conn)
+        categories = category_counts(conn)
         
         conn.close()
         
-        print(f"Active products found: {len(products_list)}")
+        print(f"Active products found: {total_products}")
         
         return render_template('admin/product_list.html', 
-                             products=products_list, 
-                             has_categories=category_exists)
+                             products=products, 
+                             next_cursor=next_cursor,
+                             total_products=total_products,
+                             category_counts=categories,
+                             page_size=app.config['PRODUCTS_PAGE_SIZE'],
+                             has_categories=get_schema().has_column('products', 'category'))
     except Exception as e:
         print(f"Error in product_list: {str(e)}")
         return f"Error loading products: {str(e)}"
 
+@app.route('/admin/api/products')
+@login_required
+@admin_required
+def api_product_page():
+    # One keyset page of the product list in the chosen order, with the filters applied
+    try:
+        listing = ProductListing.from_args(request.args)
+        page_size = request.args.get('page_size', type=int) or app.config['PRODUCTS_PAGE_SIZE']
+        page_size = max(1, min(page_size, app.config['PRODUCTS_MAX_PAGE_SIZE']))
+        conn = get_db_connection()
+        products, next_cursor = fetch_product_page(conn, listing, page_size, request.args.get('after'))
+        # The count only comes with the first page
+        matching = None if request.args.get('after') else count_products(conn, listing)
+        conn.close()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, 'products': products, 'next_cursor': next_cursor, 'matching': matching})
+
+@app.route('/admin/api/products/search')
+@login_required
+@admin_required
+def api_product_search():
+    # Ranked prefix/fuzzy search over product names and categories
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', 20, type=int), 500))
+    results = search_products(query, limit, request.args.get('category') or None)
+    # The index holds what the POS needs; add the listing fields the admin rows show
+    if results['results']:
+        conn = get_db_connection()
+        details = products_by_id(conn, [product['id'] for product in results['results']])
+        conn.close()
+        results['results'] = [dict(details[product['id']], score=product['score'], highlight=product['highlight'])
+                              for product in results['results'] if product['id'] in details]
+    return jsonify(results)
+
 @app.route('/admin/products/add', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -449,6 +336,12 @@ def add_product():
         quantity = request.form['quantity']
         price = request.form['price']
         image_filename = None
+        staged = None
+        try:
+            stock = parse_stock(request.form.get('stock'))
+        except ValueError:
+            flash('Stock on hand must be a whole number of 0 or more', 'error')
+            return redirect(url_for('add_product'))
         
         # Handle category
         category = request.form.get('category', 'General')
@@ -458,29 +351,43 @@ def add_product():
         if 'image' in request.files:
             image = request.files['image']
             if image.filename:
-                filename = secure_filename(image.filename)
-                image_filename = f"{uuid.uuid4()}_{filename}"
-                image.save(os.path.join(app.config['UPLOAD_FOLDER'], image_filename))
+                # Stored under its content hash - identical uploads share one file
+                staged = stage_upload(image, app.config['UPLOAD_FOLDER'])
+                image_filename = staged.name
         
         conn = get_db_connection()
         cursor = conn.cursor()
         
         # Check if category column exists
-        cursor.execute("""
-        SELECT COUNT(*) FROM sys.columns 
-        WHERE object_id = OBJECT_ID('products') AND name = 'category'
-        """)
-        category_exists = cursor.fetchone()[0] > 0
+        category_exists = get_schema().has_column('products', 'category')
         
         if category_exists:
-            cursor.execute('INSERT INTO products (name, quantity, price, image, category) VALUES (?, ?, ?, ?, ?)',
+            cursor.execute('INSERT INTO products (name, quantity, price, image, category) OUTPUT INSERTED.id VALUES (?, ?, ?, ?, ?)',
                          (name, quantity, price, image_filename, category))
         else:
-            cursor.execute('INSERT INTO products (name, quantity, price, image) VALUES (?, ?, ?, ?)',
+            cursor.execute('INSERT INTO products (name, quantity, price, image) OUTPUT INSERTED.id VALUES (?, ?, ?, ?)',
                          (name, quantity, price, image_filename))
+        product_id = cursor.fetchone()[0]
+        if stock is not None and supports_stock():
+            set_stock(cursor, product_id, stock)
+        
+        if staged:
+            try:
+                acquire_blob(cursor, staged.name, staged.size)
+                staged.place()
+            except Exception:
+                staged.discard()
+                conn.rollback()
+                conn.close()
+                raise
         
         conn.commit()
         conn.close()
+        invalidate_catalog()
+        
+        # Thumbnails are made in the background
+        if image_filename:
+            get_image_processor().submit(product_id, image_filename)
         
         flash('Product added successfully', 'success')
         return redirect(url_for('product_list'))
@@ -495,16 +402,13 @@ def edit_product(id):
     cursor = conn.cursor()
     
     # Check if category column exists
-    cursor.execute("""
-    SELECT COUNT(*) FROM sys.columns 
-    WHERE object_id = OBJECT_ID('products') AND name = 'category'
-    """)
-    category_exists = cursor.fetchone()[0] > 0
+    category_exists = get_schema().has_column('products', 'category')
+    stock_sql = stock_column()
     
     if category_exists:
-        cursor.execute('SELECT id, name, quantity, price, image, category FROM products WHERE id = ?', (id,))
+        cursor.execute(f'SELECT id, name, quantity, price, image, {stock_sql}, category FROM products WHERE id = ?', (id,))
     else:
-        cursor.execute('SELECT id, name, quantity, price, image FROM products WHERE id = ?', (id,))
+        cursor.execute(f'SELECT id, name, quantity, price, image, {stock_sql} FROM products WHERE id = ?', (id,))
     
     product_data = cursor.fetchone()
     
@@ -521,7 +425,8 @@ def edit_product(id):
             'quantity': product_data[2],
             'price': product_data[3],
             'image': product_data[4],
-            'category': product_data[5] if product_data[5] else 'General'
+            'stock': product_data[5],
+            'category': product_data[6] if product_data[6] else 'General'
         }
     else:
         product = {
@@ -530,6 +435,7 @@ def edit_product(id):
             'quantity': product_data[2],
             'price': product_data[3],
             'image': product_data[4],
+            'stock': product_data[5],
             'category': 'General'
         }
     
@@ -538,6 +444,12 @@ def edit_product(id):
         quantity = request.form['quantity']
         price = request.form['price']
         image_filename = product['image']
+        try:
+            stock = parse_stock(request.form.get('stock'))
+        except ValueError:
+            conn.close()
+            flash('Stock on hand must be a whole number of 0 or more', 'error')
+            return redirect(url_for('edit_product', id=id))
         
         # Handle category if it exists
         if category_exists:
@@ -545,19 +457,20 @@ def edit_product(id):
             if category == 'custom':
                 category = request.form.get('customCategory', 'General')
         
+        image_replaced = False
+        staged = None
         if 'image' in request.files:
             image = request.files['image']
             if image.filename:
-                # Delete old image if it exists
-                if image_filename:
-                    try:
-                        os.remove(os.path.join(app.config['UPLOAD_FOLDER'], image_filename))
-                    except:
-                        pass
-                
-                filename = secure_filename(image.filename)
-                image_filename = f"{uuid.uuid4()}_{filename}"
-                image.save(os.path.join(app.config['UPLOAD_FOLDER'], image_filename))
+                staged = stage_upload(image, app.config['UPLOAD_FOLDER'])
+                image_replaced = staged.name != image_filename
+                if not image_replaced:
+                    # Same picture uploaded again
+                    staged.discard()
+                    staged = None
+        old_image = image_filename
+        if staged:
+            image_filename = staged.name
         
         # Update with or without category
         if category_exists:
@@ -566,15 +479,104 @@ def edit_product(id):
         else:
             cursor.execute('UPDATE products SET name = ?, quantity = ?, price = ?, image = ? WHERE id = ?',
                          (name, quantity, price, image_filename, id))
+        if image_replaced and get_schema().has_column('products', 'image_variants'):
+            cursor.execute('UPDATE products SET image_variants = NULL WHERE id = ?', (id,))
+        # Only a changed count is written, so sales made while the form was
+        # open aren't put back on the shelf by an unrelated edit
+        if supports_stock() and stock != parse_stock(request.form.get('stock_original')):
+            set_stock(cursor, id, stock)
+        
+        if staged:
+            # The old file (and its variants) may be shared with other
+            # products - it is only deleted once no product references it
+            try:
+                acquire_blob(cursor, staged.name, staged.size)
+                release_blob(cursor, old_image)
+                staged.place()
+            except Exception:
+                staged.discard()
+                conn.rollback()
+                conn.close()
+                raise
         
         conn.commit()
         conn.close()
+        invalidate_catalog()
+        
+        if image_replaced:
+            get_image_processor().submit(id, image_filename)
         
         flash('Product updated successfully', 'success')
         return redirect(url_for('product_list'))
     
     conn.close()
     return render_template('admin/add_product.html', product=product, edit=True)
+
+def history_order(row):
+    # Calculate proper totals for an orders history row
+    subtotal = row['subtotal_amount'] if row['subtotal_amount'] else 0
+    if subtotal == 0:
+        subtotal = row['total_amount'] if row['total_amount'] else 0
+        if subtotal == 0:
+            subtotal = row['total_price'] if row['total_price'] else 0
+
+    discount_applied = bool(row['discount_applied'])
+    discount_amount = row['discount_amount'] if row['discount_amount'] else 0
+
+    final_total = row['total_amount'] if row['total_amount'] else 0
+    if final_total == 0:
+        final_total = row['total_price'] if row['total_price'] else 0
+    if final_total == 0:
+        final_total = subtotal - discount_amount
+
+    return {
+        'order_id': row['order_id'],
+        'customer_name': row['customer_name'],
+        'customer_email': row['customer_email'] or '',
+        'customer_phone': row['customer_phone'] or '',
+        'subtotal_amount': subtotal,
+        'discount_applied': discount_applied,
+        'discount_amount': discount_amount,
+        'total_amount': final_total,
+        'payment_method': (row['payment_method'] or 'cash').title(),
+        'order_date': row['order_date']
+    }
+
+def page_size_arg():
+    page_size = request.args.get('page_size', type=int) or app.config['ORDERS_PAGE_SIZE']
+    return max(1, min(page_size, app.config['ORDERS_MAX_PAGE_SIZE']))
+
+def fetch_order_page(after=None, page_size=50):
+    """
+    One page of the orders history, newest first, starting after the
+    given cursor. Returns (orders, next_cursor or None).
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    # Fetch one extra row to learn whether another page exists
+    if after:
+        order_date, order_id = decode_order_cursor(after)
+        plan = get_plan('order_page_after')
+        cursor.execute(plan.sql, (page_size + 1, order_date, order_date, order_id))
+    else:
+        plan = get_plan('order_page')
+        cursor.execute(plan.sql, (page_size + 1,))
+    rows = plan.decode_all(cursor.fetchall())
+    conn.close()
+    
+    has_more = len(rows) > page_size
+    orders = []
+    for row in rows[:page_size]:
+        try:
+            orders.append(history_order(row))
+        except Exception as row_error:
+            print(f"❌ Error processing row: {str(row_error)}")
+            continue
+    
+    next_cursor = encode_order_cursor(rows[page_size - 1]) if has_more else None
+    return orders, next_cursor
+
 @app.route('/admin/orders-history')
 @login_required
 @admin_required
@@ -582,156 +584,10 @@ def orders_history():
     try:
         print("📊 Loading orders history page...")
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        orders, next_cursor = fetch_order_page(request.args.get('after'), page_size_arg())
         
-        # Check what columns exist in orders table
-        cursor.execute("""
-        SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS 
-        WHERE TABLE_NAME = 'orders'
-        ORDER BY ORDINAL_POSITION
-        """)
-        order_columns = [row[0] for row in cursor.fetchall()]
-        
-        print(f"📊 Available order columns: {order_columns}")
-        
-        # Build dynamic query based on available columns
-        base_query = "SELECT order_id, customer_name"
-        column_map = {'order_id': 0, 'customer_name': 1}
-        current_index = 2
-        
-        # Add columns based on what exists
-        if 'customer_email' in order_columns:
-            base_query += ", customer_email"
-            column_map['customer_email'] = current_index
-            current_index += 1
-        else:
-            base_query += ", '' as customer_email"
-            column_map['customer_email'] = current_index
-            current_index += 1
-            
-        if 'customer_phone' in order_columns:
-            base_query += ", customer_phone"
-            column_map['customer_phone'] = current_index
-            current_index += 1
-        else:
-            base_query += ", '' as customer_phone"
-            column_map['customer_phone'] = current_index
-            current_index += 1
-            
-        if 'subtotal_amount' in order_columns:
-            base_query += ", subtotal_amount"
-            column_map['subtotal_amount'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 0 as subtotal_amount"
-            column_map['subtotal_amount'] = current_index
-            current_index += 1
-            
-        if 'discount_applied' in order_columns:
-            base_query += ", discount_applied"
-            column_map['discount_applied'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 0 as discount_applied"
-            column_map['discount_applied'] = current_index
-            current_index += 1
-            
-        if 'discount_amount' in order_columns:
-            base_query += ", discount_amount"
-            column_map['discount_amount'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 0 as discount_amount"
-            column_map['discount_amount'] = current_index
-            current_index += 1
-            
-        if 'total_amount' in order_columns:
-            base_query += ", total_amount"
-            column_map['total_amount'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 0 as total_amount"
-            column_map['total_amount'] = current_index
-            current_index += 1
-            
-        if 'total_price' in order_columns:
-            base_query += ", total_price"
-            column_map['total_price'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 0 as total_price"
-            column_map['total_price'] = current_index
-            current_index += 1
-            
-        if 'payment_method' in order_columns:
-            base_query += ", payment_method"
-            column_map['payment_method'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 'cash' as payment_method"
-            column_map['payment_method'] = current_index
-            current_index += 1
-            
-        if 'order_date' in order_columns:
-            base_query += ", order_date"
-            column_map['order_date'] = current_index
-            current_index += 1
-        else:
-            base_query += ", GETDATE() as order_date"
-            column_map['order_date'] = current_index
-            current_index += 1
-        
-        base_query += " FROM orders ORDER BY order_date DESC"
-        
-        print(f"🔍 Executing query: {base_query}")
-        cursor.execute(base_query)
-        orders_data = cursor.fetchall()
-        
-        print(f"📋 Found {len(orders_data)} orders")
-        
-        # Convert to list of dictionaries for easier template access
-        orders = []
-        for row in orders_data:
-            try:
-                # Calculate proper totals
-                subtotal = row[column_map['subtotal_amount']] if row[column_map['subtotal_amount']] else 0
-                if subtotal == 0:
-                    subtotal = row[column_map['total_amount']] if row[column_map['total_amount']] else 0
-                    if subtotal == 0:
-                        subtotal = row[column_map['total_price']] if row[column_map['total_price']] else 0
-
-                discount_applied = bool(row[column_map['discount_applied']])
-                discount_amount = row[column_map['discount_amount']] if row[column_map['discount_amount']] else 0
-
-                final_total = row[column_map['total_amount']] if row[column_map['total_amount']] else 0
-                if final_total == 0:
-                    final_total = row[column_map['total_price']] if row[column_map['total_price']] else 0
-                if final_total == 0:
-                    final_total = subtotal - discount_amount
-
-                order = {
-                    'order_id': row[column_map['order_id']],
-                    'customer_name': row[column_map['customer_name']],
-                    'customer_email': row[column_map['customer_email']] or '',
-                    'customer_phone': row[column_map['customer_phone']] or '',
-                    'subtotal_amount': subtotal,
-                    'discount_applied': discount_applied,
-                    'discount_amount': discount_amount,
-                    'total_amount': final_total,
-                    'payment_method': (row[column_map['payment_method']] or 'cash').title(),
-                    'order_date': row[column_map['order_date']]
-                }
-                orders.append(order)
-                
-            except Exception as row_error:
-                print(f"❌ Error processing row: {str(row_error)}")
-                continue
-        
-        conn.close()
-        
-        print(f"✅ Successfully processed {len(orders)} orders")
-        return render_template('admin/orders_history.html', orders=orders)
+        print(f"✅ Loaded {len(orders)} orders")
+        return render_template('admin/orders_history.html', orders=orders, next_cursor=next_cursor)
         
     except Exception as e:
         print(f"❌ Error in orders history: {str(e)}")
@@ -757,196 +613,34 @@ def orders_history():
         </html>
         """
 
+@app.route('/admin/orders-history/page')
+@login_required
+@admin_required
+def orders_history_page():
+    # Next batch of history rows for "load more" / infinite scroll
+    try:
+        orders, next_cursor = fetch_order_page(request.args.get('after'), page_size_arg())
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'html': render_template('admin/_order_rows.html', orders=orders),
+        'count': len(orders),
+        'next_cursor': next_cursor
+    })
+
 @app.route('/admin/order-details/<order_id>')
 @admin_required
+@immutable_order_page
 def order_details(order_id):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get order details with same logic as invoice
-        cursor.execute("""
-        SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS 
-        WHERE TABLE_NAME = 'orders'
-        """)
-        order_columns = [row[0] for row in cursor.fetchall()]
-        
-        # Build query based on available columns (same as invoice logic)
-        base_query = "SELECT order_id, customer_name"
-        column_map = {'order_id': 0, 'customer_name': 1}
-        current_index = 2
-        
-        if 'customer_email' in order_columns:
-            base_query += ", customer_email"
-            column_map['customer_email'] = current_index
-            current_index += 1
-        else:
-            base_query += ", '' as customer_email"
-            column_map['customer_email'] = current_index
-            current_index += 1
-            
-        if 'customer_phone' in order_columns:
-            base_query += ", customer_phone"
-            column_map['customer_phone'] = current_index
-            current_index += 1
-        else:
-            base_query += ", '' as customer_phone"
-            column_map['customer_phone'] = current_index
-            current_index += 1
-            
-        if 'subtotal_amount' in order_columns:
-            base_query += ", subtotal_amount"
-            column_map['subtotal_amount'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 0 as subtotal_amount"
-            column_map['subtotal_amount'] = current_index
-            current_index += 1
-            
-        if 'discount_applied' in order_columns:
-            base_query += ", discount_applied"
-            column_map['discount_applied'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 0 as discount_applied"
-            column_map['discount_applied'] = current_index
-            current_index += 1
-            
-        if 'discount_amount' in order_columns:
-            base_query += ", discount_amount"
-            column_map['discount_amount'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 0 as discount_amount"
-            column_map['discount_amount'] = current_index
-            current_index += 1
-            
-        if 'total_amount' in order_columns:
-            base_query += ", total_amount"
-            column_map['total_amount'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 0 as total_amount"
-            column_map['total_amount'] = current_index
-            current_index += 1
-            
-        if 'total_price' in order_columns:
-            base_query += ", total_price"
-            column_map['total_price'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 0 as total_price"
-            column_map['total_price'] = current_index
-            current_index += 1
-            
-        if 'payment_method' in order_columns:
-            base_query += ", payment_method"
-            column_map['payment_method'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 'cash' as payment_method"
-            column_map['payment_method'] = current_index
-            current_index += 1
-            
-        if 'order_date' in order_columns:
-            base_query += ", order_date"
-            column_map['order_date'] = current_index
-            current_index += 1
-        else:
-            base_query += ", GETDATE() as order_date"
-            column_map['order_date'] = current_index
-            current_index += 1
-        
-        base_query += " FROM orders WHERE order_id = ?"
-        
-        cursor.execute(base_query, (order_id,))
-        order_row = cursor.fetchone()
-        
-        if not order_row:
+        # Header, lines and totals from the shared order service
+        loaded = get_order(order_id)
+        if loaded is None:
             flash('Order not found', 'error')
             return redirect(url_for('orders_history'))
-        
-        # Get order items with better column handling
-        cursor.execute("""
-        SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS 
-        WHERE TABLE_NAME = 'order_items'
-        """)
-        item_columns = [row[0] for row in cursor.fetchall()]
-        
-        # Build items query
-        items_query = "SELECT "
-        
-        if 'product_name' in item_columns:
-            items_query += "product_name"
-        else:
-            items_query += "'Unknown Product' as product_name"
-            
-        items_query += ", quantity"
-        
-        if 'unit_price' in item_columns:
-            items_query += ", unit_price"
-        elif 'price' in item_columns:
-            items_query += ", price as unit_price"
-        else:
-            items_query += ", 0 as unit_price"
-            
-        if 'total_price' in item_columns:
-            items_query += ", total_price"
-        elif 'price' in item_columns:
-            items_query += ", price as total_price"
-        else:
-            items_query += ", 0 as total_price"
-        
-        items_query += " FROM order_items WHERE order_id = ?"
-        
-        cursor.execute(items_query, (order_id,))
-        items_data = cursor.fetchall()
-        conn.close()
-        
-        # Process order data using column map
-        subtotal = order_row[column_map['subtotal_amount']] if order_row[column_map['subtotal_amount']] else 0
-        if subtotal == 0:
-            subtotal = order_row[column_map['total_amount']] if order_row[column_map['total_amount']] else 0
-            if subtotal == 0:
-                subtotal = order_row[column_map['total_price']] if order_row[column_map['total_price']] else 0
-
-        discount_applied = order_row[column_map['discount_applied']] if order_row[column_map['discount_applied']] else False
-        discount_amount = order_row[column_map['discount_amount']] if order_row[column_map['discount_amount']] else 0
-
-        final_total = order_row[column_map['total_amount']] if order_row[column_map['total_amount']] else 0
-        if final_total == 0:
-            final_total = order_row[column_map['total_price']] if order_row[column_map['total_price']] else 0
-        if final_total == 0:
-            final_total = subtotal - discount_amount
-
-        # Create order object
-        order = {
-            'order_id': order_row[column_map['order_id']],
-            'customer_name': order_row[column_map['customer_name']],
-            'customer_email': order_row[column_map['customer_email']] or '',
-            'customer_phone': order_row[column_map['customer_phone']] or '',
-            'subtotal_amount': subtotal,
-            'discount_applied': discount_applied,
-            'discount_amount': discount_amount,
-            'total_amount': final_total,
-            'payment_method': (order_row[column_map['payment_method']] or 'cash').title(),
-            'order_date': order_row[column_map['order_date']]
-        }
-        
-        # Process items data
-        items = []
-        for item in items_data:
-            product_name = item[0] or 'Unknown Product'
-            quantity = item[1]
-            unit_price = item[2] if item[2] else 0
-            total_price = item[3] if item[3] else 0
-            
-            items.append({
-                'product_name': product_name,
-                'quantity': quantity,
-                'unit_price': unit_price,
-                'total_price': total_price
-            })
+        order, items = loaded
         
         return render_template('admin/order_details.html', order=order, items=items)
         
@@ -959,10 +653,6 @@ def order_details(order_id):
 def manager_redirect():
     return redirect(url_for('place_order'))
 
-def generate_order_id():
-    # Generates a unique order ID using UUID
-    return str(uuid.uuid4())
-
 @app.route('/manager/place-order', methods=['GET', 'POST'])
 @login_required
 def place_order():
@@ -1000,107 +690,56 @@ def place_order():
             
             total_amount = calculated_subtotal - discount_amount
             
-            # Generate order ID
-            order_id = f"ORD-{datetime.datetime.now().strftime('%Y%m%d')}-{random.randint(1000, 9999)}"
-            
-            print(f"DEBUG: Order ID: {order_id}, Total: ${total_amount}")
-            
-            # Get database connection
+            # Numbered from this worker's block of the order sequence
             conn = get_db_connection()
-            cursor = conn.cursor()
+            order_date = datetime.datetime.now()
+            order_id = next_order_id(conn, order_date)
             
-            # Check which columns exist in orders table
-            cursor.execute("""
-            SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS 
-            WHERE TABLE_NAME = 'orders'
-            """)
-            order_columns = [row[0] for row in cursor.fetchall()]
-            print(f"DEBUG: Available order columns: {order_columns}")
-            
-            # Build INSERT query based on available columns
-            if 'total_amount' in order_columns and 'total_price' in order_columns:
-                # Both columns exist - use both for compatibility
-                insert_query = """
-                    INSERT INTO orders (order_id, customer_name, customer_email, customer_phone, 
-                                      subtotal_amount, discount_applied, discount_amount, total_amount, 
-                                      total_price, payment_method, order_date, created_by)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """
-                insert_values = (order_id, customer_name, customer_email, customer_phone, 
-                               calculated_subtotal, discount_applied, discount_amount, total_amount, 
-                               total_amount, payment_method, datetime.datetime.now(), session['user_id'])
-            
-            elif 'total_price' in order_columns:
-                # Only total_price exists
-                insert_query = """
-                    INSERT INTO orders (order_id, customer_name, customer_email, customer_phone, 
-                                      subtotal_amount, discount_applied, discount_amount, total_price, 
-                                      payment_method, order_date, created_by)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """
-                insert_values = (order_id, customer_name, customer_email, customer_phone, 
-                               calculated_subtotal, discount_applied, discount_amount, total_amount, 
-                               payment_method, datetime.datetime.now(), session['user_id'])
-            
-            elif 'total_amount' in order_columns:
-                # Only total_amount exists
-                insert_query = """
-                    INSERT INTO orders (order_id, customer_name, customer_email, customer_phone, 
-                                      subtotal_amount, discount_applied, discount_amount, total_amount, 
-                                      payment_method, order_date, created_by)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """
-                insert_values = (order_id, customer_name, customer_email, customer_phone, 
-                               calculated_subtotal, discount_applied, discount_amount, total_amount, 
-                               payment_method, datetime.datetime.now(), session['user_id'])
-            
-            else:
-                # Fallback - minimal required columns
-                insert_query = """
-                    INSERT INTO orders (order_id, customer_name, order_date, created_by)
-                    VALUES (?, ?, ?, ?)
-                """
-                insert_values = (order_id, customer_name, datetime.datetime.now(), session['user_id'])
-            
-            print(f"DEBUG: Executing query: {insert_query}")
-            cursor.execute(insert_query, insert_values)
+            print(f"DEBUG: Order ID: {order_id}, Total: ${total_amount}")
             
-            # Insert order items - check columns here too
-            cursor.execute("""
-            SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS 
-            WHERE TABLE_NAME = 'order_items'
-            """)
-            item_columns = [row[0] for row in cursor.fetchall()]
-            print(f"DEBUG: Available order_items columns: {item_columns}")
+            order = {
+                'order_id': order_id,
+                'customer_name': customer_name,
+                'customer_email': customer_email,
+                'customer_phone': customer_phone,
+                'subtotal_amount': calculated_subtotal,
+                'discount_applied': discount_applied,
+                'discount_amount': discount_amount,
+                'total_amount': total_amount,
+                'total_price': total_amount,
+                'payment_method': payment_method,
+                'order_date': order_date,
+                'created_by': session['user_id']
+            }
+            
+            # Stock comes off the shelf in the same transaction as the order;
+            # if any line is short nothing is sold
+            try:
+                reserve_stock(conn, order_items)
+            except InsufficientStock as shortage:
+                conn.rollback()
+                conn.close()
+                print(f"DEBUG: Order rejected - {shortage}")
+                return jsonify({'success': False, 'message': str(shortage), 'shortfalls': shortage.shortfalls})
+            # Header and all lines go to the database as one batch
+            write_order(conn, order, order_lines(order_id, order_items))
+            conn.commit()
             
-            for item in order_items:
-                if 'price' in item_columns and 'total_price' in item_columns and 'unit_price' in item_columns:
-                    # All price columns exist
-                    cursor.execute("""
-                        INSERT INTO order_items (order_id, product_id, product_name, quantity, unit_price, total_price, price)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """, (order_id, item['id'], item['name'], item['quantity'], 
-                          item['price'], item['price'] * item['quantity'], item['price']))
-                
-                elif 'price' in item_columns and 'total_price' in item_columns:
-                    # price and total_price exist
-                    cursor.execute("""
-                        INSERT INTO order_items (order_id, product_id, product_name, quantity, price, total_price)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    """, (order_id, item['id'], item['name'], item['quantity'], 
-                          item['price'], item['price'] * item['quantity']))
-                
-                else:
-                    # Minimal columns
-                    cursor.execute("""
-                        INSERT INTO order_items (order_id, product_id, quantity)
-                        VALUES (?, ?, ?)
-                    """, (order_id, item['id'], item['quantity']))
+            print(f"DEBUG: Order {order_id} saved successfully")
             
-            conn.commit()
+            # Push the new order to open admin pages
+            try:
+                get_broker().publish('order', {
+                    'order': order_summary(order),
+                    'stats': live_stats(conn),
+                    'row_html': render_template('admin/_order_rows.html', orders=[history_order(order)])
+                })
+            except Exception as publish_error:
+                print(f"⚠️ Could not publish order event: {publish_error}")
             conn.close()
             
-            print(f"DEBUG: Order {order_id} saved successfully")
+            # Render the invoice PDF in the background so the first download is a cache hit
+            warm_invoice(order_id)
             
             return jsonify({
                 'success': True, 
@@ -1115,61 +754,10 @@ def place_order():
             traceback.print_exc()
             return jsonify({'success': False, 'message': f'Error placing order: {str(e)}'})
     
-    # GET request - show the form (existing code remains the same)
+    # GET request - show the form
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get products with better image handling
-        cursor.execute("""
-        SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS 
-        WHERE TABLE_NAME = 'products'
-        """)
-        columns = [row[0] for row in cursor.fetchall()]
-        
-        # Build query to get the best available image column
-        base_query = "SELECT id, name, price"
-        
-        if 'image_filename' in columns:
-            base_query += ", COALESCE(image_filename, image, '') as image_path"
-        elif 'image' in columns:
-            base_query += ", COALESCE(image, '') as image_path"
-        else:
-            base_query += ", '' as image_path"
-        
-        if 'category' in columns:
-            base_query += ", COALESCE(category, 'General') as category"
-        else:
-            base_query += ", 'General' as category"
-        
-        base_query += " FROM products"
-        
-        if 'active' in columns:
-            base_query += " WHERE COALESCE(active, 1) = 1"
-        
-        base_query += " ORDER BY name"
-        
-        cursor.execute(base_query)
-        products_data = cursor.fetchall()
-        products = []
-        
-        for row in products_data:
-            # Clean up image path
-            image_path = row[3] if len(row) > 3 and row[3] else ''
-            
-            # Remove any path separators and get just the filename
-            if image_path:
-                image_path = os.path.basename(image_path)
-            
-            products.append({
-                'id': row[0],
-                'name': row[1],
-                'price': float(row[2]),
-                'image': image_path,
-                'category': row[4] if len(row) > 4 else 'General'
-            })
-        
-        conn.close()
+        # Served from the catalog cache; the database is only read on a miss
+        products = get_catalog()
         
         return render_template('manager/place_order.html', products=products)
         
@@ -1189,154 +777,46 @@ def place_order():
         </html>
         """
 
+@app.route('/api/catalog')
+@login_required
+def api_catalog():
+    # Compact JSON catalog for POS terminals; ?since=<version> returns only the changes
+    since = request.args.get('since')
+    try:
+        body, etag = catalog_response(int(since) if since else None)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    return serve_asset(filename)
+
+@app.route('/uploads/<path:filename>')
+def uploaded_file(filename):
+    response = send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    # Content-addressed files (and variants made from them) never change
+    if is_blob_name(filename.split('.', 1)[0]):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
 @app.route('/order/invoice/<order_id>')
 @login_required
+@immutable_order_page
 def order_invoice(order_id):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         print(f"🧾 Loading invoice for order: {order_id}")
         
-        # Check what columns exist in orders table
-        cursor.execute("""
-        SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS 
-        WHERE TABLE_NAME = 'orders'
-        """)
-        order_columns = [row[0] for row in cursor.fetchall()]
-        print(f"📊 Available order columns: {order_columns}")
-        
-        # Build query based on available columns
-        base_query = "SELECT order_id, customer_name"
-        
-        if 'customer_email' in order_columns:
-            base_query += ", customer_email"
-        else:
-            base_query += ", '' as customer_email"
-            
-        if 'customer_phone' in order_columns:
-            base_query += ", customer_phone"
-        else:
-            base_query += ", '' as customer_phone"
-            
-        if 'subtotal_amount' in order_columns:
-            base_query += ", subtotal_amount"
-        else:
-            base_query += ", 0 as subtotal_amount"
-            
-        if 'discount_applied' in order_columns:
-            base_query += ", discount_applied"
-        else:
-            base_query += ", 0 as discount_applied"
-            
-        if 'discount_amount' in order_columns:
-            base_query += ", discount_amount"
-        else:
-            base_query += ", 0 as discount_amount"
-            
-        if 'total_amount' in order_columns:
-            base_query += ", total_amount"
-        else:
-            base_query += ", 0 as total_amount"
-            
-        if 'total_price' in order_columns:
-            base_query += ", total_price"
-        else:
-            base_query += ", 0 as total_price"
-            
-        if 'payment_method' in order_columns:
-            base_query += ", payment_method"
-        else:
-            base_query += ", 'cash' as payment_method"
-            
-        if 'order_date' in order_columns:
-            base_query += ", order_date"
-        else:
-            base_query += ", GETDATE() as order_date"
-            
-        if 'created_by' in order_columns:
-            base_query += ", created_by"
-        else:
-            base_query += ", 1 as created_by"
-        
-        base_query += " FROM orders WHERE order_id = ?"
-        
-        print(f"🔍 Executing query: {base_query}")
-        cursor.execute(base_query, (order_id,))
-        
-        order_row = cursor.fetchone()
-        if not order_row:
+        loaded = get_order(order_id)
+        if loaded is None:
             print(f"❌ Order {order_id} not found")
             flash('Order not found', 'error')
             return redirect(url_for('place_order'))
-        
-        print(f"✅ Order found: {order_row[0]} for {order_row[1]}")
-        
-        # Convert to dictionary with safe indexing - THIS IS THE MISSING PART!
-        order_dict = {
-            'order_id': order_row[0],
-            'customer_name': order_row[1],
-            'customer_email': order_row[2] if len(order_row) > 2 else '',
-            'customer_phone': order_row[3] if len(order_row) > 3 else '',
-            'subtotal_amount': order_row[4] if len(order_row) > 4 else 0,
-            'discount_applied': order_row[5] if len(order_row) > 5 else False,
-            'discount_amount': order_row[6] if len(order_row) > 6 else 0,
-            'total_amount': order_row[7] if len(order_row) > 7 else (order_row[8] if len(order_row) > 8 else 0),
-            'total_price': order_row[8] if len(order_row) > 8 else 0,
-            'payment_method': order_row[9] if len(order_row) > 9 else 'cash',
-            'order_date': order_row[10] if len(order_row) > 10 else None,
-            'created_by': order_row[11] if len(order_row) > 11 else 1
-        }
-        
-        # Get order items
-        cursor.execute("""
-        SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS 
-        WHERE TABLE_NAME = 'order_items'
-        """)
-        item_columns = [row[0] for row in cursor.fetchall()]
-        print(f"📦 Available item columns: {item_columns}")
-        
-        # Build items query
-        items_query = "SELECT "
-        
-        if 'product_id' in item_columns:
-            items_query += "product_id"
-        else:
-            items_query += "0 as product_id"
-            
-        if 'product_name' in item_columns:
-            items_query += ", product_name"
-        else:
-            items_query += ", 'Unknown Product' as product_name"
-            
-        items_query += ", quantity"
-        
-        if 'unit_price' in item_columns:
-            items_query += ", unit_price"
-        elif 'price' in item_columns:
-            items_query += ", price as unit_price"
-        else:
-            items_query += ", 0 as unit_price"
-            
-        if 'total_price' in item_columns:
-            items_query += ", total_price"
-        elif 'price' in item_columns:
-            items_query += ", price as total_price"
-        else:
-            items_query += ", 0 as total_price"
-            
-        if 'price' in item_columns:
-            items_query += ", price"
-        else:
-            items_query += ", 0 as price"
-        
-        items_query += " FROM order_items WHERE order_id = ?"
-        
-        print(f"🔍 Executing items query: {items_query}")
-        cursor.execute(items_query, (order_id,))
-        
-        items_data = cursor.fetchall()
-        conn.close()
+        order_dict, items_data = loaded
         
         print(f"📋 Order items: {len(items_data)}")
         print(f"🎯 Rendering invoice template with order: {order_dict['order_id']}")
@@ -1362,358 +842,35 @@ def order_invoice(order_id):
             <p><a href="/admin/dashboard">📊 Dashboard</a></p>
         </body>
         </html>
-        """
+        """, 500
 @app.route('/download/invoice/<order_id>')
 @login_required
 def download_invoice(order_id):
     try:
         print(f"🔍 Generating PDF for order: {order_id}")
         
-        # Get order data using the same logic as invoice page
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check what columns exist in orders table
-        cursor.execute("""
-        SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS 
-        WHERE TABLE_NAME = 'orders'
-        """)
-        order_columns = [row[0] for row in cursor.fetchall()]
-        print(f"📊 Available order columns: {order_columns}")
-        
-        # Build query based on available columns
-        base_query = "SELECT order_id, customer_name"
-        column_map = {'order_id': 0, 'customer_name': 1}
-        current_index = 2
-        
-        if 'customer_email' in order_columns:
-            base_query += ", customer_email"
-            column_map['customer_email'] = current_index
-            current_index += 1
-        else:
-            base_query += ", '' as customer_email"
-            column_map['customer_email'] = current_index
-            current_index += 1
-            
-        if 'customer_phone' in order_columns:
-            base_query += ", customer_phone"
-            column_map['customer_phone'] = current_index
-            current_index += 1
-        else:
-            base_query += ", '' as customer_phone"
-            column_map['customer_phone'] = current_index
-            current_index += 1
-            
-        if 'subtotal_amount' in order_columns:
-            base_query += ", subtotal_amount"
-            column_map['subtotal_amount'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 0 as subtotal_amount"
-            column_map['subtotal_amount'] = current_index
-            current_index += 1
-            
-        if 'discount_applied' in order_columns:
-            base_query += ", discount_applied"
-            column_map['discount_applied'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 0 as discount_applied"
-            column_map['discount_applied'] = current_index
-            current_index += 1
-            
-        if 'discount_amount' in order_columns:
-            base_query += ", discount_amount"
-            column_map['discount_amount'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 0 as discount_amount"
-            column_map['discount_amount'] = current_index
-            current_index += 1
-            
-        if 'total_amount' in order_columns:
-            base_query += ", total_amount"
-            column_map['total_amount'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 0 as total_amount"
-            column_map['total_amount'] = current_index
-            current_index += 1
-            
-        if 'total_price' in order_columns:
-            base_query += ", total_price"
-            column_map['total_price'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 0 as total_price"
-            column_map['total_price'] = current_index
-            current_index += 1
-            
-        if 'payment_method' in order_columns:
-            base_query += ", payment_method"
-            column_map['payment_method'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 'cash' as payment_method"
-            column_map['payment_method'] = current_index
-            current_index += 1
-            
-        if 'order_date' in order_columns:
-            base_query += ", order_date"
-            column_map['order_date'] = current_index
-            current_index += 1
-        else:
-            base_query += ", GETDATE() as order_date"
-            column_map['order_date'] = current_index
-            current_index += 1
-        
-        base_query += " FROM orders WHERE order_id = ?"
-        
-        print(f"🔍 Executing query: {base_query}")
-        cursor.execute(base_query, (order_id,))
-        order_row = cursor.fetchone()
-        
-        if not order_row:
+        # Rendered once per order - later downloads come straight from the disk cache
+        path = get_pdf_cache().get_or_render(order_id)
+        if path is None:
             print(f"❌ Order {order_id} not found for PDF")
             flash('Order not found', 'error')
             return redirect(url_for('place_order'))
         
-        print(f"✅ Order found for PDF: {order_row[0]}")
-        
-        # Get order items with same logic
-        cursor.execute("""
-        SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS 
-        WHERE TABLE_NAME = 'order_items'
-        """)
-        item_columns = [row[0] for row in cursor.fetchall()]
-        
-        # Build items query
-        items_query = "SELECT "
-        
-        if 'product_name' in item_columns:
-            items_query += "product_name"
-        else:
-            items_query += "'Unknown Product' as product_name"
-            
-        items_query += ", quantity"
-        
-        if 'unit_price' in item_columns:
-            items_query += ", unit_price"
-        elif 'price' in item_columns:
-            items_query += ", price as unit_price"
-        else:
-            items_query += ", 0 as unit_price"
-            
-        if 'total_price' in item_columns:
-            items_query += ", total_price"
-        elif 'price' in item_columns:
-            items_query += ", price as total_price"
-        else:
-            items_query += ", 0 as total_price"
-        
-        items_query += " FROM order_items WHERE order_id = ?"
-        
-        cursor.execute(items_query, (order_id,))
-        items_data = cursor.fetchall()
-        conn.close()
-        
-        print(f"📦 Found {len(items_data)} items for PDF")
-        
-        # Calculate totals using column map
-        subtotal = order_row[column_map['subtotal_amount']] if order_row[column_map['subtotal_amount']] else 0
-        if subtotal == 0:
-            # Fallback to total_amount or total_price
-            subtotal = order_row[column_map['total_amount']] if order_row[column_map['total_amount']] else 0
-            if subtotal == 0:
-                subtotal = order_row[column_map['total_price']] if order_row[column_map['total_price']] else 0
-
-        discount_applied = order_row[column_map['discount_applied']] if order_row[column_map['discount_applied']] else False
-        discount_amount = order_row[column_map['discount_amount']] if order_row[column_map['discount_amount']] else 0
-
-        # Final total calculation
-        final_total = order_row[column_map['total_amount']] if order_row[column_map['total_amount']] else 0
-        if final_total == 0:
-            final_total = order_row[column_map['total_price']] if order_row[column_map['total_price']] else 0
-        if final_total == 0:
-            final_total = subtotal - discount_amount
-
-        print(f"💰 PDF Totals - Subtotal: ${subtotal:.2f}, Discount: ${discount_amount:.2f}, Final: ${final_total:.2f}")
-        
-        # Create PDF
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
-        styles = getSampleStyleSheet()
-        
-        # Custom styles
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            textColor=colors.darkblue,
-            alignment=1,  # Center alignment
-            spaceAfter=30
-        )
-        
-        subtitle_style = ParagraphStyle(
-            'CustomSubtitle',
-            parent=styles['Heading2'],
-            fontSize=16,
-            textColor=colors.blue,
-            alignment=1,  # Center alignment
-            spaceAfter=20
-        )
-        
-        elements = []
-        
-        # Title
-        elements.append(Paragraph("🍪 Sweet Delights Bakery", title_style))
-        elements.append(Paragraph("INVOICE", subtitle_style))
-        elements.append(Spacer(1, 20))
-        
-        # Invoice info table - Use column map for safe access
-        invoice_info_data = [
-            ['Invoice #:', order_row[column_map['order_id']]],
-            ['Customer:', order_row[column_map['customer_name']]],
-            ['Date:', order_row[column_map['order_date']].strftime('%B %d, %Y at %I:%M %p') if order_row[column_map['order_date']] else 'N/A'],
-            ['Payment:', (order_row[column_map['payment_method']] or 'Cash').title()]
-        ]
-        
-        invoice_table = Table(invoice_info_data, colWidths=[1.5*inch, 4*inch])
-        invoice_table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 11),
-            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-            ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ]))
-        
-        elements.append(invoice_table)
-        elements.append(Spacer(1, 30))
-        
-        # Items table header
-        items_header = [['Product', 'Qty', 'Unit Price', 'Total']]
-        
-        # Items data
-        items_table_data = items_header.copy()
-        
-        for item in items_data:
-            product_name = item[0] or 'Unknown Product'
-            quantity = item[1]
-            unit_price = item[2] if item[2] else 0
-            total_price = item[3] if item[3] else 0
-            
-            items_table_data.append([
-                product_name,
-                str(quantity),
-                f"${unit_price:.2f}",
-                f"${total_price:.2f}"
-            ])
-        
-        # Create items table
-        items_table = Table(items_table_data, colWidths=[3.5*inch, 0.8*inch, 1*inch, 1*inch])
-        items_table.setStyle(TableStyle([
-            # Header styling
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            
-            # Body styling
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 10),
-            ('ALIGN', (0, 1), (0, -1), 'LEFT'),  # Product name left aligned
-            ('ALIGN', (1, 1), (-1, -1), 'CENTER'),  # Other columns centered
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ]))
-        
-        elements.append(items_table)
-        elements.append(Spacer(1, 30))
-        
-        # === ADD TOTAL AMOUNTS SECTION HERE ===
-        # Total section
-        total_data = [['Subtotal:', f"${subtotal:.2f}"]]
-        
-        if discount_applied and discount_amount > 0:
-            total_data.append(['Discount (4%):', f"-${discount_amount:.2f}"])
-        
-        total_data.append(['TOTAL AMOUNT:', f"${final_total:.2f}"])
-        
-        total_table = Table(total_data, colWidths=[2.5*inch, 1.5*inch])
-        total_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
-            ('FONTNAME', (0, 0), (-1, -2), 'Helvetica'),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -2), 11),
-            ('FONTSIZE', (0, -1), (-1, -1), 14),
-            ('TEXTCOLOR', (0, -1), (-1, -1), colors.darkblue),
-            ('LINEABOVE', (0, -1), (-1, -1), 2, colors.black),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-            # Add background color for discount row if applicable
-            ('BACKGROUND', (0, 1), (-1, 1), colors.lightgreen) if discount_applied and discount_amount > 0 and len(total_data) > 2 else ('BACKGROUND', (0, 0), (0, 0), colors.white),
-        ]))
-        
-        # Right align the total table
-        total_table_container = Table([[total_table]], colWidths=[6.5*inch])
-        total_table_container.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
-        ]))
-        
-        elements.append(total_table_container)
-        elements.append(Spacer(1, 30))
-        
-        # Discount message if applicable
-        if discount_applied and discount_amount > 0:
-            discount_msg_style = ParagraphStyle(
-                'DiscountMessage',
-                parent=styles['Normal'],
-                fontSize=12,
-                textColor=colors.green,
-                alignment=1,
-                spaceAfter=20
-            )
-            
-            discount_msg = Paragraph(
-                f"🎉 <b>Congratulations!</b> You saved ${discount_amount:.2f} with our 4% discount on orders over $150!",
-                discount_msg_style
-            )
-            elements.append(discount_msg)
-            elements.append(Spacer(1, 20))
-        
-        # Thank you message
-        thank_you_style = ParagraphStyle(
-            'ThankYou',
-            parent=styles['Normal'],
-            fontSize=14,
-            alignment=1,  # Center alignment
-            textColor=colors.darkblue,
-            spaceAfter=10
-        )
-        
-        elements.append(Paragraph("Thank you for your business!", thank_you_style))
-        elements.append(Paragraph("Sweet Delights Bakery - Where every bite is a delight!", styles['Normal']))
-        
-        # Build PDF
-        print("📄 Building PDF document...")
-        doc.build(elements)
-        buffer.seek(0)
-        
         # Generate filename with timestamp
         timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"invoice_{order_id}_{timestamp}.pdf"
         
-        print(f"✅ PDF generated successfully: {filename}")
+        print(f"✅ PDF ready: {filename}")
         
-        return send_file(
-            buffer,
+        response = send_file(
+            path,
             mimetype='application/pdf',
             as_attachment=True,
-            download_name=filename
+            download_name=filename,
+            conditional=True
         )
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
         
     except ImportError as ie:
         print(f"📦 Missing package: {str(ie)}")
@@ -1735,21 +892,21 @@ def delete_product(id):
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Get product image before deletion
+        # Release the product's image; the file is purged once no product uses it
         cursor.execute('SELECT image FROM products WHERE id = ?', (id,))
         product = cursor.fetchone()
         
         if product and product[0]:
-            # Delete image file
-            try:
-                os.remove(os.path.join(app.config['UPLOAD_FOLDER'], product[0]))
-            except:
-                pass
+            release_blob(cursor, product[0])
         
         # Soft delete - set active to 0 instead of actual deletion
-        cursor.execute('UPDATE products SET active = 0 WHERE id = ?', (id,))
+        if get_schema().has_column('products', 'image_variants'):
+            cursor.execute('UPDATE products SET active = 0, image = NULL, image_variants = NULL WHERE id = ?', (id,))
+        else:
+            cursor.execute('UPDATE products SET active = 0, image = NULL WHERE id = ?', (id,))
         conn.commit()
         conn.close()
+        invalidate_catalog()
         
         flash('Product deleted successfully', 'success')
         return redirect(url_for('product_list'))
@@ -1770,101 +927,22 @@ def download_all_orders():
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Check what columns exist in orders table first
-        cursor.execute("""
-        SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS 
-        WHERE TABLE_NAME = 'orders'
-        ORDER BY ORDINAL_POSITION
-        """)
-        order_columns = [row[0] for row in cursor.fetchall()]
-        print(f"📊 Available order columns: {order_columns}")
-        
-        # Build dynamic query based on available columns (same logic as orders_history)
-        base_query = "SELECT o.order_id, o.customer_name"
-        column_map = {'order_id': 0, 'customer_name': 1}
-        current_index = 2
-        
-        # Add total amount column
-        if 'total_amount' in order_columns:
-            base_query += ", o.total_amount"
-            column_map['total_amount'] = current_index
-            current_index += 1
-        elif 'total_price' in order_columns:
-            base_query += ", o.total_price as total_amount"
-            column_map['total_amount'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 0 as total_amount"
-            column_map['total_amount'] = current_index
-            current_index += 1
-            
-        # Add order date
-        if 'order_date' in order_columns:
-            base_query += ", o.order_date"
-            column_map['order_date'] = current_index
-            current_index += 1
-        else:
-            base_query += ", GETDATE() as order_date"
-            column_map['order_date'] = current_index
-            current_index += 1
-            
-        # Add discount columns
-        if 'discount_applied' in order_columns:
-            base_query += ", o.discount_applied"
-            column_map['discount_applied'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 0 as discount_applied"
-            column_map['discount_applied'] = current_index
-            current_index += 1
-            
-        if 'discount_amount' in order_columns:
-            base_query += ", o.discount_amount"
-            column_map['discount_amount'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 0 as discount_amount"
-            column_map['discount_amount'] = current_index
-            current_index += 1
-        
-        # Add payment method
-        if 'payment_method' in order_columns:
-            base_query += ", o.payment_method"
-            column_map['payment_method'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 'Cash' as payment_method"
-            column_map['payment_method'] = current_index
-            current_index += 1
-        
-        # Complete the query with JOIN to get order items count
-        base_query += """, 
-                         COUNT(oi.id) as item_count,
-                         SUM(oi.quantity) as total_quantity
-                         FROM orders o
-                         LEFT JOIN order_items oi ON o.order_id = oi.order_id
-                         GROUP BY o.order_id, o.customer_name"""
-        
-        # Add all the selected columns to GROUP BY
-        group_by_columns = []
-        for col_name, col_index in column_map.items():
-            if col_name not in ['order_id', 'customer_name']:  # Already added
-                if col_name == 'total_amount':
-                    if 'total_amount' in order_columns:
-                        group_by_columns.append('o.total_amount')
-                    elif 'total_price' in order_columns:
-                        group_by_columns.append('o.total_price')
-                elif col_name in order_columns:
-                    group_by_columns.append(f'o.{col_name}')
-        
-        if group_by_columns:
-            base_query += ", " + ", ".join(group_by_columns)
-        
-        base_query += " ORDER BY o.order_date DESC"
-        
-        print(f"🔍 Executing query: {base_query}")
-        cursor.execute(base_query)
-        orders_data = cursor.fetchall()
+        # Large histories are streamed page by page instead of built in memory
+        order_count = live_stats(conn)['order_count']
+        if request.args.get('stream') == '1' or order_count > app.config.get('REPORT_STREAM_THRESHOLD', 5000):
+            print(f"📊 Streaming report for {order_count} orders")
+            timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+            return Response(
+                stream_with_context(stream_orders_report(conn, datetime.datetime.now(),
+                                                         app.config.get('REPORT_STREAM_CHUNK', 1000))),
+                mimetype='application/pdf',
+                headers={'Content-Disposition': f'attachment; filename=all_orders_report_{timestamp}.pdf'}
+            )
+        
+        # Orders joined with their item counts, compiled once for the current schema
+        plan = get_plan('orders_report')
+        cursor.execute(plan.sql)
+        orders_data = plan.decode_all(cursor.fetchall())
         
         print(f"📋 Found {len(orders_data)} orders for PDF")
         
@@ -1875,136 +953,12 @@ def download_all_orders():
         
         conn.close()
         
-        # Create PDF using ReportLab
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
-        styles = getSampleStyleSheet()
-        elements = []
-        
-        # Title
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=20,
-            textColor=colors.darkblue,
-            alignment=1,  # Center alignment
-            spaceAfter=30
-        )
-        
-        elements.append(Paragraph("🍪 Sweet Delights Bakery - All Orders Report", title_style))
-        elements.append(Spacer(1, 20))
-        
-        # Report info
-        report_info_style = ParagraphStyle(
-            'ReportInfo',
-            parent=styles['Normal'],
-            fontSize=11,
-            alignment=1,
-            spaceAfter=20
-        )
-        
-        current_date = datetime.datetime.now().strftime('%B %d, %Y at %I:%M %p')
-        elements.append(Paragraph(f"Generated on: {current_date}", report_info_style))
-        elements.append(Spacer(1, 20))
-        
-        # Create table headers
-        table_data = [['Order ID', 'Customer Name', 'Total Amount', 'Date', 'Payment', 'Items', 'Quantity', 'Discount']]
-        
-        # Process orders data
-        total_revenue = 0
-        total_orders = len(orders_data)
-        total_items = 0
-        total_discount_amount = 0
-        
-        for order in orders_data:
-            try:
-                # Safe access to order data
-                order_id = str(order[column_map['order_id']])
-                customer_name = order[column_map['customer_name']] or 'Unknown'
-                total_amount = order[column_map['total_amount']] if order[column_map['total_amount']] else 0
-                order_date = order[column_map['order_date']]
-                payment_method = (order[column_map['payment_method']] or 'Cash').title()
-                discount_applied = bool(order[column_map['discount_applied']])
-                discount_amount = order[column_map['discount_amount']] if order[column_map['discount_amount']] else 0
-                
-                # Get item count and quantity (these are from the JOIN)
-                item_count = order[-2] if len(order) > len(column_map) else 0  # Second to last
-                total_quantity = order[-1] if len(order) > len(column_map) else 0  # Last
-                
-                # Format date
-                date_str = order_date.strftime("%m/%d/%Y") if order_date else "N/A"
-                
-                # Discount display
-                discount_display = f"${discount_amount:.2f}" if discount_applied and discount_amount > 0 else "None"
-                
-                table_data.append([
-                    order_id,
-                    customer_name,
-                    f"${total_amount:.2f}",
-                    date_str,
-                    payment_method,
-                    str(item_count),
-                    str(total_quantity),
-                    discount_display
-                ])
-                
-                # Add to totals
-                total_revenue += total_amount
-                total_items += total_quantity
-                if discount_applied and discount_amount > 0:
-                    total_discount_amount += discount_amount
-                
-            except Exception as row_error:
-                print(f"❌ Error processing row: {str(row_error)}")
-                continue
-        
-       
-        
-        # Summary table
-        summary_data = [
-            ['Total Revenue:', f"${total_revenue:.2f}"],
-            ['Total Orders:', total_orders],
-            ['Total Items Sold:', total_items],
-            ['Total Discount Given:', f"${total_discount_amount:.2f}"]
-        ]
-        
-        summary_table = Table(summary_data, colWidths=[2.5*inch, 1.5*inch])
-        summary_table.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
-            ('FONTNAME', (0, 0), (-1, -2), 'Helvetica'),
-            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, -2), 11),
-            ('FONTSIZE', (0, -1), (-1, -1), 14),
-            ('TEXTCOLOR', (0, -1), (-1, -1), colors.darkblue),
-            ('LINEABOVE', (0, -1), (-1, -1), 2, colors.black),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ]))
-        
-        # Center the summary table
-        summary_container = Table([[summary_table]], colWidths=[6.5*inch])
-        summary_container.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ]))
-        
-        elements.append(summary_container)
-        elements.append(Spacer(1, 30))
-        
-        # Footer
-        footer_style = ParagraphStyle(
-            'Footer',
-            parent=styles['Normal'],
-            fontSize=10,
-            alignment=1,
-            textColor=colors.grey
-        )
-        
-        elements.append(Paragraph("🍪 Sweet Delights Bakery Management System", footer_style))
-        elements.append(Paragraph("Thank you for using our system!", footer_style))
-        
-        # Build PDF
-        print("📄 Building PDF document...")
-        doc.build(elements)
-        buffer.seek(0)
+        # Rendered in the PDF worker pool so this worker keeps serving orders
+        pdf = render_pdf({
+            'kind': 'orders_report',
+            'orders': orders_data,
+            'generated_at': datetime.datetime.now(),
+        })
         
         # Generate filename with timestamp
         timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -2013,7 +967,7 @@ def download_all_orders():
         print(f"✅ PDF generated successfully: {filename}")
         
         return send_file(
-            buffer,
+            BytesIO(pdf),
             mimetype='application/pdf',
             as_attachment=True,
             download_name=filename
@@ -2031,190 +985,39 @@ def download_all_orders():
         flash(f'Error generating orders report: {str(e)}', 'error')
         return redirect(url_for('orders_history'))
 
+@app.route('/admin/export/<any(orders, "order-lines"):dataset>.<any(csv, xlsx):fmt>')
+@login_required
+@admin_required
+def export_orders(dataset, fmt):
+    # Spreadsheet export for ?start=YYYY-MM-DD&end=YYYY-MM-DD, streamed row by row
+    try:
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid date range: {e}'}), 400
+    
+    conn = get_db_connection()
+    last_day = end - datetime.timedelta(days=1)
+    filename = f"{dataset}_{start.strftime('%Y%m%d')}_{last_day.strftime('%Y%m%d')}.{fmt}"
+    print(f"📤 Exporting {dataset} as {fmt}: {filename}")
+    return Response(
+        stream_with_context(stream_export(conn, dataset, fmt, start, end,
+                                          app.config.get('REPORT_STREAM_CHUNK', 1000))),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
 @app.route('/receipt/<order_id>')
 @login_required
+@immutable_order_page
 def view_receipt(order_id):
     try:
         print(f"🧾 Generating receipt for order: {order_id}")
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get order data (same logic as invoice)
-        cursor.execute("""
-        SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS 
-        WHERE TABLE_NAME = 'orders'
-        """)
-        order_columns = [row[0] for row in cursor.fetchall()]
-        
-        # Build query based on available columns
-        base_query = "SELECT order_id, customer_name"
-        column_map = {'order_id': 0, 'customer_name': 1}
-        current_index = 2
-        
-        if 'customer_email' in order_columns:
-            base_query += ", customer_email"
-            column_map['customer_email'] = current_index
-            current_index += 1
-        else:
-            base_query += ", '' as customer_email"
-            column_map['customer_email'] = current_index
-            current_index += 1
-            
-        if 'customer_phone' in order_columns:
-            base_query += ", customer_phone"
-            column_map['customer_phone'] = current_index
-            current_index += 1
-        else:
-            base_query += ", '' as customer_phone"
-            column_map['customer_phone'] = current_index
-            current_index += 1
-            
-        if 'subtotal_amount' in order_columns:
-            base_query += ", subtotal_amount"
-            column_map['subtotal_amount'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 0 as subtotal_amount"
-            column_map['subtotal_amount'] = current_index
-            current_index += 1
-            
-        if 'discount_applied' in order_columns:
-            base_query += ", discount_applied"
-            column_map['discount_applied'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 0 as discount_applied"
-            column_map['discount_applied'] = current_index
-            current_index += 1
-            
-        if 'discount_amount' in order_columns:
-            base_query += ", discount_amount"
-            column_map['discount_amount'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 0 as discount_amount"
-            column_map['discount_amount'] = current_index
-            current_index += 1
-            
-        if 'total_amount' in order_columns:
-            base_query += ", total_amount"
-            column_map['total_amount'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 0 as total_amount"
-            column_map['total_amount'] = current_index
-            current_index += 1
-            
-        if 'total_price' in order_columns:
-            base_query += ", total_price"
-            column_map['total_price'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 0 as total_price"
-            column_map['total_price'] = current_index
-            current_index += 1
-            
-        if 'payment_method' in order_columns:
-            base_query += ", payment_method"
-            column_map['payment_method'] = current_index
-            current_index += 1
-        else:
-            base_query += ", 'cash' as payment_method"
-            column_map['payment_method'] = current_index
-            current_index += 1
-            
-        if 'order_date' in order_columns:
-            base_query += ", order_date"
-            column_map['order_date'] = current_index
-            current_index += 1
-        else:
-            base_query += ", GETDATE() as order_date"
-            column_map['order_date'] = current_index
-            current_index += 1
-        
-        base_query += " FROM orders WHERE order_id = ?"
-        
-        cursor.execute(base_query, (order_id,))
-        order_row = cursor.fetchone()
-        
-        if not order_row:
+        loaded = get_order(order_id)
+        if loaded is None:
             flash('Order not found', 'error')
             return redirect(url_for('place_order'))
-        
-        # Get order items
-        cursor.execute("""
-        SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS 
-        WHERE TABLE_NAME = 'order_items'
-        """)
-        item_columns = [row[0] for row in cursor.fetchall()]
-        
-        items_query = "SELECT "
-        if 'product_name' in item_columns:
-            items_query += "product_name"
-        else:
-            items_query += "'Unknown Product' as product_name"
-            
-        items_query += ", quantity"
-        
-        if 'unit_price' in item_columns:
-            items_query += ", unit_price"
-        elif 'price' in item_columns:
-            items_query += ", price as unit_price"
-        else:
-            items_query += ", 0 as unit_price"
-            
-        if 'total_price' in item_columns:
-            items_query += ", total_price"
-        elif 'price' in item_columns:
-            items_query += ", price as total_price"
-        else:
-            items_query += ", 0 as total_price"
-        
-        items_query += " FROM order_items WHERE order_id = ?"
-        
-        cursor.execute(items_query, (order_id,))
-        items_data = cursor.fetchall()
-        conn.close()
-        
-        # Process order data
-        subtotal = order_row[column_map['subtotal_amount']] if order_row[column_map['subtotal_amount']] else 0
-        if subtotal == 0:
-            subtotal = order_row[column_map['total_amount']] if order_row[column_map['total_amount']] else 0
-            if subtotal == 0:
-                subtotal = order_row[column_map['total_price']] if order_row[column_map['total_price']] else 0
-
-        discount_applied = bool(order_row[column_map['discount_applied']])
-        discount_amount = order_row[column_map['discount_amount']] if order_row[column_map['discount_amount']] else 0
-
-        final_total = order_row[column_map['total_amount']] if order_row[column_map['total_amount']] else 0
-        if final_total == 0:
-            final_total = order_row[column_map['total_price']] if order_row[column_map['total_price']] else 0
-        if final_total == 0:
-            final_total = subtotal - discount_amount
-
-        order = {
-            'order_id': order_row[column_map['order_id']],
-            'customer_name': order_row[column_map['customer_name']],
-            'customer_email': order_row[column_map['customer_email']] or '',
-            'customer_phone': order_row[column_map['customer_phone']] or '',
-            'subtotal_amount': subtotal,
-            'discount_applied': discount_applied,
-            'discount_amount': discount_amount,
-            'total_amount': final_total,
-            'payment_method': (order_row[column_map['payment_method']] or 'cash').title(),
-            'order_date': order_row[column_map['order_date']]
-        }
-        
-        # Process items
-        items = []
-        for item in items_data:
-            items.append({
-                'product_name': item[0] or 'Unknown Product',
-                'quantity': item[1],
-                'unit_price': item[2] if item[2] else 0,
-                'total_price': item[3] if item[3] else 0
-            })
+        order, items = loaded
         
         return render_template('receipt.html', order=order, items=items)
         
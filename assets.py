@@ -0,0 +1,209 @@
+"""
+Fingerprinted, precompressed static assets.
+
+At startup every file under static/ (except uploads) is hashed and given a
+versioned URL such as /assets/CSS/styles.3f9a1c2b7d4e.css. Templates keep
+calling url_for('static', filename=...): the app's url_for is wrapped so
+those calls return the versioned URL. Since the URL changes whenever the
+file does, responses carry a one-year immutable Cache-Control and browsers
+stop revalidating styles.css / script.js on every POS page load.
+
+Text assets are compressed once, at startup or with `flask assets-build`,
+into ASSETS_BUILD_DIR (gzip always, brotli when the brotli package is
+installed) and served according to the request's Accept-Encoding.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+
+from flask import abort, current_app, request, send_file, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+HASH_LENGTH = 12
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.html', '.map'}
+# Not worth compressing - the saving doesn't pay for the extra request handling
+MIN_COMPRESS_SIZE = 512
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class Asset:
+    """
+    One static file and its versioned name
+    """
+    __slots__ = ('source', 'hashed_name', 'mtime_ns', 'encodings')
+
+    def __init__(self, source, hashed_name, mtime_ns):
+        self.source = source
+        self.hashed_name = hashed_name
+        self.mtime_ns = mtime_ns
+        # Content-Encoding -> precompressed file
+        self.encodings = {}
+
+
+def hashed_filename(filename, digest):
+    stem, extension = os.path.splitext(filename)
+    return f'{stem}.{digest[:HASH_LENGTH]}{extension}'
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class AssetManifest:
+    """
+    Logical static filename -> Asset, built by scanning the static folder
+    """
+
+    def __init__(self, static_folder, build_dir, exclude=('uploads',), auto_reload=False):
+        self.static_folder = static_folder
+        self.build_dir = build_dir
+        self.exclude = set(exclude)
+        self.auto_reload = auto_reload
+        self._assets = {}
+        self._by_hashed = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._assets)
+
+    def __iter__(self):
+        return iter(list(self._assets.values()))
+
+    @staticmethod
+    def _key(filename):
+        # Templates link css/styles.css while the folder is CSS/ - Windows
+        # doesn't mind, so neither do we
+        return filename.replace('\\', '/').lower()
+
+    def build(self):
+        """
+        Hash every static file and write any missing compressed copies
+        """
+        for root, dirs, files in os.walk(self.static_folder):
+            if root == self.static_folder:
+                dirs[:] = [d for d in dirs if d not in self.exclude]
+            for name in files:
+                path = os.path.join(root, name)
+                self._add(os.path.relpath(path, self.static_folder).replace(os.sep, '/'))
+        return self
+
+    def _add(self, filename):
+        source = os.path.join(self.static_folder, filename)
+        mtime_ns = os.stat(source).st_mtime_ns
+        asset = Asset(source, hashed_filename(filename, file_digest(source)), mtime_ns)
+        if os.path.splitext(filename)[1].lower() in COMPRESSIBLE:
+            self._compress(asset)
+        with self._lock:
+            old = self._assets.get(self._key(filename))
+            if old is not None:
+                self._by_hashed.pop(old.hashed_name, None)
+            self._assets[self._key(filename)] = asset
+            self._by_hashed[asset.hashed_name] = asset
+        return asset
+
+    def _compress(self, asset):
+        if os.path.getsize(asset.source) < MIN_COMPRESS_SIZE:
+            return
+        data = None
+        targets = [('gzip', '.gz', lambda raw: gzip.compress(raw, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            targets.insert(0, ('br', '.br', lambda raw: brotli.compress(raw, quality=11)))
+        for encoding, suffix, compress in targets:
+            path = os.path.join(self.build_dir, asset.hashed_name + suffix)
+            # Hashed names never change content - an existing file is current
+            if not os.path.exists(path):
+                if data is None:
+                    with open(asset.source, 'rb') as f:
+                        data = f.read()
+                _write_atomic(path, compress(data))
+            asset.encodings[encoding] = path
+
+    def lookup(self, filename):
+        """
+        The Asset for a logical filename, or None if it isn't a static file
+        """
+        asset = self._assets.get(self._key(filename))
+        if asset is not None and self.auto_reload:
+            try:
+                if os.stat(asset.source).st_mtime_ns != asset.mtime_ns:
+                    asset = self._add(os.path.relpath(asset.source, self.static_folder).replace(os.sep, '/'))
+            except FileNotFoundError:
+                return None
+        return asset
+
+    def by_hashed(self, hashed_name):
+        return self._by_hashed.get(hashed_name)
+
+
+def get_manifest(app=None):
+    app = app or current_app._get_current_object()
+    return app.extensions['asset_manifest']
+
+
+def asset_url_for(endpoint, **values):
+    """
+    url_for that turns static files into their fingerprinted URLs
+    """
+    if endpoint == 'static' and 'filename' in values:
+        asset = get_manifest().lookup(values['filename'])
+        if asset is not None:
+            values['filename'] = asset.hashed_name
+            endpoint = 'asset'
+    return url_for(endpoint, **values)
+
+
+def serve_asset(hashed_name):
+    """
+    Response for a fingerprinted asset, precompressed when the client allows
+    """
+    asset = get_manifest().by_hashed(hashed_name)
+    if asset is None:
+        abort(404)
+
+    path = asset.source
+    encoding = None
+    for candidate in ('br', 'gzip'):
+        if candidate in asset.encodings and request.accept_encodings[candidate]:
+            encoding = candidate
+            path = asset.encodings[candidate]
+            break
+
+    mimetype = mimetypes.guess_type(asset.source)[0] or 'application/octet-stream'
+    response = send_file(path, mimetype=mimetype, conditional=True, etag=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if asset.encodings:
+        response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = IMMUTABLE
+    return response
+
+
+def init_assets(app):
+    """
+    Build the manifest and route url_for('static') through it
+    """
+    build_dir = app.config.get('ASSETS_BUILD_DIR') or os.path.join(app.instance_path, 'assets')
+    manifest = AssetManifest(app.static_folder, build_dir,
+                             auto_reload=app.config.get('ASSETS_AUTO_RELOAD', app.debug)).build()
+    app.extensions['asset_manifest'] = manifest
+    app.jinja_env.globals['url_for'] = asset_url_for
+    print(f"Static assets fingerprinted: {len(manifest)} files")
+    return manifest
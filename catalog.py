@@ -0,0 +1,313 @@
+"""
+Cached product catalog for the POS screen.
+
+The catalog is read from the database once and served from memory until a
+product is added, edited or deleted. Those writes call invalidate_catalog(),
+which drops this process's copy and touches a stamp file; every other worker
+process sees the stamp change on its next lookup (one stat() call) and
+reloads. A TTL bounds staleness if the products table is changed by
+something other than the app.
+
+POS terminals can also fetch the catalog as JSON (/api/catalog) and keep
+it in sync with ?since=<version> deltas. The version is the products
+table's highest committed rowversion, so a delta is every row written
+after it, including soft deletes (active = 0).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from flask import current_app
+
+from db_pool import get_db_connection
+from image_variants import parse_variants
+from schema import get_schema
+
+
+# Field order of the product rows in the JSON catalog
+CATALOG_FIELDS = ('id', 'name', 'price', 'image', 'category', 'thumb')
+
+# Newest rowversion that no open transaction can still undercut
+CATALOG_VERSION_SQL = """
+SELECT CAST(MAX(row_version) AS BIGINT) FROM products
+WHERE row_version < MIN_ACTIVE_ROWVERSION()
+"""
+
+
+def catalog_query(columns, since=False):
+    """
+    SELECT for the active products, given the products table schema.
+    With since=True it selects every product changed in a
+    (version, version] range instead, with its active flag.
+    """
+    # Build query to get the best available image column
+    query = "SELECT id, name, price"
+
+    if 'image_filename' in columns:
+        query += ", COALESCE(image_filename, image, '') as image_path"
+    elif 'image' in columns:
+        query += ", COALESCE(image, '') as image_path"
+    else:
+        query += ", '' as image_path"
+
+    if 'category' in columns:
+        query += ", COALESCE(category, 'General') as category"
+    else:
+        query += ", 'General' as category"
+
+    if 'image_variants' in columns:
+        query += ", image_variants"
+    else:
+        query += ", NULL as image_variants"
+
+    if since:
+        active = "COALESCE(active, 1)" if 'active' in columns else "1"
+        return (query + f", {active} as active FROM products"
+                " WHERE row_version > CAST(CAST(? AS BIGINT) AS BINARY(8))"
+                " AND row_version <= CAST(CAST(? AS BIGINT) AS BINARY(8))"
+                " ORDER BY row_version")
+
+    query += " FROM products"
+
+    if 'active' in columns:
+        query += " WHERE COALESCE(active, 1) = 1"
+
+    return query + " ORDER BY name"
+
+
+def catalog_product(row):
+    """
+    POS product dict for one catalog row
+    """
+    # Remove any path separators and keep just the filename
+    image_path = os.path.basename(row[3]) if row[3] else ''
+    variants = parse_variants(row[5])
+    return {
+        'id': row[0],
+        'name': row[1],
+        'price': float(row[2]),
+        'image': image_path,
+        'category': row[4] or 'General',
+        # Small rendition for the POS grid, or the original until one exists
+        'thumb': variants.get('thumb', image_path) if image_path else '',
+    }
+
+
+def supports_delta():
+    return get_schema().has_column('products', 'row_version')
+
+
+def catalog_version(cursor):
+    """
+    Current catalog version (None without the row_version column)
+    """
+    if not supports_delta():
+        return None
+    cursor.execute(CATALOG_VERSION_SQL)
+    return cursor.fetchone()[0] or 0
+
+
+def load_catalog(conn):
+    """
+    (products, version) for the active catalog
+    """
+    cursor = conn.cursor()
+    # Version first: a product written in between is then re-sent by the
+    # next delta rather than missed
+    version = catalog_version(cursor)
+    cursor.execute(catalog_query(get_schema().columns('products')))
+    products = [catalog_product(row) for row in cursor.fetchall()]
+    cursor.close()
+    return products, version
+
+
+def load_catalog_delta(conn, since):
+    """
+    (changed, removed, version) for everything written after version `since`
+    """
+    cursor = conn.cursor()
+    version = catalog_version(cursor)
+    cursor.execute(catalog_query(get_schema().columns('products'), since=True), (since, version))
+    changed = []
+    removed = []
+    for row in cursor.fetchall():
+        if row[6]:
+            changed.append(catalog_product(row))
+        else:
+            removed.append(row[0])
+    cursor.close()
+    return changed, removed, version
+
+
+def catalog_json(version, products, since=None, removed=()):
+    """
+    Compact JSON body: products as rows in CATALOG_FIELDS order
+    """
+    body = {
+        'version': version,
+        'full': since is None,
+        'fields': CATALOG_FIELDS,
+        'products': [[product[field] for field in CATALOG_FIELDS] for product in products],
+    }
+    if since is not None:
+        body['since'] = since
+        body['removed'] = list(removed)
+    return json.dumps(body, separators=(',', ':')).encode('utf-8')
+
+
+def json_etag(body):
+    return hashlib.sha1(body).hexdigest()
+
+
+class Catalog:
+    """
+    One loaded copy of the catalog, with its JSON form built on first use
+    """
+    __slots__ = ('products', 'version', 'stamp', 'loaded_at', '_json')
+
+    def __init__(self, products, version, stamp, loaded_at):
+        self.products = products
+        self.version = version
+        self.stamp = stamp
+        self.loaded_at = loaded_at
+        self._json = None
+
+    def json(self):
+        """
+        (body, etag) of the full catalog
+        """
+        if self._json is None:
+            body = catalog_json(self.version, self.products)
+            self._json = (body, json_etag(body))
+        return self._json
+
+
+class CatalogCache:
+    """
+    Process-local catalog copy, kept in step across processes by a stamp file
+    """
+
+    def __init__(self, stamp_path, ttl=300):
+        self.stamp_path = stamp_path
+        self.ttl = ttl
+        self._catalog = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _read_stamp(self):
+        # The file is replaced on every bump, so inode + mtime identify a version
+        try:
+            st = os.stat(self.stamp_path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def _fresh(self, catalog):
+        return (catalog is not None
+                and time.monotonic() - catalog.loaded_at < self.ttl
+                and catalog.stamp == self._read_stamp())
+
+    def get(self, loader=None):
+        """
+        The current catalog, loading it with loader(conn) -> (products, version) on a miss
+        """
+        catalog = self._catalog
+        if self._fresh(catalog):
+            self.hits += 1
+            return catalog
+
+        with self._lock:
+            catalog = self._catalog
+            if self._fresh(catalog):
+                self.hits += 1
+                return catalog
+            self.misses += 1
+            # Read the stamp before the rows, so a write that lands
+            # mid-load leaves this copy marked stale
+            stamp = self._read_stamp()
+            products, version = (loader or load_catalog)(get_db_connection())
+            catalog = Catalog(products, version, stamp, time.monotonic())
+            self._catalog = catalog
+            return catalog
+
+    def invalidate(self):
+        """
+        Drop the cached catalog here and in every other worker process
+        """
+        with self._lock:
+            self._catalog = None
+            self.invalidations += 1
+        os.makedirs(os.path.dirname(os.path.abspath(self.stamp_path)), exist_ok=True)
+        tmp_path = f'{self.stamp_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(f'{time.time()}\n')
+        os.replace(tmp_path, self.stamp_path)
+
+    def stats(self):
+        catalog = self._catalog
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'products': len(catalog.products) if catalog else 0,
+            'version': catalog.version if catalog else None,
+            'age_seconds': round(time.monotonic() - catalog.loaded_at, 1) if catalog else None,
+        }
+
+
+_cache_lock = threading.Lock()
+
+
+def get_catalog_cache(app=None):
+    app = app or current_app._get_current_object()
+    cache = app.extensions.get('catalog_cache')
+    if cache is None:
+        with _cache_lock:
+            cache = app.extensions.get('catalog_cache')
+            if cache is None:
+                stamp_path = app.config.get('CATALOG_STAMP_PATH') or os.path.join(app.instance_path, 'catalog.stamp')
+                cache = CatalogCache(stamp_path, app.config.get('CATALOG_CACHE_TTL', 300))
+                app.extensions['catalog_cache'] = cache
+    return cache
+
+
+def get_catalog():
+    """
+    Active products for the POS screen (served from the cache)
+    """
+    return get_catalog_cache().get().products
+
+
+def catalog_response(since=None):
+    """
+    (body, etag) for /api/catalog: the cached full catalog, or a delta
+    since the given version. Raises ValueError if deltas aren't available.
+    """
+    catalog = get_catalog_cache().get()
+    if since is None:
+        return catalog.json()
+
+    if catalog.version is None:
+        raise ValueError('Delta sync needs the products.row_version column - run `flask migrate`')
+    if since == catalog.version:
+        # Terminal is already current as of the cached copy - no database read
+        body = catalog_json(catalog.version, [], since=since)
+        return body, json_etag(body)
+    if since > catalog.version:
+        # Ahead of us (e.g. the database was restored) - resend everything
+        return catalog.json()
+
+    changed, removed, version = load_catalog_delta(get_db_connection(), since)
+    body = catalog_json(version, changed, since=since, removed=removed)
+    return body, json_etag(body)
+
+
+def invalidate_catalog():
+    """
+    Call after committing any change to the products table
+    """
+    get_catalog_cache().invalidate()
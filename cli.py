@@ -0,0 +1,435 @@
+"""
+Management commands for the Bakery Management System (run with `flask <command>`)
+"""
+import datetime
+import multiprocessing
+import os
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import current_app
+
+from catalog import invalidate_catalog
+from db_pool import create_pool, get_db_connection
+from image_variants import generate_variants, parse_variants, record_variants, variant_format
+from migrations import LATEST_VERSION, current_version, migrate, render_sql_script
+from order_ids import OrderIdAllocator
+from order_writer import get_write_plan, order_lines, write_order
+from plan_check import remove_seed_data, seed_dataset, verify_plans
+from sales_rollup import rebuild_rollup
+from schema import invalidate_schema
+from stock import InsufficientStock, reserve_stock, set_stock, supports_stock
+from upload_gc import run_sweep
+from assets import init_assets
+
+
+def _synthetic_order(index, product_id, cart_size):
+    order_id = f"BENCH-{index:06d}"
+    lines = [{
+        'order_id': order_id,
+        'product_id': product_id,
+        'product_name': f'Benchmark item {n}',
+        'quantity': 1 + n % 3,
+        'unit_price': 2.5,
+        'total_price': 2.5 * (1 + n % 3),
+        'price': 2.5,
+    } for n in range(cart_size)]
+    subtotal = sum(line['total_price'] for line in lines)
+    order = {
+        'order_id': order_id,
+        'customer_name': 'Benchmark',
+        'customer_email': '',
+        'customer_phone': '',
+        'subtotal_amount': subtotal,
+        'discount_applied': False,
+        'discount_amount': 0,
+        'total_amount': subtotal,
+        'total_price': subtotal,
+        'payment_method': 'cash',
+        'order_date': datetime.datetime.now(),
+        'created_by': None,
+    }
+    return order, lines
+
+
+def _write_order_per_line(conn, plan, order, lines):
+    """
+    The old write path: one INSERT for the header, then one per line
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        f"INSERT INTO orders ({', '.join(plan.order_columns)}) "
+        f"VALUES ({', '.join('?' for _ in plan.order_columns)})",
+        [order[col] for col in plan.order_columns])
+    item_sql = (f"INSERT INTO order_items ({', '.join(plan.item_columns)}) "
+                f"VALUES ({', '.join('?' for _ in plan.item_columns)})")
+    for line in lines:
+        cursor.execute(item_sql, [line[col] for col in plan.item_columns])
+    cursor.close()
+
+
+STRESS_PREFIX = 'STRESS-'
+
+
+def _stress_till(app, pool, till, products, orders, max_units, tally):
+    """
+    One till placing orders as fast as it can; adds to tally under its lock
+    """
+    rng = random.Random(till)
+    with app.app_context(), pool.connection() as conn:
+        for n in range(orders):
+            # Every cart hits several of the same few SKUs
+            picks = rng.sample(products, rng.randint(1, len(products)))
+            cart = [{'id': product_id, 'name': f'{STRESS_PREFIX}{product_id}',
+                     'quantity': rng.randint(1, max_units), 'price': 1.0}
+                    for product_id in picks]
+            order_id = f'{STRESS_PREFIX}{till:03d}-{n:05d}'
+            total = float(sum(item['quantity'] for item in cart))
+            order = {
+                'order_id': order_id, 'customer_name': 'Stock stress test',
+                'customer_email': '', 'customer_phone': '',
+                'subtotal_amount': total, 'discount_applied': False, 'discount_amount': 0,
+                'total_amount': total, 'total_price': total, 'payment_method': 'cash',
+                'order_date': datetime.datetime.now(), 'created_by': None,
+            }
+            started = time.perf_counter()
+            try:
+                reserve_stock(conn, cart)
+                write_order(conn, order, order_lines(order_id, cart))
+                conn.commit()
+                outcome = 'placed'
+            except InsufficientStock:
+                conn.rollback()
+                outcome = 'rejected'
+            except Exception as e:
+                conn.rollback()
+                outcome = 'errors'
+                print(f"⚠️ Till {till}: {e}")
+            elapsed = time.perf_counter() - started
+            with tally['lock']:
+                tally[outcome] += 1
+                tally['timings'].append(elapsed)
+                if outcome == 'placed':
+                    for item in cart:
+                        tally['sold'][item['id']] += item['quantity']
+
+
+def _remove_stress_data(conn):
+    cursor = conn.cursor()
+    cursor.execute(f"DELETE FROM order_items WHERE order_id LIKE '{STRESS_PREFIX}%'")
+    cursor.execute(f"DELETE FROM orders WHERE order_id LIKE '{STRESS_PREFIX}%'")
+    cursor.execute(f"DELETE FROM products WHERE name LIKE '{STRESS_PREFIX}%'")
+    conn.commit()
+    cursor.close()
+    rebuild_rollup(conn)
+    invalidate_catalog()
+
+
+# Settings a spawned process needs to open its own connections
+CONNECTION_SETTINGS = ('SQL_SERVER', 'SQL_SERVER_DRIVER', 'DATABASE', 'SQL_USERNAME', 'SQL_PASSWORD')
+
+
+def _allocate_order_ids(settings, count, block_size):
+    """
+    Allocate count order numbers in a fresh process; runs in the check's workers
+    """
+    pool = create_pool(dict(settings, DB_POOL_MIN_SIZE=1, DB_POOL_MAX_SIZE=1))
+    allocator = OrderIdAllocator(block_size)
+    numbers = []
+    try:
+        with pool.connection() as conn:
+            for _ in range(count):
+                numbers.append(allocator.next_number(conn))
+            conn.commit()
+    finally:
+        pool.close()
+    return os.getpid(), numbers, allocator.stats()
+
+
+def register_commands(app):
+    """
+    Attach the management commands to the Flask CLI
+    """
+
+    @app.cli.command('migrate')
+    @click.option('--target', type=int, default=None,
+                  help='Stop at this migration number (default: latest).')
+    def migrate_command(target):
+        """Apply pending schema migrations."""
+        conn = get_db_connection()
+        before = current_version(conn.cursor())
+        applied = migrate(conn, target)
+        conn.close()
+        invalidate_schema()
+        if applied:
+            click.echo(f'Migrated from version {before} to {applied[-1]}.')
+        else:
+            click.echo(f'Database is up to date (version {before}, latest {LATEST_VERSION}).')
+
+    @app.cli.command('schema-sql')
+    @click.argument('output', type=click.Path(dir_okay=False), default='SQL Querires.txt')
+    def schema_sql_command(output):
+        """Write the migrations out as a plain T-SQL script."""
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(render_sql_script() + '\n')
+        click.echo(f'Wrote {output}')
+
+    @app.cli.command('rebuild-sales-rollup')
+    def rebuild_sales_rollup_command():
+        """Recompute the dashboard sales rollup from the orders table."""
+        conn = get_db_connection()
+        rebuild_rollup(conn)
+        conn.close()
+        click.echo('Sales rollup rebuilt.')
+
+    @app.cli.command('images-backfill')
+    @click.option('--force', is_flag=True, help='Regenerate variants that already exist.')
+    def images_backfill_command(force):
+        """Make thumbnail/medium variants for existing product images."""
+        if variant_format() is None:
+            raise click.ClickException('Pillow is not installed (pip install Pillow)')
+        upload_dir = current_app.config['UPLOAD_FOLDER']
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, COALESCE(image_filename, image), image_variants FROM products "
+                       "WHERE COALESCE(image_filename, image, '') <> ''")
+        rows = cursor.fetchall()
+        cursor.close()
+
+        done = skipped = failed = 0
+        for product_id, filename, variants in rows:
+            filename = os.path.basename(filename)
+            if parse_variants(variants) and not force:
+                skipped += 1
+                continue
+            if not os.path.exists(os.path.join(upload_dir, filename)):
+                click.echo(f'missing  product {product_id}: {filename}')
+                failed += 1
+                continue
+            try:
+                record_variants(conn, product_id, filename, generate_variants(upload_dir, filename))
+                done += 1
+            except Exception as e:
+                click.echo(f'failed   product {product_id}: {filename} ({e})')
+                failed += 1
+        conn.close()
+        if done:
+            invalidate_catalog()
+        click.echo(f'{done} processed, {skipped} already done, {failed} failed.')
+
+    @app.cli.command('uploads-sweep')
+    @click.option('--dry-run', is_flag=True, help='Report what would be deleted without deleting it.')
+    def uploads_sweep_command(dry_run):
+        """Delete orphaned uploads and report products with missing images."""
+        report = run_sweep(current_app, dry_run=dry_run)
+        if report.skipped:
+            raise click.ClickException('Another process is sweeping the uploads folder - try again later')
+        verb = 'would delete' if dry_run else 'deleted'
+        for name in report.purged + report.deleted:
+            click.echo(f'{verb}  {name}')
+        for product in report.dangling:
+            click.echo(f"missing  product {product['id']} ({product['name']}): {product['image']}")
+        click.echo(f'{report.scanned} files scanned, {report.kept} kept, '
+                   f'{len(report.purged) + len(report.deleted)} {verb}, {len(report.dangling)} dangling.')
+
+    @app.cli.command('assets-build')
+    def assets_build_command():
+        """Fingerprint static files and write their gzip/brotli copies."""
+        manifest = init_assets(current_app)
+        for asset in sorted(manifest, key=lambda asset: asset.hashed_name):
+            encodings = ', '.join(sorted(asset.encodings)) or 'uncompressed'
+            click.echo(f'{asset.hashed_name}  ({encodings})')
+
+    @app.cli.command('verify-plans')
+    @click.option('--seed', 'seed_orders', type=int, default=0,
+                  help='Seed this many synthetic orders before checking.')
+    @click.option('--keep', is_flag=True, help='Keep the seeded rows afterwards.')
+    def verify_plans_command(seed_orders, keep):
+        """Fail if a hot query's plan scans a whole table."""
+        conn = get_db_connection()
+        if seed_orders:
+            click.echo(f'Seeding {seed_orders} orders...')
+            seed_dataset(conn, orders=seed_orders)
+        try:
+            results = verify_plans(conn)
+        finally:
+            if seed_orders and not keep:
+                remove_seed_data(conn)
+            conn.close()
+
+        failed = False
+        for name, scans in results:
+            if scans:
+                failed = True
+                details = ', '.join(f'{op} on {table} ({index})' for op, table, index in scans)
+                click.echo(f'FAIL  {name}: {details}')
+            else:
+                click.echo(f'ok    {name}')
+        if failed:
+            raise SystemExit(1)
+
+    @app.cli.command('bench-order-write')
+    @click.option('--sizes', default='1,5,10,30,100', show_default=True,
+                  help='Comma-separated cart sizes to measure.')
+    @click.option('--repeats', default=20, show_default=True,
+                  help='Orders written per cart size and write path.')
+    def bench_order_write(sizes, repeats):
+        """Compare per-line and batched order writes by cart size.
+
+        Every order is rolled back, so the database is left unchanged.
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT TOP 1 id FROM products ORDER BY id')
+        row = cursor.fetchone()
+        product_id = row[0] if row else 0
+        plan = get_write_plan()
+
+        writers = (
+            ('per-line', lambda order, lines: _write_order_per_line(conn, plan, order, lines)),
+            ('batched', lambda order, lines: write_order(conn, order, lines, plan)),
+        )
+
+        click.echo(f"{'cart size':>9} | {'per-line ms':>11} | {'batched ms':>10} | {'speedup':>7}")
+        click.echo('-' * 46)
+        counter = 0
+        for size in (int(s) for s in sizes.split(',') if s.strip()):
+            medians = {}
+            for name, writer in writers:
+                timings = []
+                for _ in range(repeats):
+                    counter += 1
+                    order, lines = _synthetic_order(counter, product_id, size)
+                    started = time.perf_counter()
+                    writer(order, lines)
+                    timings.append(time.perf_counter() - started)
+                    conn.rollback()
+                medians[name] = statistics.median(timings) * 1000
+            speedup = medians['per-line'] / medians['batched'] if medians['batched'] else 0
+            click.echo(f"{size:>9} | {medians['per-line']:>11.2f} | {medians['batched']:>10.2f} | {speedup:>6.1f}x")
+        conn.close()
+
+    @app.cli.command('stock-stress')
+    @click.option('--tills', default=16, show_default=True,
+                  help='Simultaneous tills (threads, each with its own connection).')
+    @click.option('--orders', default=50, show_default=True, help='Orders placed per till.')
+    @click.option('--products', 'product_count', default=3, show_default=True,
+                  help='Shared SKUs every till sells from.')
+    @click.option('--stock', 'initial_stock', default=100, show_default=True,
+                  help='Starting stock of each SKU.')
+    @click.option('--max-units', default=3, show_default=True, help='Most units of one SKU per cart line.')
+    @click.option('--keep', is_flag=True, help='Keep the test products and orders afterwards.')
+    def stock_stress(tills, orders, product_count, initial_stock, max_units, keep):
+        """Place many simultaneous orders against the same SKUs and check nothing is oversold.
+
+        Creates its own products and orders (prefixed STRESS-) and removes
+        them afterwards. Exits with status 1 if the stock left doesn't match
+        what was sold, or any stock went negative.
+        """
+        if not supports_stock():
+            raise click.ClickException('product_stock is missing - run `flask migrate` first')
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        products = []
+        for n in range(product_count):
+            cursor.execute("INSERT INTO products (name, quantity, price, active) "
+                           "OUTPUT INSERTED.id VALUES (?, ?, 1, 1)",
+                           (f'{STRESS_PREFIX}{n}', str(initial_stock)))
+            products.append(cursor.fetchone()[0])
+            set_stock(cursor, products[-1], initial_stock)
+        conn.commit()
+
+        # A pool of its own, so every till really has a connection at once
+        pool = create_pool(dict(app.config, DB_POOL_MIN_SIZE=tills, DB_POOL_MAX_SIZE=tills))
+        tally = {'lock': threading.Lock(), 'placed': 0, 'rejected': 0, 'errors': 0,
+                 'timings': [], 'sold': {product_id: 0 for product_id in products}}
+        click.echo(f'{tills} tills x {orders} orders against {product_count} SKUs '
+                   f'of {initial_stock} units each...')
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(tills) as executor:
+                futures = [executor.submit(_stress_till, app, pool, till, products, orders, max_units, tally)
+                           for till in range(tills)]
+                for future in futures:
+                    future.result()
+            elapsed = time.perf_counter() - started
+
+            placeholders = ', '.join('?' for _ in products)
+            cursor.execute(f'SELECT product_id, on_hand FROM product_stock WHERE product_id IN ({placeholders})', products)
+            remaining = dict(cursor.fetchall())
+            cursor.execute(f"SELECT product_id, SUM(quantity) FROM order_items "
+                           f"WHERE order_id LIKE '{STRESS_PREFIX}%' GROUP BY product_id")
+            recorded = dict(cursor.fetchall())
+            conn.commit()
+        finally:
+            pool.close()
+            if not keep:
+                _remove_stress_data(conn)
+            cursor.close()
+            conn.close()
+
+        timings = sorted(tally['timings'])
+        total = len(timings)
+        click.echo(f"placed {tally['placed']}, rejected for stock {tally['rejected']}, "
+                   f"errors {tally['errors']} in {elapsed:.2f}s ({total / elapsed:.0f} orders/s)")
+        if timings:
+            click.echo(f"latency ms: median {statistics.median(timings) * 1000:.1f}, "
+                       f"p95 {timings[min(total - 1, int(total * 0.95))] * 1000:.1f}, "
+                       f"max {timings[-1] * 1000:.1f}")
+
+        click.echo(f"{'product':>8} | {'start':>6} | {'sold':>6} | {'in orders':>9} | {'left':>6} | check")
+        # Deadlocks or other failures count too: every order must end placed or rejected
+        failed = tally['errors'] > 0
+        for product_id in products:
+            sold = tally['sold'][product_id]
+            in_orders = recorded.get(product_id, 0)
+            left = remaining.get(product_id)
+            ok = left is not None and left >= 0 and left == initial_stock - sold and in_orders == sold
+            failed = failed or not ok
+            click.echo(f"{product_id:>8} | {initial_stock:>6} | {sold:>6} | {in_orders:>9} | {str(left):>6} | "
+                       f"{'ok' if ok else 'MISMATCH'}")
+        if failed:
+            raise SystemExit(1)
+
+    @app.cli.command('order-ids-check')
+    @click.option('--processes', default=8, show_default=True, help='Worker processes allocating at once.')
+    @click.option('--ids', 'count', default=2000, show_default=True, help='Order numbers per process.')
+    @click.option('--block-size', default=None, type=int,
+                  help='Numbers reserved per round trip (default: ORDER_ID_BLOCK_SIZE).')
+    def order_ids_check(processes, count, block_size):
+        """Allocate order numbers from several processes at once and check none repeat.
+
+        Also checks each process got its numbers in increasing order.
+        Only sequence numbers are used up; no orders are written.
+        """
+        block_size = block_size or app.config.get('ORDER_ID_BLOCK_SIZE', 100)
+        settings = {key: app.config[key] for key in CONNECTION_SETTINGS}
+        click.echo(f'{processes} processes x {count} numbers, blocks of {block_size}...')
+        started = time.perf_counter()
+        # spawn: each worker starts clean, like a separate app server process
+        with multiprocessing.get_context('spawn').Pool(processes) as workers:
+            results = workers.starmap(_allocate_order_ids,
+                                      [(settings, count, block_size)] * processes)
+        elapsed = time.perf_counter() - started
+
+        failed = False
+        seen = set()
+        duplicates = 0
+        for pid, numbers, stats in results:
+            ordered = all(a < b for a, b in zip(numbers, numbers[1:]))
+            failed = failed or not ordered
+            click.echo(f"pid {pid}: {len(numbers)} numbers, {stats['blocks']} round trips, "
+                       f"{numbers[0] if numbers else '-'}..{numbers[-1] if numbers else '-'}"
+                       f"{'' if ordered else '  NOT INCREASING'}")
+            duplicates += len(seen.intersection(numbers))
+            seen.update(numbers)
+        total = processes * count
+        click.echo(f'{len(seen)} distinct of {total} allocated in {elapsed:.2f}s, {duplicates} duplicates')
+        if duplicates or len(seen) != total:
+            failed = True
+        if failed:
+            raise SystemExit(1)
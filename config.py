@@ -11,7 +11,56 @@ SQL_USERNAME = 'sa'  # SQL Server authentication username
 SQL_PASSWORD = '123456'  # Replace with your actual SQL Server password
 TRUSTED_CONNECTION = 'yes'  # Try using Windows authentication instead
 
+# Database connection pool settings
+DB_POOL_MIN_SIZE = 2  # Connections opened up front
+DB_POOL_MAX_SIZE = 10  # Hard cap on open connections per worker process
+DB_POOL_TIMEOUT = 10  # Seconds to wait for a free connection before failing
+DB_POOL_HEALTH_CHECK = True  # Ping idle connections before handing them out
+DB_POOL_RECYCLE = 1800  # Reopen connections older than this many seconds
+
 # File upload settings
 UPLOAD_FOLDER = os.path.join('static', 'uploads')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max-limit
\ No newline at end of file
+MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max-limit
+IMAGE_WORKERS = 1  # Background threads making thumbnail/medium variants (needs Pillow)
+UPLOAD_GC_INTERVAL = 3600  # Seconds between background sweeps of the uploads folder (0 disables)
+UPLOAD_GC_GRACE = 3600  # Seconds an unreferenced upload is kept before it is deleted
+UPLOAD_GC_BATCH = 500  # Rows read / files deleted per batch during a sweep
+
+# Static assets (fingerprinted URLs, precompressed copies)
+ASSETS_BUILD_DIR = None  # Where .gz/.br copies are written (default: <instance path>/assets)
+ASSETS_AUTO_RELOAD = False  # Re-hash edited files on the fly - handy while editing CSS/JS
+
+# Rendered invoice PDFs
+PDF_CACHE_DIR = None  # Shared cache directory (default: <instance path>/invoices)
+PDF_CACHE_MAX_BYTES = 200 * 1024 * 1024  # Least recently used invoices are evicted past this size
+PDF_CACHE_RESCAN = 300  # Seconds between full scans of the cache directory's size
+PDF_CACHE_WARM = True  # Render each new order's invoice in the background after it is placed
+PDF_WORKERS = 2  # Worker processes rendering PDFs (0 renders inline in the request worker)
+PDF_MAX_PENDING = 8  # PDFs queued or rendering at once per app process before new ones are refused
+PDF_RENDER_TIMEOUT = 30  # Seconds to wait for one PDF
+REPORT_STREAM_THRESHOLD = 5000  # Stream the all-orders report page by page above this many orders
+REPORT_STREAM_CHUNK = 1000  # Orders fetched per round trip while streaming
+
+# Placed orders (invoice / receipt / details pages)
+ORDER_CACHE_SIZE = 512  # Orders kept in memory per worker process - they never change once placed
+ORDER_PAGE_MAX_AGE = 60  # Seconds browsers may reuse an invoice/receipt page before revalidating (0 = always revalidate)
+ORDER_ID_PREFIX = 'ORD'  # Order IDs look like ORD-20260318-000123
+ORDER_ID_BLOCK_SIZE = 100  # Order numbers each worker process reserves per database round trip
+
+# POS product catalog cache
+CATALOG_CACHE_TTL = 300  # Seconds before the cached catalog is re-read regardless
+CATALOG_STAMP_PATH = None  # Shared invalidation stamp file (default: <instance path>/catalog.stamp)
+
+# Orders history pagination
+ORDERS_PAGE_SIZE = 50  # Orders per page / "load more" batch
+ORDERS_MAX_PAGE_SIZE = 200  # Upper bound for the page_size query parameter
+
+# Admin product list pagination
+PRODUCTS_PAGE_SIZE = 60  # Products sent with the page / per "load more" batch
+PRODUCTS_MAX_PAGE_SIZE = 200  # Upper bound for the page_size query parameter
+
+# Live order events (Server-Sent Events)
+EVENTS_SPOOL_PATH = None  # Shared file for fan-out across worker processes, e.g. 'instance/events.log'
+EVENTS_SPOOL_MAX_BYTES = 1024 * 1024  # Rotate the spool file past this size
+EVENTS_KEEPALIVE = 15  # Seconds between keepalive comments on an idle stream
@@ -3,146 +3,21 @@ Database initialization and utility functions for Bakery Management System
 """
 import pyodbc
 import datetime
-from werkzeug.security import generate_password_hash
-from flask import current_app as app
 
-def get_db_connection():
-    """
-    Establish a connection to the database.
-    Tries Windows Authentication first, then falls back to SQL Server Authentication.
-    """
-    try:
-        # Try Windows Authentication first with master database
-        conn_str = (f'DRIVER={app.config["SQL_SERVER_DRIVER"]};'
-                  f'SERVER={app.config["SQL_SERVER"]};'
-                  f'DATABASE=master;'
-                  f'Trusted_Connection=yes;')
-        conn = pyodbc.connect(conn_str)
-        
-        # Create the BMS database if it doesn't exist
-        cursor = conn.cursor()
-        cursor.execute("IF NOT EXISTS (SELECT * FROM sys.databases WHERE name = 'BMS') CREATE DATABASE BMS")
-        conn.commit()
-        conn.close()
-        
-        # Now connect to the BMS database
-        conn_str = (f'DRIVER={app.config["SQL_SERVER_DRIVER"]};'
-                  f'SERVER={app.config["SQL_SERVER"]};'
-                  f'DATABASE={app.config["DATABASE"]};'
-                  f'Trusted_Connection=yes;')
-        conn = pyodbc.connect(conn_str)
-        return conn
-    except:
-        try:
-            # Try SQL Server Authentication with master database first
-            conn_str = (f'DRIVER={app.config["SQL_SERVER_DRIVER"]};'
-                      f'SERVER={app.config["SQL_SERVER"]};'
-                      f'DATABASE=master;'
-                      f'UID={app.config["SQL_USERNAME"]};'
-                      f'PWD={app.config["SQL_PASSWORD"]};')
-            conn = pyodbc.connect(conn_str)
-            
-            # Create the BMS database if it doesn't exist
-            cursor = conn.cursor()
-            cursor.execute("IF NOT EXISTS (SELECT * FROM sys.databases WHERE name = 'BMS') CREATE DATABASE BMS")
-            conn.commit()
-            conn.close()
-            
-            # Now connect to the BMS database
-            conn_str = (f'DRIVER={app.config["SQL_SERVER_DRIVER"]};'
-                      f'SERVER={app.config["SQL_SERVER"]};'
-                      f'DATABASE={app.config["DATABASE"]};'
-                      f'UID={app.config["SQL_USERNAME"]};'
-                      f'PWD={app.config["SQL_PASSWORD"]};')
-            conn = pyodbc.connect(conn_str)
-            return conn
-        except pyodbc.Error as e:
-            print(f"Database connection error: {str(e)}")
-            raise
+from db_pool import get_db_connection
+from migrations import migrate
+from order_ids import next_order_id
+from sales_rollup import record_sale_statement
 
 def init_db():
     """
-    Initialize the database with required tables if they don't exist
+    Initialize the database by applying any pending migrations
+    (see migrations.py for the schema)
     """
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Create users table
-    cursor.execute('''
-    IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'users')
-    CREATE TABLE users (
-        id INT IDENTITY(1,1) PRIMARY KEY,
-        username NVARCHAR(50) NOT NULL UNIQUE,
-        password NVARCHAR(255) NOT NULL,
-        role NVARCHAR(20) NOT NULL
-    )
-    ''')
-    
-    # Create products table
-    cursor.execute('''
-    IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'products')
-    CREATE TABLE products (
-        id INT IDENTITY(1,1) PRIMARY KEY,
-        name NVARCHAR(100) NOT NULL,
-        quantity INT NOT NULL,
-        price DECIMAL(10, 2) NOT NULL,
-        image NVARCHAR(255)
-    )
-    ''')
-    
-    # Create orders table
-    cursor.execute('''
-    IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'orders')
-    CREATE TABLE orders (
-        id INT IDENTITY(1,1) PRIMARY KEY,
-        order_id NVARCHAR(50) NOT NULL UNIQUE,
-        customer_name NVARCHAR(100) NOT NULL,
-        total_price DECIMAL(10, 2) NOT NULL,
-        order_date DATETIME NOT NULL
-    )
-    ''')
-    
-    # Create order_items table
-    cursor.execute('''
-    IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'order_items')
-    CREATE TABLE order_items (
-        id INT IDENTITY(1,1) PRIMARY KEY,
-        order_id NVARCHAR(50) NOT NULL,
-        product_id INT NOT NULL,
-        quantity INT NOT NULL,
-        price DECIMAL(10, 2) NOT NULL,
-        FOREIGN KEY (order_id) REFERENCES orders(order_id),
-        FOREIGN KEY (product_id) REFERENCES products(id)
-    )
-    ''')
-    
-    # Check if default admin user exists, if not create it
-    cursor.execute("SELECT COUNT(*) FROM users WHERE username = 'admin'")
-    if cursor.fetchone()[0] == 0:
-        password_hash = generate_password_hash('admin123')
-        cursor.execute('INSERT INTO users (username, password, role) VALUES (?, ?, ?)', 
-                     ('admin', password_hash, 'admin'))
-    
-    # Check if default manager user exists, if not create it
-    cursor.execute("SELECT COUNT(*) FROM users WHERE username = 'manager'")
-    if cursor.fetchone()[0] == 0:
-        password_hash = generate_password_hash('manager123')
-        cursor.execute('INSERT INTO users (username, password, role) VALUES (?, ?, ?)', 
-                     ('manager', password_hash, 'manager'))
-    
-    conn.commit()
+    migrate(conn)
     conn.close()
 
-def generate_order_id():
-    """
-    Generate a unique order ID based on current timestamp
-    """
-    timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
-    # Add some randomness to ensure uniqueness
-    import random
-    random_suffix = ''.join(random.choices('ABCDEFGHIJKLMNOPQRSTUVWXYZ', k=5))
-    return f"{timestamp}{random_suffix}"
-
 def get_all_products():
     """
     Get all products from the database
@@ -241,9 +116,8 @@ def create_order(customer_name, order_items):
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # Generate order ID
-    order_id = generate_order_id()
     order_date = datetime.datetime.now()
+    order_id = next_order_id(conn, order_date)
     
     # Calculate total price
     total_price = sum(item['price'] for item in order_items)
@@ -261,6 +135,9 @@ def create_order(customer_name, order_items):
             (order_id, item['product_id'], item['quantity'], item['price'])
         )
     
+    # Keep the dashboard rollup in step
+    cursor.execute(*record_sale_statement({'order_date': order_date, 'total_price': total_price}))
+    
     conn.commit()
     conn.close()
     
@@ -0,0 +1,362 @@
+"""
+Connection pooling for the Bakery Management System
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pyodbc
+from flask import current_app, g
+
+
+class PoolTimeout(Exception):
+    """
+    Raised when no connection could be checked out within the pool timeout
+    """
+
+
+def _connection_strings(config, database):
+    """
+    Connection strings to try, in order: Windows Authentication first,
+    then SQL Server Authentication
+    """
+    return [
+        (f'DRIVER={config["SQL_SERVER_DRIVER"]};'
+         f'SERVER={config["SQL_SERVER"]};'
+         f'DATABASE={database};'
+         f'Trusted_Connection=yes;'),
+        (f'DRIVER={config["SQL_SERVER_DRIVER"]};'
+         f'SERVER={config["SQL_SERVER"]};'
+         f'DATABASE={database};'
+         f'UID={config["SQL_USERNAME"]};'
+         f'PWD={config["SQL_PASSWORD"]};'),
+    ]
+
+
+def _connect_first(conn_strs):
+    """
+    Open a connection using the first connection string that works.
+    Returns (connection, index of the string that worked).
+    """
+    last_error = None
+    for index, conn_str in enumerate(conn_strs):
+        try:
+            return pyodbc.connect(conn_str), index
+        except pyodbc.Error as e:
+            last_error = e
+    print(f"Database connection error: {str(last_error)}")
+    raise last_error
+
+
+def ensure_database(config):
+    """
+    Create the application database if it doesn't exist.
+    Runs once per pool instead of once per request.
+    """
+    conn, auth_index = _connect_first(_connection_strings(config, 'master'))
+    try:
+        # CREATE DATABASE can't run inside a transaction
+        conn.autocommit = True
+        database = config['DATABASE']
+        cursor = conn.cursor()
+        cursor.execute(f"IF NOT EXISTS (SELECT * FROM sys.databases WHERE name = '{database}') "
+                       f"CREATE DATABASE [{database}]")
+    finally:
+        conn.close()
+    return auth_index
+
+
+class PooledConnection:
+    """
+    Wrapper around a pyodbc connection that hands the connection back
+    to its pool on close() instead of tearing down the socket
+    """
+
+    def __init__(self, pool, raw, created_at=None):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_raw', raw)
+        object.__setattr__(self, '_created_at', created_at or time.monotonic())
+        object.__setattr__(self, '_returned', True)
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise pyodbc.ProgrammingError('Attempt to use a connection that was returned to the pool')
+        return getattr(self._raw, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._raw, name, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def closed(self):
+        return self._returned
+
+    def close(self):
+        if not self._returned:
+            self._pool.release(self)
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of pyodbc connections with bounded size, checkout
+    timeouts and health checks on borrow
+    """
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=10.0,
+                 health_check=True, recycle=None):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.timeout = timeout
+        self.health_check = health_check
+        self.recycle = recycle
+        self.pid = os.getpid()
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+
+        self._checkouts = 0
+        self._timeouts = 0
+        self._opened = 0
+        self._discarded = 0
+        self._failed_health_checks = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+        for _ in range(min(self.min_size, self.max_size)):
+            self._idle.append(self._open())
+
+    def _open(self):
+        conn = PooledConnection(self, self._connect())
+        with self._cond:
+            self._size += 1
+            self._opened += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn._raw.close()
+        except pyodbc.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._discarded += 1
+            self._cond.notify()
+
+    def _is_healthy(self, conn):
+        if self.recycle and time.monotonic() - conn._created_at > self.recycle:
+            return False
+        if not self.health_check:
+            return True
+        try:
+            cursor = conn._raw.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except pyodbc.Error:
+            with self._cond:
+                self._failed_health_checks += 1
+            return False
+
+    def acquire(self, timeout=None):
+        """
+        Check a connection out of the pool, opening a new one if the pool
+        has room. Raises PoolTimeout if none frees up in time.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            conn = None
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f'No database connection available after {timeout:.1f}s '
+                            f'({self._in_use} in use, max {self.max_size})')
+                    self._cond.wait(remaining)
+
+                if self._idle:
+                    conn = self._idle.pop()
+                else:
+                    # Reserve the slot before connecting outside the lock
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = PooledConnection(self, self._connect())
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._opened += 1
+            elif not self._is_healthy(conn):
+                self._discard(conn)
+                continue
+
+            waited = time.monotonic() - started
+            with self._cond:
+                self._in_use += 1
+                self._checkouts += 1
+                self._total_wait += waited
+                self._max_wait = max(self._max_wait, waited)
+            object.__setattr__(conn, '_returned', False)
+            return conn
+
+    def release(self, conn):
+        """
+        Return a connection to the pool, rolling back anything left uncommitted
+        """
+        # Detach the caller's wrapper so a stale reference can't reach the
+        # connection once someone else has borrowed it
+        stale = conn
+        conn = PooledConnection(self, stale._raw, stale._created_at)
+        object.__setattr__(stale, '_raw', None)
+        object.__setattr__(stale, '_returned', True)
+        with self._cond:
+            self._in_use -= 1
+
+        try:
+            conn._raw.rollback()
+            if conn._raw.autocommit:
+                conn._raw.autocommit = False
+        except pyodbc.Error:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            if self._closed or os.getpid() != self.pid:
+                keep = False
+            else:
+                keep = True
+                self._idle.append(conn)
+                self._cond.notify()
+        if not keep:
+            self._discard(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection outside of a request (background jobs, CLI)
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def close(self):
+        """
+        Close every idle connection; checked-out ones are closed on release
+        """
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self):
+        """
+        Snapshot of pool metrics
+        """
+        with self._cond:
+            return {
+                'size': self._size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'opened': self._opened,
+                'discarded': self._discarded,
+                'failed_health_checks': self._failed_health_checks,
+                'total_wait_seconds': round(self._total_wait, 6),
+                'avg_wait_ms': round(self._total_wait / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                'max_wait_ms': round(self._max_wait * 1000, 3),
+            }
+
+
+def create_pool(config):
+    """
+    Build a connection pool from the Flask config
+    """
+    auth_index = ensure_database(config)
+    conn_strs = _connection_strings(config, config['DATABASE'])
+    # Start with whichever authentication mode worked for master
+    conn_strs = conn_strs[auth_index:] + conn_strs[:auth_index]
+
+    def connect():
+        conn, _ = _connect_first(conn_strs)
+        return conn
+
+    return ConnectionPool(
+        connect,
+        min_size=config.get('DB_POOL_MIN_SIZE', 1),
+        max_size=config.get('DB_POOL_MAX_SIZE', 10),
+        timeout=config.get('DB_POOL_TIMEOUT', 10),
+        health_check=config.get('DB_POOL_HEALTH_CHECK', True),
+        recycle=config.get('DB_POOL_RECYCLE'),
+    )
+
+
+_pool_lock = threading.Lock()
+
+
+def get_pool(app=None):
+    """
+    Get the pool for this app, creating it on first use.
+    A forked worker process gets its own pool.
+    """
+    app = app or current_app._get_current_object()
+    pool = app.extensions.get('db_pool')
+    if pool is None or pool.pid != os.getpid():
+        with _pool_lock:
+            pool = app.extensions.get('db_pool')
+            if pool is None or pool.pid != os.getpid():
+                pool = create_pool(app.config)
+                app.extensions['db_pool'] = pool
+    return pool
+
+
+def get_db_connection():
+    """
+    Get the connection checked out for the current app context.
+    The first call checks one out of the pool; it goes back to the pool
+    on close() or when the app context tears down.
+    """
+    conn = g.get('db_conn')
+    if conn is None or conn.closed:
+        conn = get_pool().acquire()
+        g.db_conn = conn
+    return conn
+
+
+def _return_connection(exception=None):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        conn.close()
+
+
+def init_pool(app):
+    """
+    Register per-request connection checkout/return on the app
+    """
+    app.teardown_appcontext(_return_connection)
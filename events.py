@@ -0,0 +1,198 @@
+"""
+Server-Sent Events for the admin pages.
+
+place_order publishes a small event after each committed order and every
+open dashboard / orders history page receives it over one long-lived
+/admin/events stream, so admins see new orders without polling.
+
+Within a process the EventBroker hands events straight to subscriber
+queues. With several worker processes set EVENTS_SPOOL_PATH: publishers
+append each event as a JSON line to that file and every process that has
+subscribers tails it, so an order placed on one worker reaches admins
+connected to any other.
+
+Each open stream holds a worker thread, so run with a threaded server
+(or enough workers) for the number of admins you expect.
+"""
+import json
+import os
+import queue
+import threading
+import time
+
+from flask import current_app
+
+
+class Subscription:
+    """
+    One connected client's queue of pending events
+    """
+
+    def __init__(self, maxsize=100):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.closed = False
+
+    def get(self, timeout):
+        """
+        Next event, or None if nothing arrived within timeout seconds
+        """
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBroker:
+    """
+    In-process fan-out of events to subscribers, optionally fed by a spool file
+    """
+
+    def __init__(self, spool_path=None, spool_max_bytes=1024 * 1024, poll_interval=0.5):
+        self.spool_path = spool_path
+        self.spool_max_bytes = spool_max_bytes
+        self.poll_interval = poll_interval
+        self.pid = os.getpid()
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._tailer = None
+
+    def subscribe(self):
+        subscription = Subscription()
+        with self._lock:
+            self._subscribers.add(subscription)
+            if self.spool_path and self._tailer is None:
+                self._tailer = threading.Thread(target=self._tail_spool, name='event-spool', daemon=True)
+                self._tailer.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.closed = True
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event_type, data):
+        """
+        Send an event to every subscriber, in this process or (with a spool) any other
+        """
+        event = {'type': event_type, 'data': data, 'time': time.time()}
+        if self.spool_path:
+            self._append_to_spool(event)
+        else:
+            self._dispatch(event)
+
+    def _dispatch(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                # A client that stopped reading - drop it rather than buffer forever
+                self.unsubscribe(subscription)
+
+    def _append_to_spool(self, event):
+        line = (json.dumps(event, default=str) + '\n').encode('utf-8')
+        os.makedirs(os.path.dirname(os.path.abspath(self.spool_path)), exist_ok=True)
+        try:
+            if os.path.getsize(self.spool_path) > self.spool_max_bytes:
+                # Tailers finish the renamed file through their open handle
+                os.replace(self.spool_path, self.spool_path + '.1')
+        except OSError:
+            pass
+        # A single O_APPEND write keeps lines from different workers whole
+        fd = os.open(self.spool_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def _wait_for_spool(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                return open(self.spool_path, 'rb')
+            except FileNotFoundError:
+                continue
+
+    def _tail_spool(self):
+        spool = None
+        pending = b''
+        while True:
+            if spool is None:
+                try:
+                    spool = open(self.spool_path, 'rb')
+                    # Only events published from now on
+                    spool.seek(0, os.SEEK_END)
+                except FileNotFoundError:
+                    # Nothing published yet - read the file from the start once it appears
+                    spool = self._wait_for_spool()
+                except OSError:
+                    time.sleep(self.poll_interval)
+                    continue
+
+            chunk = spool.read()
+            if chunk:
+                pending += chunk
+                *lines, pending = pending.split(b'\n')
+                for line in lines:
+                    try:
+                        self._dispatch(json.loads(line))
+                    except ValueError:
+                        continue
+                continue
+
+            # Caught up - switch files if the spool was rotated
+            try:
+                rotated = os.stat(self.spool_path).st_ino != os.fstat(spool.fileno()).st_ino
+            except OSError:
+                rotated = False
+            if rotated:
+                spool.close()
+                try:
+                    spool = open(self.spool_path, 'rb')
+                except FileNotFoundError:
+                    spool = self._wait_for_spool()
+                pending = b''
+                continue
+            time.sleep(self.poll_interval)
+
+
+def format_sse(event):
+    """
+    Encode an event for a text/event-stream response
+    """
+    return f"event: {event['type']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+
+def stream_events(broker, keepalive=15):
+    """
+    Generator for an SSE response; unsubscribes when the client goes away
+    """
+    subscription = broker.subscribe()
+    try:
+        yield 'retry: 5000\n\n'
+        while not subscription.closed:
+            event = subscription.get(timeout=keepalive)
+            # A comment line keeps proxies from closing an idle stream
+            yield format_sse(event) if event else ': keepalive\n\n'
+    finally:
+        broker.unsubscribe(subscription)
+
+
+_broker_lock = threading.Lock()
+
+
+def get_broker(app=None):
+    """
+    The app's event broker; a forked worker process gets its own
+    """
+    app = app or current_app._get_current_object()
+    broker = app.extensions.get('event_broker')
+    if broker is None or broker.pid != os.getpid():
+        with _broker_lock:
+            broker = app.extensions.get('event_broker')
+            if broker is None or broker.pid != os.getpid():
+                broker = EventBroker(app.config.get('EVENTS_SPOOL_PATH'),
+                                     app.config.get('EVENTS_SPOOL_MAX_BYTES', 1024 * 1024))
+                app.extensions['event_broker'] = broker
+    return broker
@@ -0,0 +1,172 @@
+"""
+Resized variants of uploaded product images.
+
+Uploads are stored as-is, often as large camera JPEGs, while the POS grid
+and product list only show them at 50-200px. After an upload a background
+worker writes a small "thumb" and a "medium" variant next to the original
+(WebP when Pillow supports it, JPEG otherwise) and records their filenames
+in products.image_variants; templates show the variant when there is one
+and the original otherwise.
+
+Pillow is optional: without it no variants are made and everything keeps
+using the original files. `flask images-backfill` processes existing uploads.
+"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from db_pool import get_db_connection
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    Image = None
+
+# Variant name -> longest side in pixels
+VARIANT_SIZES = {'thumb': 160, 'medium': 480}
+
+
+def variant_format():
+    """
+    (Pillow format, extension) for new variants, or None without Pillow
+    """
+    if Image is None:
+        return None
+    if features.check('webp'):
+        return 'WEBP', 'webp'
+    return 'JPEG', 'jpg'
+
+
+def variant_filename(filename, variant, extension):
+    stem = os.path.splitext(filename)[0]
+    return f'{stem}.{variant}.{extension}'
+
+
+def parse_variants(value):
+    """
+    Variant name -> filename from a products.image_variants value
+    """
+    if not value:
+        return {}
+    try:
+        variants = json.loads(value)
+    except ValueError:
+        return {}
+    return variants if isinstance(variants, dict) else {}
+
+
+def generate_variants(upload_dir, filename):
+    """
+    Write every variant of an uploaded image; returns variant name -> filename
+    """
+    image_format = variant_format()
+    if image_format is None:
+        return {}
+    pil_format, extension = image_format
+
+    # Content-addressed uploads are shared, so their variants may already exist
+    existing = {variant: variant_filename(filename, variant, extension) for variant in VARIANT_SIZES}
+    if all(os.path.exists(os.path.join(upload_dir, name)) for name in existing.values()):
+        return existing
+
+    variants = {}
+    with Image.open(os.path.join(upload_dir, filename)) as original:
+        # Phone photos carry their rotation in EXIF
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        if pil_format == 'JPEG' and image.mode == 'RGBA':
+            # JPEG has no alpha - flatten onto white
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[3])
+            image = background
+
+        for variant, size in VARIANT_SIZES.items():
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)
+            name = variant_filename(filename, variant, extension)
+            tmp_path = os.path.join(upload_dir, f'.{name}.{os.getpid()}.tmp')
+            if pil_format == 'WEBP':
+                resized.save(tmp_path, 'WEBP', quality=80, method=4)
+            else:
+                resized.save(tmp_path, 'JPEG', quality=82, optimize=True, progressive=True)
+            os.replace(tmp_path, os.path.join(upload_dir, name))
+            variants[variant] = name
+    return variants
+
+
+def remove_variants(upload_dir, variants):
+    for name in variants.values():
+        try:
+            os.remove(os.path.join(upload_dir, name))
+        except OSError:
+            pass
+
+
+def record_variants(conn, product_id, filename, variants):
+    """
+    Store the variants, unless the product's image changed in the meantime
+    """
+    cursor = conn.cursor()
+    # OUTPUT rather than rowcount, which reads -1 if the session has NOCOUNT on
+    cursor.execute('UPDATE products SET image_variants = ? OUTPUT INSERTED.id '
+                   'WHERE id = ? AND (image = ? OR image_filename = ?)',
+                   (json.dumps(variants), product_id, filename, filename))
+    updated = cursor.fetchone() is not None
+    conn.commit()
+    cursor.close()
+    return updated
+
+
+class ImageProcessor:
+    """
+    Runs variant generation on a background thread, off the request path
+    """
+
+    def __init__(self, app, workers=1):
+        self.app = app
+        self.pid = os.getpid()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-variants')
+
+    def submit(self, product_id, filename):
+        if variant_format() is None:
+            print("⚠️ Pillow is not installed - serving original product images")
+            return None
+        return self._executor.submit(self._process, product_id, filename)
+
+    def _process(self, product_id, filename):
+        # Imported here - catalog.py imports this module
+        from catalog import invalidate_catalog
+
+        upload_dir = self.app.config['UPLOAD_FOLDER']
+        try:
+            variants = generate_variants(upload_dir, filename)
+            with self.app.app_context():
+                # Skipped if the image was replaced before we finished; the
+                # files stay with their upload and are purged along with it
+                if record_variants(get_db_connection(), product_id, filename, variants):
+                    invalidate_catalog()
+            print(f"✅ Image variants for product {product_id}: {', '.join(variants.values())}")
+        except Exception as e:
+            print(f"❌ Could not make image variants for {filename}: {e}")
+
+
+_processor_lock = threading.Lock()
+
+
+def get_image_processor(app=None):
+    """
+    The app's background image processor; a forked worker process gets its own
+    """
+    app = app or current_app._get_current_object()
+    processor = app.extensions.get('image_processor')
+    if processor is None or processor.pid != os.getpid():
+        with _processor_lock:
+            processor = app.extensions.get('image_processor')
+            if processor is None or processor.pid != os.getpid():
+                processor = ImageProcessor(app, app.config.get('IMAGE_WORKERS', 1))
+                app.extensions['image_processor'] = processor
+    return processor
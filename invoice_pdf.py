@@ -0,0 +1,439 @@
+"""
+Invoice PDFs, rendered once per order and kept on disk.
+
+An order's invoice never changes after place_order commits it, so the
+rendered PDF is cached under the order id and INVOICE_TEMPLATE_VERSION
+(bump it whenever the layout below changes - old files then simply age
+out). The cache directory is bounded to PDF_CACHE_MAX_BYTES: every hit
+touches the file's mtime and the least recently used files are evicted
+once a new one takes the directory over budget. It is shared by all
+worker processes. Each one keeps a running total of the directory size
+and corrects it with a full scan every PDF_CACHE_RESCAN seconds.
+
+place_order warms the cache on a background thread, so the first
+download is usually already a hit.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+from flask import current_app
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+
+from order_service import get_order
+from pdf_render import render_pdf
+
+INVOICE_TEMPLATE_VERSION = 1
+
+
+@lru_cache(maxsize=1)
+def invoice_styles():
+    """
+    Paragraph styles for the invoice, built once per process
+    """
+    styles = getSampleStyleSheet()
+    return {
+        'Normal': styles['Normal'],
+        'title': ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            textColor=colors.darkblue,
+            alignment=1,  # Center alignment
+            spaceAfter=30
+        ),
+        'subtitle': ParagraphStyle(
+            'CustomSubtitle',
+            parent=styles['Heading2'],
+            fontSize=16,
+            textColor=colors.blue,
+            alignment=1,  # Center alignment
+            spaceAfter=20
+        ),
+        'discount': ParagraphStyle(
+            'DiscountMessage',
+            parent=styles['Normal'],
+            fontSize=12,
+            textColor=colors.green,
+            alignment=1,
+            spaceAfter=20
+        ),
+        'thank_you': ParagraphStyle(
+            'ThankYou',
+            parent=styles['Normal'],
+            fontSize=14,
+            alignment=1,  # Center alignment
+            textColor=colors.darkblue,
+            spaceAfter=10
+        ),
+    }
+
+
+def render_invoice_pdf(order_row, items_data):
+    """
+    The invoice PDF for an order, as bytes
+    """
+    # Totals were resolved by order_service.normalize_order
+    subtotal = order_row['subtotal_amount']
+    discount_applied = order_row['discount_applied']
+    discount_amount = order_row['discount_amount']
+    final_total = order_row['total_amount']
+
+    print(f"💰 PDF Totals - Subtotal: ${subtotal:.2f}, Discount: ${discount_amount:.2f}, Final: ${final_total:.2f}")
+
+    # Create PDF
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
+    styles = invoice_styles()
+
+    elements = []
+
+    # Title
+    elements.append(Paragraph("🍪 Sweet Delights Bakery", styles['title']))
+    elements.append(Paragraph("INVOICE", styles['subtitle']))
+    elements.append(Spacer(1, 20))
+
+    # Invoice info table
+    invoice_info_data = [
+        ['Invoice #:', order_row['order_id']],
+        ['Customer:', order_row['customer_name']],
+        ['Date:', order_row['order_date'].strftime('%B %d, %Y at %I:%M %p') if order_row['order_date'] else 'N/A'],
+        ['Payment:', (order_row['payment_method'] or 'Cash').title()]
+    ]
+
+    invoice_table = Table(invoice_info_data, colWidths=[1.5*inch, 4*inch])
+    invoice_table.setStyle(TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 11),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('ALIGN', (0, 0), (0, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+    ]))
+
+    elements.append(invoice_table)
+    elements.append(Spacer(1, 30))
+
+    # Items table header
+    items_header = [['Product', 'Qty', 'Unit Price', 'Total']]
+
+    # Items data
+    items_table_data = items_header.copy()
+
+    for item in items_data:
+        product_name = item['product_name'] or 'Unknown Product'
+        quantity = item['quantity']
+        unit_price = item['unit_price'] if item['unit_price'] else 0
+        total_price = item['total_price'] if item['total_price'] else 0
+
+        items_table_data.append([
+            product_name,
+            str(quantity),
+            f"${unit_price:.2f}",
+            f"${total_price:.2f}"
+        ])
+
+    # Create items table
+    items_table = Table(items_table_data, colWidths=[3.5*inch, 0.8*inch, 1*inch, 1*inch])
+    items_table.setStyle(TableStyle([
+        # Header styling
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+
+        # Body styling
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 10),
+        ('ALIGN', (0, 1), (0, -1), 'LEFT'),  # Product name left aligned
+        ('ALIGN', (1, 1), (-1, -1), 'CENTER'),  # Other columns centered
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ]))
+
+    elements.append(items_table)
+    elements.append(Spacer(1, 30))
+
+    # === ADD TOTAL AMOUNTS SECTION HERE ===
+    # Total section
+    total_data = [['Subtotal:', f"${subtotal:.2f}"]]
+
+    if discount_applied and discount_amount > 0:
+        total_data.append(['Discount (4%):', f"-${discount_amount:.2f}"])
+
+    total_data.append(['TOTAL AMOUNT:', f"${final_total:.2f}"])
+
+    total_table = Table(total_data, colWidths=[2.5*inch, 1.5*inch])
+    total_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+        ('FONTNAME', (0, 0), (-1, -2), 'Helvetica'),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -2), 11),
+        ('FONTSIZE', (0, -1), (-1, -1), 14),
+        ('TEXTCOLOR', (0, -1), (-1, -1), colors.darkblue),
+        ('LINEABOVE', (0, -1), (-1, -1), 2, colors.black),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+        # Add background color for discount row if applicable
+        ('BACKGROUND', (0, 1), (-1, 1), colors.lightgreen) if discount_applied and discount_amount > 0 and len(total_data) > 2 else ('BACKGROUND', (0, 0), (0, 0), colors.white),
+    ]))
+
+    # Right align the total table
+    total_table_container = Table([[total_table]], colWidths=[6.5*inch])
+    total_table_container.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+    ]))
+
+    elements.append(total_table_container)
+    elements.append(Spacer(1, 30))
+
+    # Discount message if applicable
+    if discount_applied and discount_amount > 0:
+        discount_msg = Paragraph(
+            f"🎉 <b>Congratulations!</b> You saved ${discount_amount:.2f} with our 4% discount on orders over $150!",
+            styles['discount']
+        )
+        elements.append(discount_msg)
+        elements.append(Spacer(1, 20))
+
+    # Thank you message
+    elements.append(Paragraph("Thank you for your business!", styles['thank_you']))
+    elements.append(Paragraph("Sweet Delights Bakery - Where every bite is a delight!", styles['Normal']))
+
+    # Build PDF
+    print("📄 Building PDF document...")
+    doc.build(elements)
+
+    return buffer.getvalue()
+
+
+class _RenderFlight:
+    """
+    An order's render in progress: its lock, how many callers are waiting
+    on it and, once settled, the resulting path (None for no such order)
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiters = 0
+        self.done = False
+        self.path = None
+
+
+class PdfCache:
+    """
+    Size-bounded LRU directory of rendered PDFs
+    """
+
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024, version=INVOICE_TEMPLATE_VERSION,
+                 rescan_interval=300):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = version
+        self.rescan_interval = rescan_interval
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        # Directory size as of the last scan plus what this process stored
+        # since; None until the first scan
+        self._size = None
+        self._scanned_at = 0
+        # One render at a time per order within this process
+        self._renders = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, order_id):
+        # Order ids come from the URL - keep the filename safe and unambiguous
+        safe = re.sub(r'[^A-Za-z0-9_-]', '_', order_id)[:80]
+        digest = hashlib.sha1(order_id.encode('utf-8')).hexdigest()[:8]
+        return os.path.join(self.directory, f'{safe}-{digest}.v{self.version}.pdf')
+
+    def get(self, order_id):
+        """
+        Path of the cached PDF, or None on a miss
+        """
+        path = self.path(order_id)
+        try:
+            # Mark as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def put(self, order_id, pdf):
+        path = self.path(order_id)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(pdf)
+        try:
+            replaced = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(tmp_path, path)
+        with self._lock:
+            # Other processes store files too, so rescan now and then
+            stale = self._size is None or time.monotonic() - self._scanned_at > self.rescan_interval
+            if not stale:
+                self._size += len(pdf) - replaced
+            over_budget = stale or self._size > self.max_bytes
+        if over_budget:
+            self.evict()
+        return path
+
+    def evict(self):
+        """
+        Scan the directory and remove least recently used PDFs until it fits max_bytes
+        """
+        # The walk runs without self._lock so hits and stores never wait on
+        # it; one thread at a time walks, the others leave it to that one
+        if not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            entries = []
+            total = 0
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.name.endswith('.pdf'):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+            evicted = 0
+            if total > self.max_bytes:
+                entries.sort()
+                for _, size, path in entries:
+                    if total <= self.max_bytes:
+                        break
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    evicted += 1
+            with self._lock:
+                self._size = total
+                self._scanned_at = time.monotonic()
+                self.evictions += evicted
+        finally:
+            self._evict_lock.release()
+
+    def get_or_render(self, order_id):
+        """
+        Path of the order's PDF, rendering it on a miss; None if the order doesn't exist
+        """
+        path = self.get(order_id)
+        if path:
+            return path
+        with self._lock:
+            flight = self._renders.get(order_id)
+            if flight is None:
+                flight = self._renders[order_id] = _RenderFlight()
+            flight.waiters += 1
+        try:
+            with flight.lock:
+                # Whoever held the lock before us already settled it
+                if flight.done:
+                    return flight.path
+                path = self.get(order_id)
+                if path is None:
+                    invoice = get_order(order_id)
+                    if invoice is not None:
+                        order_row, items_data = invoice
+                        # Built in a PDF worker process, not on this thread
+                        pdf = render_pdf({'kind': 'invoice', 'order': order_row, 'items': items_data})
+                        path = self.put(order_id, pdf)
+                flight.path, flight.done = path, True
+                return path
+        finally:
+            with self._lock:
+                flight.waiters -= 1
+                # Only the last one out removes it, so later callers can't
+                # get a second lock while others still wait on this one
+                if not flight.waiters:
+                    del self._renders[order_id]
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'version': self.version,
+            'max_bytes': self.max_bytes,
+            'size': self._size,
+        }
+
+
+_cache_lock = threading.Lock()
+
+
+def get_pdf_cache(app=None):
+    app = app or current_app._get_current_object()
+    cache = app.extensions.get('pdf_cache')
+    if cache is None:
+        with _cache_lock:
+            cache = app.extensions.get('pdf_cache')
+            if cache is None:
+                directory = app.config.get('PDF_CACHE_DIR') or os.path.join(app.instance_path, 'invoices')
+                cache = PdfCache(directory, app.config.get('PDF_CACHE_MAX_BYTES', 200 * 1024 * 1024),
+                                 rescan_interval=app.config.get('PDF_CACHE_RESCAN', 300))
+                app.extensions['pdf_cache'] = cache
+    return cache
+
+
+class InvoiceWarmer:
+    """
+    Renders new orders' invoices on a background thread, off the request path
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.pid = os.getpid()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='invoice-warmer')
+
+    def submit(self, order_id):
+        return self._executor.submit(self._warm, order_id)
+
+    def _warm(self, order_id):
+        try:
+            with self.app.app_context():
+                get_pdf_cache(self.app).get_or_render(order_id)
+        except Exception as e:
+            print(f"⚠️ Could not pre-render invoice {order_id}: {e}")
+
+
+_warmer_lock = threading.Lock()
+
+
+def warm_invoice(order_id, app=None):
+    """
+    Queue a background render of an order's invoice (after its commit)
+    """
+    app = app or current_app._get_current_object()
+    if not app.config.get('PDF_CACHE_WARM', True):
+        return None
+    warmer = app.extensions.get('invoice_warmer')
+    if warmer is None or warmer.pid != os.getpid():
+        with _warmer_lock:
+            warmer = app.extensions.get('invoice_warmer')
+            if warmer is None or warmer.pid != os.getpid():
+                warmer = InvoiceWarmer(app)
+                app.extensions['invoice_warmer'] = warmer
+    return warmer.submit(order_id)
@@ -0,0 +1,487 @@
+"""
+Versioned schema migrations for the Bakery Management System.
+
+This module is the single definition of the database schema. Each migration
+has a number; the applied ones are recorded in schema_migrations, so startup
+is one version check and only missing migrations run, each inside its own
+transaction.
+
+To change the schema, append a migration - never edit one that has shipped.
+"""
+import threading
+
+from flask import current_app
+from werkzeug.security import generate_password_hash
+
+from db_pool import get_db_connection
+from schema import get_schema
+
+MIGRATION_LOCK = 'bms_schema_migrations'
+
+
+class Migration:
+    """
+    A numbered schema change: SQL statements and/or a Python step
+    """
+
+    def __init__(self, version, description, statements=(), run=None):
+        self.version = version
+        self.description = description
+        self.statements = statements
+        self.run = run
+
+    def apply(self, cursor):
+        for statement in self.statements:
+            cursor.execute(statement)
+        if self.run:
+            self.run(cursor)
+
+
+def _add_column(table, column, definition):
+    return (f"IF NOT EXISTS (SELECT * FROM sys.columns WHERE object_id = OBJECT_ID('{table}') AND name = '{column}')\n"
+            f"    ALTER TABLE {table} ADD {column} {definition}")
+
+
+def _create_index(name, table, columns, include=()):
+    statement = (f"IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = '{name}' AND object_id = OBJECT_ID('{table}'))\n"
+                 f"    CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+    if include:
+        statement += f" INCLUDE ({', '.join(include)})"
+    return statement
+
+
+def _seed_admin(cursor):
+    # Default admin account for a fresh install
+    cursor.execute("SELECT COUNT(*) FROM users WHERE username = 'admin'")
+    if cursor.fetchone()[0] == 0:
+        password_hash = generate_password_hash('admin123')
+        cursor.execute('INSERT INTO users (username, password, role) VALUES (?, ?, ?)',
+                       ('admin', password_hash, 'admin'))
+
+
+MIGRATIONS = [
+    Migration(1, 'Create base tables', [
+        """
+        IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'users')
+        CREATE TABLE users (
+            id INT IDENTITY(1,1) PRIMARY KEY,
+            username NVARCHAR(100) NOT NULL UNIQUE,
+            password NVARCHAR(255) NOT NULL,
+            role NVARCHAR(50) NOT NULL
+        )
+        """,
+        """
+        IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'products')
+        CREATE TABLE products (
+            id INT IDENTITY(1,1) PRIMARY KEY,
+            name NVARCHAR(255) NOT NULL,
+            quantity NVARCHAR(100) NOT NULL,
+            price DECIMAL(10,2) NOT NULL,
+            image NVARCHAR(255),
+            image_filename NVARCHAR(255),
+            category NVARCHAR(50) DEFAULT 'General',
+            active BIT DEFAULT 1
+        )
+        """,
+        """
+        IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'orders')
+        CREATE TABLE orders (
+            id INT IDENTITY(1,1) PRIMARY KEY,
+            order_id NVARCHAR(50) NOT NULL UNIQUE,
+            customer_name NVARCHAR(255) NOT NULL,
+            customer_email NVARCHAR(255),
+            customer_phone NVARCHAR(50),
+            subtotal_amount DECIMAL(10,2) DEFAULT 0,
+            discount_applied BIT DEFAULT 0,
+            discount_amount DECIMAL(10,2) DEFAULT 0,
+            total_amount DECIMAL(10,2) NOT NULL,
+            total_price DECIMAL(10,2) NOT NULL,
+            payment_method NVARCHAR(50),
+            order_date DATETIME NOT NULL,
+            created_by INT
+        )
+        """,
+        """
+        IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'order_items')
+        CREATE TABLE order_items (
+            id INT IDENTITY(1,1) PRIMARY KEY,
+            order_id NVARCHAR(50) NOT NULL,
+            product_id INT NOT NULL,
+            product_name NVARCHAR(255),
+            quantity INT NOT NULL,
+            unit_price DECIMAL(10,2) NOT NULL,
+            total_price DECIMAL(10,2) NOT NULL,
+            price DECIMAL(10,2) NOT NULL
+        )
+        """,
+    ]),
+    # Databases created from db.py or 'SQL Querires.txt' predate these columns
+    Migration(2, 'Add columns missing from older databases', [
+        _add_column('orders', 'subtotal_amount', 'DECIMAL(10,2) DEFAULT 0'),
+        _add_column('orders', 'discount_applied', 'BIT DEFAULT 0'),
+        _add_column('orders', 'discount_amount', 'DECIMAL(10,2) DEFAULT 0'),
+        _add_column('orders', 'customer_email', 'NVARCHAR(255)'),
+        _add_column('orders', 'customer_phone', 'NVARCHAR(50)'),
+        _add_column('orders', 'payment_method', 'NVARCHAR(50)'),
+        _add_column('orders', 'created_by', 'INT'),
+        _add_column('order_items', 'product_name', 'NVARCHAR(255)'),
+        _add_column('order_items', 'unit_price', 'DECIMAL(10,2) NOT NULL DEFAULT 0'),
+        _add_column('order_items', 'total_price', 'DECIMAL(10,2) NOT NULL DEFAULT 0'),
+        _add_column('products', 'image_filename', 'NVARCHAR(255)'),
+        _add_column('products', 'category', "NVARCHAR(50) DEFAULT 'General'"),
+        _add_column('products', 'active', 'BIT DEFAULT 1'),
+    ]),
+    Migration(3, 'Seed default admin user', run=_seed_admin),
+    # Indexes for the order lookups, history/dashboard date scans and the
+    # product listings; see plan_check.py for the queries they serve
+    Migration(4, 'Add order and product indexes', [
+        _create_index('IX_order_items_order_id', 'order_items', ['order_id'],
+                      include=['product_id', 'product_name', 'quantity', 'unit_price', 'total_price', 'price']),
+        _create_index('IX_orders_order_date', 'orders', ['order_date'],
+                      include=['total_price', 'total_amount']),
+        _create_index('IX_products_active_name', 'products', ['active', 'name'],
+                      include=['price', 'quantity', 'image', 'image_filename', 'category']),
+        _create_index('IX_products_category_name', 'products', ['category', 'name'],
+                      include=['active', 'price', 'quantity', 'image']),
+    ]),
+    # Keyset pagination of the order history orders by (order_date, order_id)
+    Migration(5, 'Index orders by date and order id', [
+        _create_index('IX_orders_order_date_order_id', 'orders', ['order_date', 'order_id'],
+                      include=['total_price', 'total_amount']),
+        "DROP INDEX IF EXISTS IX_orders_order_date ON orders",
+    ]),
+    # Admin order search (order_search.py): each filter can seek one of these,
+    # and the INCLUDE lists cover the remaining predicates and result columns
+    Migration(6, 'Index orders for filtered search', [
+        """
+        CREATE INDEX IX_orders_order_date_order_id ON orders (order_date, order_id)
+        INCLUDE (total_price, total_amount, customer_name, payment_method, discount_applied, discount_amount)
+        WITH (DROP_EXISTING = ON)
+        """,
+        _create_index('IX_orders_payment_method_date', 'orders', ['payment_method', 'order_date', 'order_id'],
+                      include=['customer_name', 'total_amount', 'total_price', 'discount_applied', 'discount_amount']),
+        _create_index('IX_orders_customer_name_date', 'orders', ['customer_name', 'order_date', 'order_id'],
+                      include=['payment_method', 'total_amount', 'total_price', 'discount_applied', 'discount_amount']),
+    ]),
+    # Dashboard sales rollup (sales_rollup.py), backfilled from existing orders
+    Migration(7, 'Add sales rollup tables', [
+        """
+        IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'sales_daily')
+        CREATE TABLE sales_daily (
+            sales_date DATE PRIMARY KEY,
+            order_count INT NOT NULL DEFAULT 0,
+            revenue DECIMAL(14,2) NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'sales_totals')
+        CREATE TABLE sales_totals (
+            id INT PRIMARY KEY CHECK (id = 1),
+            order_count INT NOT NULL DEFAULT 0,
+            revenue DECIMAL(14,2) NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        IF NOT EXISTS (SELECT * FROM sales_totals)
+        INSERT INTO sales_totals (id, order_count, revenue)
+            SELECT 1, COUNT(*), ISNULL(SUM(total_price), 0) FROM orders
+        """,
+        """
+        IF NOT EXISTS (SELECT * FROM sales_daily)
+        INSERT INTO sales_daily (sales_date, order_count, revenue)
+            SELECT CAST(order_date AS DATE), COUNT(*), ISNULL(SUM(total_price), 0)
+            FROM orders GROUP BY CAST(order_date AS DATE)
+        """,
+    ]),
+    # Catalog versions for /api/catalog delta sync (catalog.py): SQL Server
+    # bumps row_version on every insert/update of a product
+    Migration(8, 'Add products row version', [
+        _add_column('products', 'row_version', 'ROWVERSION'),
+        _create_index('IX_products_row_version', 'products', ['row_version'],
+                      include=['name', 'price', 'image', 'image_filename', 'category', 'active']),
+    ]),
+    # Resized image filenames as JSON (image_variants.py)
+    Migration(9, 'Add products image variants', [
+        _add_column('products', 'image_variants', 'NVARCHAR(1000)'),
+    ]),
+    # Reference-counted upload blobs (upload_store.py); existing uploads are
+    # counted from the active products that use them (nothing would ever
+    # release a deleted product's reference)
+    Migration(10, 'Add upload blob reference counts', [
+        """
+        IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'upload_blobs')
+        CREATE TABLE upload_blobs (
+            name NVARCHAR(255) PRIMARY KEY,
+            size BIGINT,
+            ref_count INT NOT NULL DEFAULT 0,
+            created_at DATETIME NOT NULL DEFAULT GETDATE(),
+            released_at DATETIME
+        )
+        """,
+        """
+        INSERT INTO upload_blobs (name, ref_count)
+        SELECT name, COUNT(*) FROM (
+            SELECT image AS name FROM products WHERE COALESCE(active, 1) = 1
+            UNION ALL
+            SELECT image_filename FROM products
+            WHERE COALESCE(active, 1) = 1 AND (image_filename <> image OR image IS NULL)
+        ) refs
+        WHERE name IS NOT NULL AND name <> ''
+            AND name NOT IN (SELECT name FROM upload_blobs)
+        GROUP BY name
+        """,
+    ]),
+    # Units on hand, decremented by place_order (stock.py); NULL = not
+    # tracked. Products whose quantity text is a plain number start with it.
+    Migration(11, 'Add products stock on hand', [
+        _add_column('products', 'stock', 'INT NULL'),
+        """
+        IF NOT EXISTS (SELECT * FROM sys.check_constraints WHERE name = 'CK_products_stock')
+            ALTER TABLE products ADD CONSTRAINT CK_products_stock CHECK (stock IS NULL OR stock >= 0)
+        """,
+        """
+        UPDATE products SET stock = TRY_CAST(quantity AS INT)
+        WHERE stock IS NULL AND TRY_CAST(quantity AS INT) >= 0
+        """,
+    ]),
+    # Order numbers, reserved in blocks per worker process (order_ids.py)
+    Migration(12, 'Add order number sequence', [
+        """
+        IF NOT EXISTS (SELECT * FROM sys.sequences WHERE name = 'order_number_seq')
+            CREATE SEQUENCE dbo.order_number_seq AS BIGINT START WITH 1 INCREMENT BY 1
+        """,
+    ]),
+    # Stripe each day of the sales rollup over several rows so concurrent
+    # orders don't all wait on one row lock; all-time totals are now summed
+    # from sales_daily, so the single sales_totals row goes
+    Migration(13, 'Stripe the sales rollup by bucket', [
+        _add_column('sales_daily', 'bucket', 'TINYINT NOT NULL DEFAULT 0'),
+        """
+        DECLARE @pk SYSNAME = (SELECT name FROM sys.key_constraints
+                               WHERE parent_object_id = OBJECT_ID('sales_daily') AND type = 'PK');
+        IF @pk IS NOT NULL AND @pk <> 'PK_sales_daily'
+            EXEC('ALTER TABLE sales_daily DROP CONSTRAINT ' + @pk)
+        """,
+        """
+        IF NOT EXISTS (SELECT * FROM sys.key_constraints WHERE name = 'PK_sales_daily')
+            ALTER TABLE sales_daily ADD CONSTRAINT PK_sales_daily PRIMARY KEY (sales_date, bucket)
+        """,
+        "DROP TABLE IF EXISTS sales_totals",
+    ]),
+    # Stock moves out of products: selling must not bump products.row_version,
+    # the catalog's delta-sync version. A product with no row isn't tracked.
+    Migration(14, 'Move stock on hand to product_stock', [
+        """
+        IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'product_stock')
+        CREATE TABLE product_stock (
+            product_id INT PRIMARY KEY,
+            on_hand INT NOT NULL,
+            CONSTRAINT CK_product_stock_on_hand CHECK (on_hand >= 0),
+            CONSTRAINT FK_product_stock_products FOREIGN KEY (product_id) REFERENCES products (id) ON DELETE CASCADE
+        )
+        """,
+        """
+        IF COL_LENGTH('products', 'stock') IS NOT NULL
+            EXEC('INSERT INTO product_stock (product_id, on_hand)
+                  SELECT id, stock FROM products
+                  WHERE stock IS NOT NULL AND id NOT IN (SELECT product_id FROM product_stock)')
+        """,
+        """
+        IF EXISTS (SELECT * FROM sys.check_constraints WHERE name = 'CK_products_stock')
+            ALTER TABLE products DROP CONSTRAINT CK_products_stock
+        """,
+        """
+        IF COL_LENGTH('products', 'stock') IS NOT NULL
+            ALTER TABLE products DROP COLUMN stock
+        """,
+    ]),
+    # The POS catalog (catalog.catalog_query) and the admin product list
+    # (product_page.py) also read image_variants and image_filename; widen
+    # both product indexes so they cover those queries
+    Migration(15, 'Cover the product listings with the product indexes', [
+        """
+        CREATE INDEX IX_products_active_name ON products (active, name)
+        INCLUDE (price, quantity, image, image_filename, category, image_variants)
+        WITH (DROP_EXISTING = ON)
+        """,
+        """
+        CREATE INDEX IX_products_category_name ON products (category, name)
+        INCLUDE (active, price, quantity, image, image_filename, image_variants)
+        WITH (DROP_EXISTING = ON)
+        """,
+    ]),
+    # Summing every sales_daily row for the all-time figures grows with each
+    # day of trading; keep them in a fixed set of striped totals rows
+    # (one per sales_rollup.SALES_BUCKETS), backfilled into bucket 0
+    Migration(16, 'Add striped sales totals', [
+        """
+        IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'sales_totals')
+        CREATE TABLE sales_totals (
+            bucket TINYINT PRIMARY KEY,
+            order_count INT NOT NULL DEFAULT 0,
+            revenue DECIMAL(14,2) NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        IF NOT EXISTS (SELECT * FROM sales_totals)
+        INSERT INTO sales_totals (bucket, order_count, revenue)
+            SELECT b.bucket, CASE WHEN b.bucket = 0 THEN o.order_count ELSE 0 END,
+                   CASE WHEN b.bucket = 0 THEN o.revenue ELSE 0 END
+            FROM (VALUES (0), (1), (2), (3), (4), (5), (6), (7)) b (bucket)
+            CROSS JOIN (SELECT COUNT(*) AS order_count, ISNULL(SUM(total_price), 0) AS revenue FROM orders) o
+        """,
+    ]),
+    # Migration 10 used to count deleted (inactive) products' images too,
+    # leaving those blobs referenced forever; recount from active products
+    # and let blobs that drop to zero age out through the purge grace period
+    Migration(17, 'Recount upload blob references from active products', [
+        """
+        UPDATE b SET ref_count = COALESCE(r.refs, 0),
+            released_at = CASE WHEN COALESCE(r.refs, 0) = 0 THEN COALESCE(b.released_at, GETDATE()) END
+        FROM upload_blobs b
+        LEFT JOIN (
+            SELECT name, COUNT(*) AS refs FROM (
+                SELECT image AS name FROM products WHERE COALESCE(active, 1) = 1
+                UNION ALL
+                SELECT image_filename FROM products
+                WHERE COALESCE(active, 1) = 1 AND (image_filename <> image OR image IS NULL)
+            ) refs
+            GROUP BY name
+        ) r ON r.name = b.name
+        WHERE b.ref_count <> COALESCE(r.refs, 0)
+        """,
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def current_version(cursor):
+    """
+    Highest applied migration number (0 for a database with none)
+    """
+    cursor.execute("""
+    IF OBJECT_ID('schema_migrations', 'U') IS NULL
+        SELECT 0
+    ELSE
+        SELECT ISNULL(MAX(version), 0) FROM schema_migrations
+    """)
+    return cursor.fetchone()[0]
+
+
+def migrate(conn, target=None):
+    """
+    Apply every migration newer than the database's version.
+    Returns the list of versions applied.
+    """
+    target = LATEST_VERSION if target is None else target
+    cursor = conn.cursor()
+    if current_version(cursor) >= target:
+        conn.rollback()
+        return []
+
+    # Serialize concurrent workers starting up at the same time
+    cursor.execute("EXEC sp_getapplock @Resource = ?, @LockMode = 'Exclusive', "
+                   "@LockOwner = 'Session', @LockTimeout = 60000", (MIGRATION_LOCK,))
+    applied = []
+    try:
+        cursor.execute("""
+        IF OBJECT_ID('schema_migrations', 'U') IS NULL
+        CREATE TABLE schema_migrations (
+            version INT PRIMARY KEY,
+            description NVARCHAR(255) NOT NULL,
+            applied_at DATETIME NOT NULL DEFAULT GETDATE()
+        )
+        """)
+        conn.commit()
+
+        # Another worker may have migrated while we waited for the lock
+        version = current_version(cursor)
+        for migration in MIGRATIONS:
+            if migration.version <= version:
+                continue
+            if migration.version > target:
+                break
+            print(f"Applying migration {migration.version}: {migration.description}")
+            try:
+                migration.apply(cursor)
+                cursor.execute('INSERT INTO schema_migrations (version, description) VALUES (?, ?)',
+                               (migration.version, migration.description))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied.append(migration.version)
+    finally:
+        cursor.execute("EXEC sp_releaseapplock @Resource = ?, @LockOwner = 'Session'", (MIGRATION_LOCK,))
+        conn.commit()
+    return applied
+
+
+def render_sql_script():
+    """
+    The migrations as a plain T-SQL script, for setting up a database by hand
+    """
+    lines = [
+        '-- Generated from migrations.py by `flask schema-sql` - do not edit by hand',
+        "IF NOT EXISTS (SELECT * FROM sys.databases WHERE name = 'BMS')",
+        'BEGIN',
+        '    CREATE DATABASE BMS;',
+        'END',
+        'GO',
+        '',
+        'USE BMS;',
+        'GO',
+        '',
+        "IF OBJECT_ID('schema_migrations', 'U') IS NULL",
+        'CREATE TABLE schema_migrations (',
+        '    version INT PRIMARY KEY,',
+        '    description NVARCHAR(255) NOT NULL,',
+        '    applied_at DATETIME NOT NULL DEFAULT GETDATE()',
+        ');',
+        'GO',
+        '',
+    ]
+    for migration in MIGRATIONS:
+        lines.append(f'-- Migration {migration.version}: {migration.description}')
+        if migration.run:
+            lines.append('-- (includes a Python step; run `flask migrate` to apply it)')
+        for statement in migration.statements:
+            lines.append(_dedent(statement) + ';')
+            lines.append('GO')
+        lines.append(f"IF NOT EXISTS (SELECT * FROM schema_migrations WHERE version = {migration.version})")
+        description = migration.description.replace("'", "''")
+        lines.append(f"    INSERT INTO schema_migrations (version, description) "
+                     f"VALUES ({migration.version}, '{description}');")
+        lines.append('GO')
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def _dedent(statement):
+    lines = [line for line in statement.strip('\n').split('\n')]
+    indent = min((len(line) - len(line.lstrip()) for line in lines if line.strip()), default=0)
+    return '\n'.join(line[indent:] for line in lines).rstrip()
+
+
+_migrate_lock = threading.Lock()
+
+
+def ensure_migrated(app=None):
+    """
+    Bring the database up to date once per process.
+    Costs a single version check when nothing is pending.
+    """
+    app = app or current_app._get_current_object()
+    if app.extensions.get('schema_migrated'):
+        return
+    with _migrate_lock:
+        if app.extensions.get('schema_migrated'):
+            return
+        conn = get_db_connection()
+        applied = migrate(conn)
+        # Load (or reload, if anything changed) the cached column lists
+        get_schema(app).load(conn)
+        if applied:
+            print(f"Database migrated to version {applied[-1]}")
+        app.extensions['schema_migrated'] = True
@@ -0,0 +1,265 @@
+"""
+Streaming CSV / XLSX exports of orders and order lines.
+
+Rows are read from the cursor REPORT_STREAM_CHUNK at a time and written
+straight into the response: CSV line by line, XLSX as a zip archive built
+on the fly (zipfile writes to a non-seekable stream with data descriptors,
+and the sheet uses inline strings so there is no shared-strings table to
+hold in memory). Memory stays flat however long the date range is.
+"""
+import csv
+import datetime
+import decimal
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from query_plans import get_plan
+
+# Dataset -> (plan name, [(column heading, field)])
+DATASETS = {
+    'orders': ('orders_export', [
+        ('Order ID', 'order_id'),
+        ('Date', 'order_date'),
+        ('Customer', 'customer_name'),
+        ('Email', 'customer_email'),
+        ('Phone', 'customer_phone'),
+        ('Payment', 'payment_method'),
+        ('Subtotal', 'subtotal_amount'),
+        ('Discount Applied', 'discount_applied'),
+        ('Discount', 'discount_amount'),
+        ('Total', 'total_amount'),
+    ]),
+    'order-lines': ('order_lines_export', [
+        ('Order ID', 'order_id'),
+        ('Date', 'order_date'),
+        ('Customer', 'customer_name'),
+        ('Product ID', 'product_id'),
+        ('Product', 'product_name'),
+        ('Quantity', 'quantity'),
+        ('Unit Price', 'unit_price'),
+        ('Line Total', 'total_price'),
+    ]),
+}
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def parse_date_range(args, default_days=30):
+    """
+    (start, end) datetimes for ?start=YYYY-MM-DD&end=YYYY-MM-DD, end inclusive.
+    Raises ValueError for malformed dates.
+    """
+    today = datetime.date.today()
+    end = datetime.date.fromisoformat(args['end']) if args.get('end') else today
+    start = (datetime.date.fromisoformat(args['start']) if args.get('start')
+             else end - datetime.timedelta(days=default_days - 1))
+    if start > end:
+        raise ValueError('start must not be after end')
+    return (datetime.datetime.combine(start, datetime.time()),
+            datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time()))
+
+
+def export_rows(conn, dataset, start, end, chunk_size=1000):
+    """
+    Generator of value lists for a dataset, in column order
+    """
+    plan_name, columns = DATASETS[dataset]
+    plan = get_plan(plan_name)
+    positions = [plan.fields.index(field) for _, field in columns]
+    cursor = conn.cursor()
+    try:
+        cursor.execute(plan.sql, (start, end))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield [row[i] for i in positions]
+    finally:
+        cursor.close()
+
+
+class _LineBuffer:
+    """
+    File-like target for csv.writer that hands back what was written
+    """
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def drain(self):
+        data = ''.join(self.parts)
+        self.parts = []
+        return data
+
+
+# Spreadsheets run a cell starting with one of these as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def csv_cell(value):
+    """
+    A value as written to the CSV; text that would read as a formula is
+    prefixed with ' (numbers and dates are left as they are)
+    """
+    if value is None:
+        return ''
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream_csv(headings, rows, batch=500):
+    buffer = _LineBuffer()
+    writer = csv.writer(buffer)
+    # The BOM lets Excel detect UTF-8
+    writer.writerow(headings)
+    yield ('\ufeff' + buffer.drain()).encode('utf-8')
+    pending = 0
+    for row in rows:
+        writer.writerow([csv_cell(value) for value in row])
+        pending += 1
+        if pending == batch:
+            yield buffer.drain().encode('utf-8')
+            pending = 0
+    yield buffer.drain().encode('utf-8')
+
+
+# --- XLSX ---
+
+class _ChunkSink:
+    """
+    Write-only, non-seekable stream that collects what zipfile writes
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        # zipfile only needs the position to record local header offsets
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+XLSX_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+</Types>"""
+
+XLSX_ROOT_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+XLSX_WORKBOOK = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+
+XLSX_WORKBOOK_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>"""
+
+# Cell styles: 0 general, 1 date + time, 2 two decimals, 3 bold (headings)
+XLSX_STYLES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd hh:mm"/></numFmts>
+<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="4">
+<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>
+<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>
+<xf numFmtId="2" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>
+<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>
+</cellXfs>
+</styleSheet>"""
+
+EXCEL_EPOCH = datetime.datetime(1899, 12, 30)
+# Characters XML 1.0 doesn't allow, even escaped
+_INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def xlsx_cell(value, style=0):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, datetime.datetime):
+        delta = value - EXCEL_EPOCH
+        return f'<c s="1"><v>{delta.days + delta.seconds / 86400:.6f}</v></c>'
+    if isinstance(value, int):
+        return f'<c><v>{value}</v></c>'
+    if isinstance(value, (float, decimal.Decimal)):
+        # float / Decimal money columns
+        return f'<c s="2"><v>{value}</v></c>'
+    text = escape(_INVALID_XML.sub('', str(value)))
+    style_attr = f' s="{style}"' if style else ''
+    return f'<c t="inlineStr"{style_attr}><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def stream_xlsx(headings, rows, sheet_name='Export', batch=500):
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', XLSX_CONTENT_TYPES)
+        archive.writestr('_rels/.rels', XLSX_ROOT_RELS)
+        archive.writestr('xl/workbook.xml', XLSX_WORKBOOK.format(name=escape(sheet_name)))
+        archive.writestr('xl/_rels/workbook.xml.rels', XLSX_WORKBOOK_RELS)
+        archive.writestr('xl/styles.xml', XLSX_STYLES)
+        yield sink.drain()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                        b'<sheetData>')
+            sheet.write(('<row>' + ''.join(xlsx_cell(h, style=3) for h in headings) + '</row>').encode('utf-8'))
+            parts = []
+            for row in rows:
+                parts.append('<row>' + ''.join(xlsx_cell(value) for value in row) + '</row>')
+                if len(parts) == batch:
+                    sheet.write(''.join(parts).encode('utf-8'))
+                    parts = []
+                    yield sink.drain()
+            sheet.write(''.join(parts).encode('utf-8'))
+            sheet.write(b'</sheetData></worksheet>')
+        yield sink.drain()
+    # Central directory
+    yield sink.drain()
+
+
+def stream_export(conn, dataset, fmt, start, end, chunk_size=1000):
+    """
+    Generator of file bytes for one export
+    """
+    headings = [heading for heading, _ in DATASETS[dataset][1]]
+    rows = export_rows(conn, dataset, start, end, chunk_size)
+    if fmt == 'csv':
+        return stream_csv(headings, rows)
+    return stream_xlsx(headings, rows, sheet_name=dataset.replace('-', ' ').title())
@@ -0,0 +1,115 @@
+"""
+Order ID allocation.
+
+Order IDs look like ORD-20260318-000123: the date the order was placed and
+a number from the order_number_seq SEQUENCE. The number never repeats, so
+IDs are unique whatever the date part says, and they stay short enough to
+read out over the phone.
+
+Each worker process reserves a block of ORDER_ID_BLOCK_SIZE numbers at a
+time with sp_sequence_get_range and hands them out from memory, so only
+one order in a block pays for a round trip. Within a process the numbers
+only go up; across processes each works through its own block. Numbers
+left in a block when a process exits are skipped, leaving gaps - that is
+expected.
+"""
+import datetime
+import os
+import threading
+
+from flask import current_app
+
+ORDER_NUMBER_SEQUENCE = 'dbo.order_number_seq'
+
+RESERVE_RANGE_SQL = """
+SET NOCOUNT ON;
+DECLARE @first SQL_VARIANT;
+EXEC sp_sequence_get_range @sequence_name = ?, @range_size = ?, @range_first_value = @first OUTPUT;
+SELECT CAST(@first AS BIGINT);
+SET NOCOUNT OFF
+"""
+
+
+def reserve_range(conn, size):
+    """
+    First number of a freshly reserved block of size numbers.
+    Sequence ranges aren't transactional: a rollback doesn't give them back.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(RESERVE_RANGE_SQL, (ORDER_NUMBER_SEQUENCE, size))
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
+def format_order_id(number, when=None, prefix='ORD'):
+    when = when or datetime.datetime.now()
+    return f"{prefix}-{when.strftime('%Y%m%d')}-{number:06d}"
+
+
+class OrderIdAllocator:
+    """
+    Hands out order numbers from per-process blocks of the sequence
+    """
+
+    def __init__(self, block_size=100, prefix='ORD'):
+        self.block_size = block_size
+        self.prefix = prefix
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+        self.issued = 0
+        self.blocks = 0
+
+    def next_number(self, conn):
+        """
+        The next order number; conn is only used when a new block is needed
+        """
+        with self._lock:
+            if self._next >= self._end:
+                first = reserve_range(conn, self.block_size)
+                self._next, self._end = first, first + self.block_size
+                self.blocks += 1
+            number = self._next
+            self._next += 1
+            self.issued += 1
+            return number
+
+    def next_id(self, conn, when=None):
+        return format_order_id(self.next_number(conn), when, self.prefix)
+
+    def stats(self):
+        return {
+            'block_size': self.block_size,
+            'issued': self.issued,
+            'blocks': self.blocks,
+            'left_in_block': self._end - self._next,
+        }
+
+
+_allocator_lock = threading.Lock()
+
+
+def get_order_id_allocator(app=None):
+    """
+    The app's allocator; a forked worker process must not reuse its parent's block
+    """
+    app = app or current_app._get_current_object()
+    allocator = app.extensions.get('order_id_allocator')
+    if allocator is None or allocator.pid != os.getpid():
+        with _allocator_lock:
+            allocator = app.extensions.get('order_id_allocator')
+            if allocator is None or allocator.pid != os.getpid():
+                allocator = OrderIdAllocator(app.config.get('ORDER_ID_BLOCK_SIZE', 100),
+                                             app.config.get('ORDER_ID_PREFIX', 'ORD'))
+                app.extensions['order_id_allocator'] = allocator
+    return allocator
+
+
+def next_order_id(conn, when=None):
+    """
+    A new, never-used order ID
+    """
+    return get_order_id_allocator().next_id(conn, when)
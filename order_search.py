@@ -0,0 +1,197 @@
+"""
+Server-side order search for the admin orders API.
+
+Filters are turned into a parameterized WHERE clause built only from the
+fixed predicates below, and results come back newest first in keyset pages
+using the same (order_date, order_id) cursor as the orders history page.
+Every predicate is served by one of the orders indexes (see migration 6).
+
+Query parameters: date_from, date_to (YYYY-MM-DD, inclusive, or an ISO
+datetime), customer (name prefix), payment_method, discount (true/false),
+min_total, max_total, page_size and after (the next_cursor of the last page).
+"""
+import base64
+import datetime
+import decimal
+
+from query_plans import get_plan
+from schema import get_schema
+
+def encode_order_cursor(order):
+    """
+    Opaque keyset cursor for the (order_date, order_id) of the last row on a page
+    """
+    raw = f"{order['order_date'].isoformat()}|{order['order_id']}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_order_cursor(value):
+    """
+    Inverse of encode_order_cursor; raises ValueError for anything else
+    """
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode('utf-8')
+        order_date, order_id = raw.split('|', 1)
+        return datetime.datetime.fromisoformat(order_date), order_id
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f'Invalid page cursor: {value}') from e
+
+
+def _parse_date(value, name, end=False):
+    # A bare date covers the whole day, so date_to is exclusive of the next midnight
+    try:
+        if len(value) == 10:
+            day = datetime.datetime.strptime(value, '%Y-%m-%d')
+            return day + datetime.timedelta(days=1) if end else day
+        return datetime.datetime.fromisoformat(value)
+    except ValueError as e:
+        raise ValueError(f'{name} must be YYYY-MM-DD or an ISO datetime') from e
+
+
+def _parse_amount(value, name):
+    try:
+        amount = decimal.Decimal(value)
+    except decimal.InvalidOperation as e:
+        raise ValueError(f'{name} must be a number') from e
+    if not amount.is_finite():
+        raise ValueError(f'{name} must be a number')
+    return amount
+
+
+def _parse_bool(value, name):
+    lowered = value.lower()
+    if lowered in ('1', 'true', 'yes'):
+        return True
+    if lowered in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f'{name} must be true or false')
+
+
+def _like_prefix(value):
+    # Match the text literally - escape LIKE wildcards before adding %
+    escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_').replace('[', '\\[')
+    return escaped + '%'
+
+
+class OrderFilter:
+    """
+    Validated search criteria; every field is optional
+    """
+
+    def __init__(self, date_from=None, date_to=None, customer=None, payment_method=None,
+                 discount=None, min_total=None, max_total=None):
+        self.date_from = date_from
+        self.date_to = date_to
+        self.customer = customer
+        self.payment_method = payment_method
+        self.discount = discount
+        self.min_total = min_total
+        self.max_total = max_total
+
+    @classmethod
+    def from_args(cls, args):
+        """
+        Build a filter from request query args; raises ValueError on bad input
+        """
+        def arg(name):
+            value = args.get(name, '').strip()
+            return value or None
+
+        criteria = cls()
+        if arg('date_from'):
+            criteria.date_from = _parse_date(arg('date_from'), 'date_from')
+        if arg('date_to'):
+            criteria.date_to = _parse_date(arg('date_to'), 'date_to', end=True)
+        criteria.customer = arg('customer')
+        if arg('payment_method'):
+            criteria.payment_method = arg('payment_method').lower()
+            if len(criteria.payment_method) > 50:
+                raise ValueError('payment_method is too long')
+        if arg('discount'):
+            criteria.discount = _parse_bool(arg('discount'), 'discount')
+        if arg('min_total'):
+            criteria.min_total = _parse_amount(arg('min_total'), 'min_total')
+        if arg('max_total'):
+            criteria.max_total = _parse_amount(arg('max_total'), 'max_total')
+        return criteria
+
+    def where(self, total_column):
+        """
+        (predicates, params) for the set criteria
+        """
+        predicates = []
+        params = []
+        if self.date_from is not None:
+            predicates.append('order_date >= ?')
+            params.append(self.date_from)
+        if self.date_to is not None:
+            predicates.append('order_date < ?')
+            params.append(self.date_to)
+        if self.customer:
+            predicates.append("customer_name LIKE ? ESCAPE '\\'")
+            params.append(_like_prefix(self.customer))
+        if self.payment_method:
+            predicates.append('payment_method = ?')
+            params.append(self.payment_method)
+        if self.discount is not None:
+            predicates.append('discount_applied = ?')
+            params.append(1 if self.discount else 0)
+        if self.min_total is not None:
+            predicates.append(f'{total_column} >= ?')
+            params.append(self.min_total)
+        if self.max_total is not None:
+            predicates.append(f'{total_column} <= ?')
+            params.append(self.max_total)
+        return predicates, params
+
+
+def search_query(criteria, limit, after=None):
+    """
+    (plan, sql, params) for up to `limit` orders matching the filter, newest first
+    """
+    plan = get_plan('order_search')
+    total_column = 'total_amount' if get_schema().has_column('orders', 'total_amount') else 'total_price'
+    predicates, params = criteria.where(total_column)
+
+    if after:
+        order_date, order_id = decode_order_cursor(after)
+        predicates.append('(order_date < CAST(? AS DATETIME)'
+                          ' OR (order_date = CAST(? AS DATETIME) AND order_id < ?))')
+        params.extend((order_date, order_date, order_id))
+
+    sql = plan.sql
+    if predicates:
+        sql += ' WHERE ' + ' AND '.join(predicates)
+    sql += ' ORDER BY order_date DESC, order_id DESC'
+    return plan, sql, [limit] + params
+
+
+def search_orders(conn, criteria, page_size, after=None):
+    """
+    One page of orders matching the filter, newest first.
+    Returns (orders, next_cursor or None).
+    """
+    # Fetch one extra row to learn whether another page exists
+    plan, sql, params = search_query(criteria, page_size + 1, after)
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    rows = plan.decode_all(cursor.fetchall())
+    cursor.close()
+
+    next_cursor = encode_order_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+    return rows[:page_size], next_cursor
+
+
+def order_summary(row):
+    """
+    Compact JSON form of a search result row
+    """
+    return {
+        'order_id': row['order_id'],
+        'customer_name': row['customer_name'],
+        'total_amount': float(row['total_amount'] or 0),
+        'discount_applied': bool(row['discount_applied']),
+        'discount_amount': float(row['discount_amount'] or 0),
+        'payment_method': (row['payment_method'] or 'cash').lower(),
+        'order_date': row['order_date'].isoformat() if row['order_date'] else None,
+    }
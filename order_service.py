@@ -0,0 +1,154 @@
+"""
+One place to load a placed order for display.
+
+The invoice, receipt, order details and invoice PDF all show the same
+order. get_order() fetches the header and the lines in a single round
+trip (both compiled SELECTs sent as one batch), applies the
+subtotal/discount/total fallbacks once, and keeps the result in a
+per-process LRU cache: orders never change after place_order commits
+them, so opening the invoice and then the receipt reads the database
+once.
+
+Cached orders are shared between requests - treat them as read-only.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+from db_pool import get_db_connection
+from query_plans import get_plan
+
+
+def normalize_order(order_row, items_data):
+    """
+    (order, items) with the totals resolved from whichever columns are filled
+    """
+    subtotal = order_row['subtotal_amount'] if order_row['subtotal_amount'] else 0
+    if subtotal == 0:
+        # Fallback to total_amount or total_price
+        subtotal = order_row['total_amount'] if order_row['total_amount'] else 0
+        if subtotal == 0:
+            subtotal = order_row['total_price'] if order_row['total_price'] else 0
+
+    discount_applied = bool(order_row['discount_applied'])
+    discount_amount = order_row['discount_amount'] if order_row['discount_amount'] else 0
+
+    # Final total calculation
+    final_total = order_row['total_amount'] if order_row['total_amount'] else 0
+    if final_total == 0:
+        final_total = order_row['total_price'] if order_row['total_price'] else 0
+    if final_total == 0:
+        final_total = subtotal - discount_amount
+
+    order = dict(order_row,
+                 customer_email=order_row['customer_email'] or '',
+                 customer_phone=order_row['customer_phone'] or '',
+                 subtotal_amount=subtotal,
+                 discount_applied=discount_applied,
+                 discount_amount=discount_amount,
+                 total_amount=final_total,
+                 payment_method=(order_row['payment_method'] or 'cash').title())
+
+    items = []
+    for item in items_data:
+        items.append(dict(item,
+                          product_name=item['product_name'] or 'Unknown Product',
+                          unit_price=item['unit_price'] if item['unit_price'] else 0,
+                          total_price=item['total_price'] if item['total_price'] else 0))
+    return order, items
+
+
+def load_order(conn, order_id):
+    """
+    (order, items) from the database in one round trip, or None
+    """
+    header_plan = get_plan('order_header')
+    items_plan = get_plan('order_items')
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f'{header_plan.sql};\n{items_plan.sql}', (order_id, order_id))
+        order_row = cursor.fetchone()
+        if not order_row:
+            return None
+        order_row = header_plan.decode(order_row)
+        cursor.nextset()
+        items_data = items_plan.decode_all(cursor.fetchall())
+    finally:
+        cursor.close()
+    return normalize_order(order_row, items_data)
+
+
+class OrderCache:
+    """
+    LRU cache of loaded orders, keyed by order id
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.pid = os.getpid()
+        self._orders = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, order_id, loader=load_order):
+        with self._lock:
+            cached = self._orders.get(order_id)
+            if cached is not None:
+                self._orders.move_to_end(order_id)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        order = loader(get_db_connection(), order_id)
+        # Unknown ids aren't cached - the order may be committed any moment
+        if order is not None:
+            with self._lock:
+                self._orders[order_id] = order
+                self._orders.move_to_end(order_id)
+                while len(self._orders) > self.max_entries:
+                    self._orders.popitem(last=False)
+        return order
+
+    def peek(self, order_id):
+        """
+        The cached order, without loading it or counting a hit
+        """
+        with self._lock:
+            return self._orders.get(order_id)
+
+    def discard(self, order_id):
+        with self._lock:
+            self._orders.pop(order_id, None)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._orders),
+            'max_entries': self.max_entries,
+        }
+
+
+_cache_lock = threading.Lock()
+
+
+def get_order_cache(app=None):
+    app = app or current_app._get_current_object()
+    cache = app.extensions.get('order_cache')
+    if cache is None or cache.pid != os.getpid():
+        with _cache_lock:
+            cache = app.extensions.get('order_cache')
+            if cache is None or cache.pid != os.getpid():
+                cache = OrderCache(app.config.get('ORDER_CACHE_SIZE', 512))
+                app.extensions['order_cache'] = cache
+    return cache
+
+
+def get_order(order_id):
+    """
+    (order, items) for a placed order, or None if it doesn't exist
+    """
+    return get_order_cache().get(order_id)
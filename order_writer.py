@@ -0,0 +1,140 @@
+"""
+Batched order persistence for the Bakery Management System.
+
+The order header and all of its lines are sent to SQL Server as one batch:
+a single INSERT for the header, the sales rollup update, and multi-row
+INSERT ... VALUES statements for the lines, executed in one cursor.execute
+call.
+"""
+import threading
+
+from sales_rollup import record_sale_statement
+from schema import get_schema
+
+# SQL Server accepts at most 2100 parameters per request and 1000 rows per
+# VALUES list; stay a little under the parameter cap.
+MAX_PARAMS_PER_BATCH = 2000
+MAX_ROWS_PER_VALUES = 1000
+# Parameters used by the sales rollup statement in the header batch
+ROLLUP_PARAMS = 5
+
+ORDER_HEADER_COLUMNS = (
+    'order_id', 'customer_name', 'customer_email', 'customer_phone',
+    'subtotal_amount', 'discount_applied', 'discount_amount', 'total_amount',
+    'total_price', 'payment_method', 'order_date', 'created_by',
+)
+
+
+def order_insert_columns(columns):
+    """
+    Columns to write for an order header, given the orders table schema
+    """
+    has_amount = 'total_amount' in columns
+    has_price = 'total_price' in columns
+    if not has_amount and not has_price:
+        # Fallback - minimal required columns
+        return ('order_id', 'customer_name', 'order_date', 'created_by')
+    return tuple(col for col in ORDER_HEADER_COLUMNS
+                 if (col != 'total_amount' or has_amount) and (col != 'total_price' or has_price))
+
+
+def item_insert_columns(columns):
+    """
+    Columns to write for an order line, given the order_items table schema
+    """
+    if 'price' in columns and 'total_price' in columns and 'unit_price' in columns:
+        return ('order_id', 'product_id', 'product_name', 'quantity', 'unit_price', 'total_price', 'price')
+    if 'price' in columns and 'total_price' in columns:
+        return ('order_id', 'product_id', 'product_name', 'quantity', 'price', 'total_price')
+    return ('order_id', 'product_id', 'quantity')
+
+
+def _values_sql(table, columns, row_count):
+    row = '(' + ', '.join('?' for _ in columns) + ')'
+    return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+            + ', '.join(row for _ in range(row_count)))
+
+
+class OrderWritePlan:
+    """
+    Column lists for the header and line inserts against one schema version
+    """
+
+    def __init__(self, order_columns, item_columns):
+        self.order_columns = order_insert_columns(order_columns)
+        self.item_columns = item_insert_columns(item_columns)
+        # Leave room for the header and rollup parameters so a normal cart fits in one batch
+        self.rows_per_values = min(
+            MAX_ROWS_PER_VALUES,
+            (MAX_PARAMS_PER_BATCH - len(self.order_columns) - ROLLUP_PARAMS) // len(self.item_columns))
+
+    def batches(self, order, lines):
+        """
+        Yield (sql, params) pairs; one pair unless the cart is very large
+        """
+        header_params = [order[col] for col in self.order_columns]
+        line_params = [[line[col] for col in self.item_columns] for line in lines]
+
+        rollup_sql, rollup_params = record_sale_statement(order)
+        statements = ['SET NOCOUNT ON', _values_sql('orders', self.order_columns, 1), rollup_sql]
+        params = header_params + rollup_params
+
+        for start in range(0, len(line_params), self.rows_per_values):
+            chunk = line_params[start:start + self.rows_per_values]
+            if len(params) + len(chunk) * len(self.item_columns) > MAX_PARAMS_PER_BATCH:
+                yield ';\n'.join(statements + ['SET NOCOUNT OFF']), params
+                statements, params = ['SET NOCOUNT ON'], []
+            statements.append(_values_sql('order_items', self.item_columns, len(chunk)))
+            for row in chunk:
+                params.extend(row)
+
+        # NOCOUNT is session state - don't hand it on to the pool's next borrower
+        yield ';\n'.join(statements + ['SET NOCOUNT OFF']), params
+
+
+_write_plans = {}
+_write_plan_lock = threading.Lock()
+
+
+def get_write_plan():
+    """
+    Write plan for the current schema, built once per schema fingerprint
+    """
+    schema = get_schema()
+    key = (schema.fingerprint('orders'), schema.fingerprint('order_items'))
+    plan = _write_plans.get(key)
+    if plan is None:
+        with _write_plan_lock:
+            plan = _write_plans.get(key)
+            if plan is None:
+                plan = OrderWritePlan(frozenset(schema.columns('orders')),
+                                      frozenset(schema.columns('order_items')))
+                _write_plans[key] = plan
+    return plan
+
+
+def order_lines(order_id, cart_items):
+    """
+    Turn cart items posted by the POS screen into order_items rows
+    """
+    return [{
+        'order_id': order_id,
+        'product_id': item['id'],
+        'product_name': item['name'],
+        'quantity': item['quantity'],
+        'unit_price': item['price'],
+        'total_price': item['price'] * item['quantity'],
+        'price': item['price'],
+    } for item in cart_items]
+
+
+def write_order(conn, order, lines, plan=None):
+    """
+    Insert an order header and its lines in (normally) one round trip.
+    The caller owns the transaction and commits.
+    """
+    plan = plan or get_write_plan()
+    cursor = conn.cursor()
+    for sql, params in plan.batches(order, lines):
+        cursor.execute(sql, params)
+    cursor.close()
@@ -0,0 +1,89 @@
+"""
+HTTP conditional caching for the pages of a placed order.
+
+An order never changes after place_order commits it, so its invoice,
+receipt and details pages are the same bytes until the templates or
+static assets change. Their ETag is therefore computed from the route,
+the order id, the signed-in user and a version of the templates/assets -
+no database read needed - and an If-None-Match that matches is answered
+with 304 before the view runs. Full responses also carry Last-Modified
+(the order date) and a short private Cache-Control.
+"""
+import hashlib
+import os
+import threading
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+
+from order_service import get_order_cache
+
+_version_lock = threading.Lock()
+
+
+def render_version(app=None):
+    """
+    Hash of the templates and fingerprinted assets this process renders with
+    """
+    app = app or current_app._get_current_object()
+    version = app.extensions.get('page_render_version')
+    if version is None:
+        with _version_lock:
+            version = app.extensions.get('page_render_version')
+            if version is None:
+                digest = hashlib.sha1()
+                template_dir = os.path.join(app.root_path, app.template_folder)
+                for root, dirs, files in os.walk(template_dir):
+                    dirs.sort()
+                    for name in sorted(files):
+                        if not name.endswith('.html'):
+                            continue
+                        path = os.path.join(root, name)
+                        digest.update(os.path.relpath(path, template_dir).encode('utf-8'))
+                        with open(path, 'rb') as f:
+                            digest.update(f.read())
+                manifest = app.extensions.get('asset_manifest')
+                for asset in sorted(manifest or (), key=lambda asset: asset.hashed_name):
+                    digest.update(asset.hashed_name.encode('utf-8'))
+                version = app.extensions['page_render_version'] = digest.hexdigest()[:16]
+    return version
+
+
+def order_page_etag(order_id):
+    key = '|'.join([request.endpoint or '', order_id, str(session.get('user_id', '')),
+                    str(session.get('user_role', '')), render_version()])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def _cache_headers(response, etag):
+    response.set_etag(etag)
+    max_age = current_app.config.get('ORDER_PAGE_MAX_AGE', 60)
+    response.headers['Cache-Control'] = f'private, max-age={max_age}' if max_age else 'private, no-cache'
+    response.vary.add('Cookie')
+    return response
+
+
+def immutable_order_page(view):
+    """
+    Decorator for views of one placed order, taking order_id
+    """
+    @wraps(view)
+    def wrapper(order_id, *args, **kwargs):
+        etag = order_page_etag(order_id)
+        if request.if_none_match.contains_weak(etag):
+            # Unchanged - skip the database and the template
+            return _cache_headers(current_app.response_class(status=304), etag)
+
+        response = make_response(view(order_id, *args, **kwargs))
+        if response.status_code != 200:
+            return response
+        # Only tag real order pages: the view loaded the order through the
+        # cache, so this is a lookup, not a query
+        loaded = get_order_cache().peek(order_id)
+        if loaded is None:
+            return response
+        order_date = loaded[0].get('order_date')
+        if order_date:
+            response.last_modified = order_date
+        return _cache_headers(response, etag)
+    return wrapper
@@ -0,0 +1,249 @@
+"""
+PDF rendering off the request workers.
+
+ReportLab is pure Python: a big report holds the GIL for seconds and every
+other request in the worker process - including cashiers placing orders -
+waits behind it. Routes therefore describe the PDF as a plain-data spec
+(dicts, lists, dates, Decimals) and render_pdf() builds it in a pool of
+worker processes:
+
+    render_pdf({'kind': 'invoice', 'order': order_row, 'items': items})
+
+At most PDF_MAX_PENDING jobs may be queued or running per app process;
+beyond that render_pdf() raises RendererBusy instead of piling up work.
+Each job runs on one worker process of its own, so a job that takes longer
+than PDF_RENDER_TIMEOUT raises RenderTimeout and only its worker is killed
+and replaced - other renders carry on. A worker that dies mid-job (e.g.
+out of memory) is replaced and the job retried once on the new one.
+With PDF_WORKERS = 0, or if worker processes can't be started, specs are
+rendered inline as before.
+"""
+import multiprocessing
+import os
+import threading
+import time
+
+from flask import current_app
+
+
+class RendererBusy(Exception):
+    """
+    Too many PDFs are already being rendered
+    """
+
+
+class RenderTimeout(Exception):
+    """
+    A PDF took longer than the configured timeout
+    """
+
+
+class RenderFailed(Exception):
+    """
+    The worker process died while rendering a PDF
+    """
+
+
+def render_spec(spec):
+    """
+    Build the PDF a spec describes. Runs in the worker processes.
+    """
+    kind = spec['kind']
+    # Imported here so worker processes only load what they render
+    if kind == 'invoice':
+        from invoice_pdf import render_invoice_pdf
+        return render_invoice_pdf(spec['order'], spec['items'])
+    if kind == 'orders_report':
+        from report_pdf import render_orders_report
+        return render_orders_report(spec['orders'], spec['generated_at'])
+    raise ValueError(f'Unknown PDF kind: {kind}')
+
+
+def _worker_main(conn):
+    """
+    Worker process loop: render each spec received and send back (ok, result)
+    """
+    while True:
+        try:
+            spec = conn.recv()
+        except EOFError:
+            return
+        try:
+            conn.send((True, render_spec(spec)))
+        except Exception as e:
+            try:
+                conn.send((False, e))
+            except Exception:
+                # The exception itself couldn't be pickled
+                conn.send((False, RuntimeError(repr(e))))
+
+
+class _Worker:
+    """
+    One rendering process and our end of its pipe
+    """
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,),
+                                       name='pdf-worker', daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join(1)
+        self.conn.close()
+
+
+class PdfRenderer:
+    """
+    Worker processes for render_spec() with bounded queue depth
+    """
+
+    def __init__(self, workers=2, max_pending=8, timeout=30):
+        self.workers = workers
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        # spawn: workers must not inherit the pool's DB connections or locks
+        self._context = multiprocessing.get_context('spawn')
+        self._available = threading.Condition()
+        self._idle = []
+        self._started = 0
+        self.rendered = 0
+        self.inline = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.restarts = 0
+
+    def _checkout(self, deadline):
+        """
+        An idle worker, starting one if fewer than `workers` are running;
+        raises RenderTimeout if none frees up before the deadline
+        """
+        with self._available:
+            while not self._idle and self._started >= self.workers:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise RenderTimeout(f'PDF rendering took longer than {self.timeout} seconds')
+                self._available.wait(remaining)
+            if self._idle:
+                return self._idle.pop()
+            self._started += 1
+        try:
+            return _Worker(self._context)
+        except BaseException:
+            self._discard(None)
+            raise
+
+    def _checkin(self, worker):
+        with self._available:
+            self._idle.append(worker)
+            self._available.notify()
+
+    def _discard(self, worker):
+        """
+        Stop a worker (timed out or broken); a new one takes its place on demand
+        """
+        if worker is not None:
+            worker.stop()
+        with self._available:
+            self._started -= 1
+            self._available.notify()
+
+    def _render_inline(self, spec):
+        self.inline += 1
+        return render_spec(spec)
+
+    def _run(self, spec, deadline):
+        """
+        (ok, result) of one job on one worker, or None if the worker died
+        """
+        worker = self._checkout(deadline)
+        try:
+            worker.conn.send(spec)
+            finished = worker.conn.poll(max(deadline - time.monotonic(), 0))
+            result = worker.conn.recv() if finished else None
+        except (EOFError, OSError):
+            self._discard(worker)
+            self.restarts += 1
+            return None
+        except BaseException:
+            self._discard(worker)
+            raise
+        if not finished:
+            # A running render can't be interrupted - kill just its worker
+            self._discard(worker)
+            self.timeouts += 1
+            raise RenderTimeout(f'PDF rendering took longer than {self.timeout} seconds')
+        self._checkin(worker)
+        return result
+
+    def render(self, spec):
+        """
+        PDF bytes for a spec
+        """
+        if not self.workers:
+            return self._render_inline(spec)
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise RendererBusy('PDF renderer is busy - please try again in a moment')
+        try:
+            deadline = time.monotonic() + self.timeout
+            try:
+                result = self._run(spec, deadline)
+                if result is None:
+                    print("⚠️ PDF worker died - retrying on a fresh one")
+                    result = self._run(spec, deadline)
+            except (OSError, RuntimeError) as e:
+                # Worker processes can't be started here at all
+                print(f"⚠️ PDF worker unavailable ({e}) - rendering inline")
+                return self._render_inline(spec)
+            if result is None:
+                raise RenderFailed('PDF worker died while rendering')
+            ok, value = result
+            if not ok:
+                raise value
+            self.rendered += 1
+            return value
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'rendered': self.rendered,
+            'inline': self.inline,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+            'restarts': self.restarts,
+        }
+
+
+_renderer_lock = threading.Lock()
+
+
+def get_renderer(app=None):
+    """
+    The app's PDF renderer; a forked worker process gets its own workers
+    """
+    app = app or current_app._get_current_object()
+    renderer = app.extensions.get('pdf_renderer')
+    if renderer is None or renderer.pid != os.getpid():
+        with _renderer_lock:
+            renderer = app.extensions.get('pdf_renderer')
+            if renderer is None or renderer.pid != os.getpid():
+                renderer = PdfRenderer(app.config.get('PDF_WORKERS', 2),
+                                       app.config.get('PDF_MAX_PENDING', 8),
+                                       app.config.get('PDF_RENDER_TIMEOUT', 30))
+                app.extensions['pdf_renderer'] = renderer
+    return renderer
+
+
+def render_pdf(spec, app=None):
+    """
+    Render a PDF spec in a worker process (or inline when they are off)
+    """
+    return get_renderer(app).render(spec)
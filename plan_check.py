@@ -0,0 +1,170 @@
+"""
+Execution-plan verification for the app's hot queries.
+
+Captures the estimated plan (SHOWPLAN_XML) of each query below and reports
+any full scan of a table or of its clustered index. Run it against a large
+seeded dataset with `flask verify-plans --seed 200000`.
+"""
+import datetime
+import decimal
+import xml.etree.ElementTree as ET
+
+from catalog import catalog_query, invalidate_catalog
+from order_search import OrderFilter, search_query
+from product_page import ProductListing, product_page_query
+from query_plans import get_plan
+from sales_rollup import rebuild_rollup
+from schema import get_schema
+
+SHOWPLAN_NS = {'sp': 'http://schemas.microsoft.com/sqlserver/2004/07/showplan'}
+SCAN_OPERATORS = ('Table Scan', 'Clustered Index Scan')
+SEED_PREFIX = 'PLANCHECK-'
+
+
+def hot_queries(sample_order_id):
+    """
+    (name, sql, params) for the queries that run on every page view
+    """
+    today_start = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    yesterday = OrderFilter(date_from=today_start - datetime.timedelta(days=1), date_to=today_start,
+                            payment_method='card', min_total=100)
+    _, search_sql, search_params = search_query(yesterday, 50)
+    _, products_sql, products_params = product_page_query(ProductListing(), 60)
+    _, category_sql, category_params = product_page_query(ProductListing(category='Category 1'), 60)
+    return [
+        ('order header', get_plan('order_header').sql, (sample_order_id,)),
+        ('order items', get_plan('order_items').sql, (sample_order_id,)),
+        ('orders history first page', get_plan('order_page').sql, (50,)),
+        ('orders history next page', get_plan('order_page_after').sql,
+         (50, today_start, today_start, sample_order_id)),
+        ('order search: yesterday card over 100', search_sql, search_params),
+        ('orders export: yesterday', get_plan('orders_export').sql,
+         (today_start - datetime.timedelta(days=1), today_start)),
+        ('order lines export: yesterday', get_plan('order_lines_export').sql,
+         (today_start - datetime.timedelta(days=1), today_start)),
+        ('product list first page', products_sql, products_params),
+        ('product list: one category', category_sql, category_params),
+        ('POS catalog', catalog_query(get_schema().columns('products')), ()),
+    ]
+
+
+def _literal(value):
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (int, float, decimal.Decimal)):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        return f"'{value.strftime('%Y-%m-%dT%H:%M:%S')}'"
+    return "N'" + str(value).replace("'", "''") + "'"
+
+
+def inline_params(sql, params):
+    """
+    Substitute literals for ? markers so the statement can be shown as-is
+    """
+    parts = sql.split('?')
+    if len(parts) - 1 != len(params):
+        raise ValueError(f'Expected {len(parts) - 1} parameters, got {len(params)}')
+    out = [parts[0]]
+    for value, part in zip(params, parts[1:]):
+        out.append(_literal(value))
+        out.append(part)
+    return ''.join(out)
+
+
+def capture_plan(conn, sql, params=()):
+    """
+    Estimated execution plan of a statement as showplan XML (not executed)
+    """
+    cursor = conn.cursor()
+    cursor.execute('SET SHOWPLAN_XML ON')
+    try:
+        cursor.execute(inline_params(sql, params))
+        return ''.join(row[0] for row in cursor.fetchall())
+    finally:
+        cursor.execute('SET SHOWPLAN_XML OFF')
+        cursor.close()
+
+
+def find_scans(plan_xml):
+    """
+    (operator, table, index) for every full table / clustered index scan
+    """
+    root = ET.fromstring(plan_xml)
+    scans = []
+    for rel_op in root.iterfind('.//sp:RelOp', SHOWPLAN_NS):
+        operator = rel_op.get('PhysicalOp')
+        if operator not in SCAN_OPERATORS:
+            continue
+        obj = rel_op.find('./*/sp:Object', SHOWPLAN_NS)
+        table = obj.get('Table', '').strip('[]') if obj is not None else '?'
+        index = obj.get('Index', '').strip('[]') if obj is not None else ''
+        scans.append((operator, table, index))
+    return scans
+
+
+def verify_plans(conn):
+    """
+    Check every hot query. Returns [(name, scans)]; an empty scans list passes.
+    """
+    cursor = conn.cursor()
+    cursor.execute('SELECT TOP 1 order_id FROM orders ORDER BY order_date DESC')
+    row = cursor.fetchone()
+    sample_order_id = row[0] if row else f'{SEED_PREFIX}1'
+    cursor.close()
+    # SET SHOWPLAN_XML can't run inside an open transaction
+    conn.commit()
+
+    return [(name, find_scans(capture_plan(conn, sql, params)))
+            for name, sql, params in hot_queries(sample_order_id)]
+
+
+def seed_dataset(conn, orders=200000, items_per_order=3, products=2000):
+    """
+    Insert a large synthetic dataset (marked with SEED_PREFIX) and refresh statistics
+    """
+    cursor = conn.cursor()
+    numbers = ("WITH n AS (SELECT TOP ({count}) ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS i "
+               "FROM sys.all_objects a CROSS JOIN sys.all_objects b CROSS JOIN sys.all_objects c) ")
+
+    cursor.execute(numbers.format(count=int(products)) + f"""
+    INSERT INTO products (name, quantity, price, category, active)
+    SELECT CONCAT('{SEED_PREFIX}product ', i), '100', 1 + i % 20,
+           CONCAT('Category ', i % 12), CASE WHEN i % 10 = 0 THEN 0 ELSE 1 END
+    FROM n
+    """)
+    cursor.execute(numbers.format(count=int(orders)) + f"""
+    INSERT INTO orders (order_id, customer_name, subtotal_amount, discount_applied, discount_amount,
+                        total_amount, total_price, payment_method, order_date)
+    SELECT CONCAT('{SEED_PREFIX}', i), CONCAT('Customer ', i % 5000), 12.50, 0, 0, 12.50, 12.50,
+           CASE i % 3 WHEN 0 THEN 'cash' WHEN 1 THEN 'card' ELSE 'mobile' END,
+           DATEADD(MINUTE, -i, GETDATE())
+    FROM n
+    """)
+    cursor.execute(numbers.format(count=int(orders)) + f"""
+    INSERT INTO order_items (order_id, product_id, product_name, quantity, unit_price, total_price, price)
+    SELECT CONCAT('{SEED_PREFIX}', n.i), 1, CONCAT('Item ', line.k), 1, 4.00, 4.00, 4.00
+    FROM n CROSS JOIN (SELECT TOP ({int(items_per_order)}) ROW_NUMBER() OVER (ORDER BY (SELECT NULL)) AS k
+                       FROM sys.all_objects) line
+    """)
+    conn.commit()
+
+    for table in ('products', 'orders', 'order_items'):
+        cursor.execute(f'UPDATE STATISTICS {table}')
+    conn.commit()
+    cursor.close()
+    rebuild_rollup(conn)
+    invalidate_catalog()
+
+
+def remove_seed_data(conn):
+    cursor = conn.cursor()
+    cursor.execute(f"DELETE FROM order_items WHERE order_id LIKE '{SEED_PREFIX}%'")
+    cursor.execute(f"DELETE FROM orders WHERE order_id LIKE '{SEED_PREFIX}%'")
+    cursor.execute(f"DELETE FROM products WHERE name LIKE '{SEED_PREFIX}%'")
+    conn.commit()
+    cursor.close()
+    rebuild_rollup(conn)
+    invalidate_catalog()
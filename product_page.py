@@ -0,0 +1,224 @@
+"""
+Paged product listing for the admin products page.
+
+The page ships only its first batch of products; the browser asks for the
+rest with "load more" (keyset pages in the chosen sort order, category and
+price filters applied here) or through the search index. Queries are
+built only from the fixed columns and predicates below.
+
+Query parameters: sort (name-asc, name-desc, price-asc, price-desc,
+category-asc, id-asc, id-desc), category, price (0-5, 5-10, 10-20, 20-50,
+50+), page_size and after (the next_cursor of the last page).
+"""
+import base64
+import decimal
+import json
+
+from image_variants import parse_variants
+from schema import get_schema
+from stock import stock_column
+
+# sort argument -> (column, direction)
+SORTS = {
+    'name-asc': ('name', 'ASC'),
+    'name-desc': ('name', 'DESC'),
+    'price-asc': ('price', 'ASC'),
+    'price-desc': ('price', 'DESC'),
+    'category-asc': ('category', 'ASC'),
+    'id-asc': ('id', 'DESC'),   # "Newest First"
+    'id-desc': ('id', 'ASC'),   # "Oldest First"
+}
+
+# price argument -> (exclusive lower bound or None, inclusive upper bound or None);
+# the first range also takes 0
+PRICE_RANGES = {
+    '0-5': (None, 5),
+    '5-10': (5, 10),
+    '10-20': (10, 20),
+    '20-50': (20, 50),
+    '50+': (50, None),
+}
+
+
+def encode_product_cursor(product, column):
+    """
+    Opaque keyset cursor for the (sort value, id) of the last row on a page
+    """
+    value = product[column]
+    raw = json.dumps([str(value) if isinstance(value, decimal.Decimal) else value, product['id']])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_product_cursor(value):
+    """
+    Inverse of encode_product_cursor; raises ValueError for anything else
+    """
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode('utf-8')
+        sort_value, product_id = json.loads(raw)
+        return sort_value, int(product_id)
+    except (ValueError, TypeError, UnicodeDecodeError) as e:
+        raise ValueError(f'Invalid page cursor: {value}') from e
+
+
+class ProductListing:
+    """
+    Validated listing options: sort order, category and price range
+    """
+
+    def __init__(self, sort='name-asc', category=None, price=None):
+        self.sort = sort
+        self.category = category
+        self.price = price
+
+    @classmethod
+    def from_args(cls, args):
+        """
+        Build listing options from request query args; raises ValueError on bad input
+        """
+        sort = args.get('sort') or 'name-asc'
+        if sort not in SORTS:
+            raise ValueError(f'sort must be one of {", ".join(SORTS)}')
+        price = args.get('price') or None
+        if price == 'all':
+            price = None
+        if price is not None and price not in PRICE_RANGES:
+            raise ValueError(f'price must be one of all, {", ".join(PRICE_RANGES)}')
+        category = args.get('category') or None
+        if category == 'all':
+            category = None
+        return cls(sort, category, price)
+
+    def where(self, has_categories):
+        """
+        (predicates, params) for the filters, active products only
+        """
+        predicates = ['active = 1']
+        params = []
+        if self.category and has_categories:
+            # Kept sargable for IX_products_category_name; NULL reads as 'General'
+            predicates.append('(category = ? OR category IS NULL)' if self.category == 'General' else 'category = ?')
+            params.append(self.category)
+        if self.price:
+            low, high = PRICE_RANGES[self.price]
+            if low is not None:
+                predicates.append('price > ?')
+                params.append(low)
+            if high is not None:
+                predicates.append('price <= ?')
+                params.append(high)
+        return predicates, params
+
+
+def product_columns():
+    """
+    SELECT list for listing rows, given the products table schema
+    """
+    schema = get_schema()
+    variants = 'image_variants' if schema.has_column('products', 'image_variants') else 'NULL'
+    category = "COALESCE(category, 'General')" if schema.has_column('products', 'category') else "'General'"
+    return f'id, name, quantity, price, image, {variants}, {stock_column()}, {category} AS category'
+
+
+def list_product(row):
+    """
+    JSON-ready product dict for one listing row
+    """
+    # Resized renditions when they exist, the original otherwise
+    variants = parse_variants(row[5])
+    return {
+        'id': row[0],
+        'name': row[1],
+        'quantity': row[2],
+        'price': float(row[3]),
+        'image': row[4],
+        'thumb': variants.get('thumb', row[4]),
+        'medium': variants.get('medium', row[4]),
+        'stock': row[6],
+        'category': row[7] or 'General',
+    }
+
+
+def product_page_query(listing, page_size, after=None):
+    """
+    (sort column, sql, params) for one page of active products in the
+    listing's order; the page is one row longer to show whether more follow
+    """
+    has_categories = get_schema().has_column('products', 'category')
+    column, direction = SORTS[listing.sort]
+    if column == 'category' and not has_categories:
+        column, direction = 'name', 'ASC'
+    predicates, params = listing.where(has_categories)
+
+    sort_column = "COALESCE(category, 'General')" if column == 'category' else column
+
+    if after:
+        sort_value, product_id = decode_product_cursor(after)
+        compare = '>' if direction == 'ASC' else '<'
+        if column == 'id':
+            predicates.append(f'id {compare} ?')
+            params.append(product_id)
+        else:
+            predicates.append(f'({sort_column} {compare} ? OR ({sort_column} = ? AND id {compare} ?))')
+            params.extend((sort_value, sort_value, product_id))
+
+    order_by = f'id {direction}' if column == 'id' else f'{sort_column} {direction}, id {direction}'
+    sql = (f'SELECT TOP (?) {product_columns()} FROM products'
+           f' WHERE {" AND ".join(predicates)} ORDER BY {order_by}')
+    return column, sql, [page_size + 1] + params
+
+
+def fetch_product_page(conn, listing, page_size, after=None):
+    """
+    One page of active products in the listing's order.
+    Returns (products, next_cursor or None).
+    """
+    column, sql, params = product_page_query(listing, page_size, after)
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    products = [list_product(row) for row in cursor.fetchall()]
+    cursor.close()
+
+    # The extra row only tells us another page exists
+    next_cursor = encode_product_cursor(products[page_size - 1], column) if len(products) > page_size else None
+    return products[:page_size], next_cursor
+
+
+def count_products(conn, listing=None):
+    """
+    Number of active products matching the listing's filters (all of them without one)
+    """
+    predicates, params = (listing or ProductListing()).where(get_schema().has_column('products', 'category'))
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT COUNT(*) FROM products WHERE {" AND ".join(predicates)}', params)
+    count = cursor.fetchone()[0]
+    cursor.close()
+    return count
+
+
+def category_counts(conn):
+    """
+    [(category, number of active products)] by category name
+    """
+    if not get_schema().has_column('products', 'category'):
+        return []
+    cursor = conn.cursor()
+    cursor.execute("SELECT COALESCE(category, 'General') AS category, COUNT(*) FROM products"
+                   " WHERE active = 1 GROUP BY COALESCE(category, 'General') ORDER BY category")
+    counts = [(row[0], row[1]) for row in cursor.fetchall()]
+    cursor.close()
+    return counts
+
+
+def products_by_id(conn, product_ids):
+    """
+    {id: listing dict} for the given products, e.g. a page of search results
+    """
+    if not product_ids:
+        return {}
+    placeholders = ', '.join('?' for _ in product_ids)
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT {product_columns()} FROM products WHERE id IN ({placeholders})', list(product_ids))
+    products = {row[0]: list_product(row) for row in cursor.fetchall()}
+    cursor.close()
+    return products
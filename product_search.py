@@ -0,0 +1,237 @@
+"""
+In-memory product search over name and category.
+
+Every word of a product's name and category is indexed twice: in a sorted
+vocabulary (for prefix matches, found with bisect) and by its trigrams (for
+fuzzy matches that survive typos). A query matches a product when each of
+its words prefix- or fuzzy-matches one of the product's words; results are
+ranked by how well and where (name over category) they matched.
+
+The index follows the cached catalog (catalog.py). When the catalog version
+moves on, only the products written since the index's version are applied,
+so a product write costs one small delta query per worker process rather
+than a rebuild.
+"""
+import bisect
+import heapq
+import re
+import threading
+import time
+
+from flask import current_app
+
+from catalog import get_catalog_cache, load_catalog_delta
+from db_pool import get_db_connection
+
+WORD_RE = re.compile(r'[^\W_]+')
+FIELD_WEIGHTS = {'name': 1.0, 'category': 0.5}
+# Minimum trigram (Dice) similarity for a fuzzy word match
+FUZZY_THRESHOLD = 0.4
+
+
+def words(text):
+    return WORD_RE.findall((text or '').lower())
+
+
+def trigrams(word):
+    padded = f'${word}$'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ProductIndex:
+    """
+    Prefix + trigram index of product names and categories
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._products = {}
+        # product id -> set of (word, field)
+        self._product_words = {}
+        # word -> {product id: best field weight}
+        self._word_products = {}
+        # trigram -> set of words
+        self._trigram_words = {}
+        self._vocabulary = []
+        self.version = None
+        self.catalog = None
+
+    def __len__(self):
+        return len(self._products)
+
+    def _add_word(self, word, product_id, weight):
+        postings = self._word_products.get(word)
+        if postings is None:
+            postings = self._word_products[word] = {}
+            bisect.insort(self._vocabulary, word)
+            for trigram in trigrams(word):
+                self._trigram_words.setdefault(trigram, set()).add(word)
+        postings[product_id] = max(weight, postings.get(product_id, 0))
+
+    def _remove_word(self, word, product_id):
+        postings = self._word_products.get(word)
+        if postings is None:
+            return
+        postings.pop(product_id, None)
+        if postings:
+            # Another field of this product may still carry the word
+            return
+        del self._word_products[word]
+        del self._vocabulary[bisect.bisect_left(self._vocabulary, word)]
+        for trigram in trigrams(word):
+            bucket = self._trigram_words.get(trigram)
+            if bucket is not None:
+                bucket.discard(word)
+                if not bucket:
+                    del self._trigram_words[trigram]
+
+    def _remove(self, product_id):
+        for word, _ in self._product_words.pop(product_id, ()):
+            self._remove_word(word, product_id)
+        self._products.pop(product_id, None)
+
+    def _upsert(self, product):
+        self._remove(product['id'])
+        entries = {(word, field) for field in FIELD_WEIGHTS for word in words(product.get(field))}
+        for word, field in entries:
+            self._add_word(word, product['id'], FIELD_WEIGHTS[field])
+        self._product_words[product['id']] = entries
+        self._products[product['id']] = product
+
+    def rebuild(self, products, version=None):
+        with self._lock:
+            self._products.clear()
+            self._product_words.clear()
+            self._word_products.clear()
+            self._trigram_words.clear()
+            self._vocabulary.clear()
+            for product in products:
+                self._upsert(product)
+            self.version = version
+
+    def apply(self, changed, removed, version):
+        """
+        Apply a catalog delta: upsert changed products, drop removed ids
+        """
+        with self._lock:
+            for product in changed:
+                self._upsert(product)
+            for product_id in removed:
+                self._remove(product_id)
+            self.version = version
+
+    def _match_word(self, term):
+        """
+        {product id: score} for one query word
+        """
+        scores = {}
+        # Prefix matches: a contiguous run of the sorted vocabulary
+        start = bisect.bisect_left(self._vocabulary, term)
+        for word in self._vocabulary[start:]:
+            if not word.startswith(term):
+                break
+            quality = 3.0 if word == term else 2.0
+            for product_id, weight in self._word_products[word].items():
+                scores[product_id] = max(scores.get(product_id, 0), quality * weight)
+
+        # Fuzzy matches: words sharing enough trigrams with the term
+        term_trigrams = trigrams(term)
+        shared = {}
+        for trigram in term_trigrams:
+            for word in self._trigram_words.get(trigram, ()):
+                shared[word] = shared.get(word, 0) + 1
+        for word, common in shared.items():
+            # A padded word of n letters has n trigrams
+            similarity = 2 * common / (len(term_trigrams) + len(word))
+            if similarity < FUZZY_THRESHOLD or word.startswith(term):
+                continue
+            for product_id, weight in self._word_products[word].items():
+                scores[product_id] = max(scores.get(product_id, 0), 1.5 * similarity * weight)
+        return scores
+
+    def search(self, query, limit=20, category=None):
+        """
+        Ranked [(score, product)] for products matching every word of the query
+        """
+        terms = words(query)
+        if not terms:
+            return []
+        with self._lock:
+            totals = None
+            for term in terms:
+                scores = self._match_word(term)
+                if totals is None:
+                    totals = scores
+                else:
+                    totals = {pid: totals[pid] + score for pid, score in scores.items() if pid in totals}
+                if not totals:
+                    return []
+            products = self._products
+            if category:
+                totals = {pid: score for pid, score in totals.items() if products[pid]['category'] == category}
+            # Top results only - no need to sort every match
+            best = heapq.nsmallest(limit, totals.items(), key=lambda item: (-item[1], item[0]))
+            results = [(score, products[pid]) for pid, score in best]
+
+        results.sort(key=lambda item: (-item[0], item[1]['name'].lower()))
+        return results
+
+
+def highlight_spans(name, query):
+    """
+    [start, end) spans of the name's words that start with a query word
+    """
+    terms = words(query)
+    spans = []
+    for match in WORD_RE.finditer(name or ''):
+        word = match.group().lower()
+        for term in terms:
+            if word.startswith(term):
+                spans.append([match.start(), match.start() + len(term)])
+                break
+    return spans
+
+
+_index_lock = threading.Lock()
+
+
+def get_product_index(app=None):
+    """
+    The search index, brought up to date with the cached catalog
+    """
+    app = app or current_app._get_current_object()
+    index = app.extensions.get('product_index')
+    if index is None:
+        with _index_lock:
+            index = app.extensions.get('product_index')
+            if index is None:
+                index = app.extensions['product_index'] = ProductIndex()
+
+    catalog = get_catalog_cache(app).get()
+    if index.catalog is catalog:
+        return index
+    with _index_lock:
+        if index.catalog is catalog:
+            return index
+        if index.version is not None and catalog.version is not None and index.version < catalog.version:
+            # Only what was written since the index was last brought up to date
+            changed, removed, version = load_catalog_delta(get_db_connection(), index.version)
+            index.apply(changed, removed, version)
+        elif index.version is None or index.version != catalog.version:
+            index.rebuild(catalog.products, catalog.version)
+        index.catalog = catalog
+    return index
+
+
+def search_products(query, limit=20, category=None):
+    """
+    JSON-ready ranked results for the search endpoint
+    """
+    started = time.perf_counter()
+    results = get_product_index().search(query, limit, category)
+    return {
+        'query': query,
+        'results': [dict(product, score=round(score, 3), highlight=highlight_spans(product['name'], query))
+                    for score, product in results],
+        'took_ms': round((time.perf_counter() - started) * 1000, 3),
+    }
@@ -0,0 +1,219 @@
+"""
+Compiled SELECT statements for the order queries.
+
+Older databases may be missing some of the optional order columns, so the
+SELECT lists are built from the live schema with literal fallbacks such as
+'' as customer_email. Each plan is compiled once per schema fingerprint and
+cached together with a row decoder that maps result tuples to dicts.
+"""
+import threading
+
+from schema import get_schema
+
+# (field name, candidate columns in order of preference, fallback SQL literal)
+# A fallback of None marks a required column.
+ORDER_HEADER_FIELDS = (
+    ('order_id', ('order_id',), None),
+    ('customer_name', ('customer_name',), None),
+    ('customer_email', ('customer_email',), "''"),
+    ('customer_phone', ('customer_phone',), "''"),
+    ('subtotal_amount', ('subtotal_amount',), '0'),
+    ('discount_applied', ('discount_applied',), '0'),
+    ('discount_amount', ('discount_amount',), '0'),
+    ('total_amount', ('total_amount',), '0'),
+    ('total_price', ('total_price',), '0'),
+    ('payment_method', ('payment_method',), "'cash'"),
+    ('order_date', ('order_date',), 'GETDATE()'),
+    ('created_by', ('created_by',), '1'),
+)
+
+ORDER_ITEM_FIELDS = (
+    ('product_id', ('product_id',), '0'),
+    ('product_name', ('product_name',), "'Unknown Product'"),
+    ('quantity', ('quantity',), None),
+    ('unit_price', ('unit_price', 'price'), '0'),
+    ('total_price', ('total_price', 'price'), '0'),
+    ('price', ('price',), '0'),
+)
+
+ORDER_REPORT_FIELDS = (
+    ('order_id', ('order_id',), None),
+    ('customer_name', ('customer_name',), None),
+    ('total_amount', ('total_amount', 'total_price'), '0'),
+    ('order_date', ('order_date',), 'GETDATE()'),
+    ('discount_applied', ('discount_applied',), '0'),
+    ('discount_amount', ('discount_amount',), '0'),
+    ('payment_method', ('payment_method',), "'Cash'"),
+)
+
+# Spreadsheet exports (order_export.py)
+ORDER_EXPORT_FIELDS = (
+    ('order_id', ('order_id',), None),
+    ('order_date', ('order_date',), 'GETDATE()'),
+    ('customer_name', ('customer_name',), None),
+    ('customer_email', ('customer_email',), "''"),
+    ('customer_phone', ('customer_phone',), "''"),
+    ('payment_method', ('payment_method',), "'cash'"),
+    ('subtotal_amount', ('subtotal_amount',), '0'),
+    ('discount_applied', ('discount_applied',), '0'),
+    ('discount_amount', ('discount_amount',), '0'),
+    ('total_amount', ('total_amount', 'total_price'), '0'),
+)
+
+ORDER_LINE_EXPORT_FIELDS = (
+    ('product_id', ('product_id',), '0'),
+    ('product_name', ('product_name',), "'Unknown Product'"),
+    ('quantity', ('quantity',), None),
+    ('unit_price', ('unit_price', 'price'), '0'),
+    ('total_price', ('total_price', 'price'), '0'),
+)
+
+# Compact rows for the admin orders API; covered by the orders indexes
+ORDER_SEARCH_FIELDS = (
+    ('order_id', ('order_id',), None),
+    ('customer_name', ('customer_name',), None),
+    ('total_amount', ('total_amount', 'total_price'), '0'),
+    ('discount_applied', ('discount_applied',), '0'),
+    ('discount_amount', ('discount_amount',), '0'),
+    ('payment_method', ('payment_method',), "'cash'"),
+    ('order_date', ('order_date',), 'GETDATE()'),
+)
+
+
+class PlanSpec:
+    """
+    Description of a query whose SELECT list depends on the schema
+    """
+
+    def __init__(self, table, fields, from_clause, order_by='', alias=None,
+                 extra_select=(), group_by=False, top=False):
+        self.table = table
+        self.fields = fields
+        self.from_clause = from_clause
+        self.order_by = order_by
+        self.alias = alias
+        self.extra_select = extra_select
+        self.group_by = group_by
+        # TOP (?) row limit, bound as the first parameter
+        self.top = top
+
+
+class QueryPlan:
+    """
+    A compiled statement plus the field names its rows decode to
+    """
+    __slots__ = ('name', 'sql', 'fields')
+
+    def __init__(self, name, sql, fields):
+        self.name = name
+        self.sql = sql
+        self.fields = fields
+
+    def decode(self, row):
+        """
+        Map one result tuple to a dict keyed by field name
+        """
+        return dict(zip(self.fields, row))
+
+    def decode_all(self, rows):
+        fields = self.fields
+        return [dict(zip(fields, row)) for row in rows]
+
+
+PLAN_SPECS = {
+    # Keyset pages of the order history, newest first. The cursor compares
+    # as DATETIME so values read back from the column match exactly.
+    'order_page': PlanSpec(
+        'orders', ORDER_HEADER_FIELDS[:-1],
+        ' FROM orders', order_by=' ORDER BY order_date DESC, order_id DESC', top=True),
+    'order_page_after': PlanSpec(
+        'orders', ORDER_HEADER_FIELDS[:-1],
+        ' FROM orders WHERE order_date < CAST(? AS DATETIME)'
+        ' OR (order_date = CAST(? AS DATETIME) AND order_id < ?)',
+        order_by=' ORDER BY order_date DESC, order_id DESC', top=True),
+    # WHERE / ORDER BY are appended per request by order_search.py
+    'order_search': PlanSpec(
+        'orders', ORDER_SEARCH_FIELDS, ' FROM orders', top=True),
+    'order_header': PlanSpec(
+        'orders', ORDER_HEADER_FIELDS,
+        ' FROM orders WHERE order_id = ?'),
+    'order_items': PlanSpec(
+        'order_items', ORDER_ITEM_FIELDS,
+        ' FROM order_items WHERE order_id = ?'),
+    # Date-range exports, oldest first along the order_date index
+    'orders_export': PlanSpec(
+        'orders', ORDER_EXPORT_FIELDS,
+        ' FROM orders WHERE order_date >= ? AND order_date < ?',
+        order_by=' ORDER BY order_date, order_id'),
+    'order_lines_export': PlanSpec(
+        'order_items', ORDER_LINE_EXPORT_FIELDS,
+        ' FROM orders o JOIN order_items oi ON oi.order_id = o.order_id'
+        ' WHERE o.order_date >= ? AND o.order_date < ?',
+        order_by=' ORDER BY o.order_date, o.order_id',
+        alias='oi',
+        extra_select=(('order_id', 'o.order_id'), ('order_date', 'o.order_date'),
+                      ('customer_name', 'o.customer_name'))),
+    'orders_report': PlanSpec(
+        'orders', ORDER_REPORT_FIELDS,
+        ' FROM orders o LEFT JOIN order_items oi ON o.order_id = oi.order_id',
+        order_by=' ORDER BY order_date DESC',
+        alias='o',
+        extra_select=(('item_count', 'COUNT(oi.id)'), ('total_quantity', 'SUM(oi.quantity)')),
+        group_by=True),
+}
+
+
+def compile_plan(name, spec, columns):
+    """
+    Build the SELECT for a plan against a concrete column list
+    """
+    prefix = f'{spec.alias}.' if spec.alias else ''
+    select_parts = []
+    group_columns = []
+    field_names = []
+
+    for field, candidates, fallback in spec.fields:
+        source = next((c for c in candidates if c in columns), None)
+        if source is None and fallback is None:
+            # Required column - reference it and let the database complain
+            source = candidates[0]
+
+        if source is None:
+            select_parts.append(f'{fallback} as {field}')
+        else:
+            select_parts.append(f'{prefix}{source}' if source == field
+                                else f'{prefix}{source} as {field}')
+            group_columns.append(f'{prefix}{source}')
+        field_names.append(field)
+
+    for field, expression in spec.extra_select:
+        select_parts.append(f'{expression} as {field}')
+        field_names.append(field)
+
+    sql = ('SELECT TOP (?) ' if spec.top else 'SELECT ') + ', '.join(select_parts) + spec.from_clause
+    if spec.group_by and group_columns:
+        sql += ' GROUP BY ' + ', '.join(group_columns)
+    sql += spec.order_by
+
+    return QueryPlan(name, sql, tuple(field_names))
+
+
+_plan_cache = {}
+_plan_lock = threading.Lock()
+
+
+def get_plan(name):
+    """
+    Get the compiled plan for the current schema, compiling it on first use
+    """
+    spec = PLAN_SPECS[name]
+    schema = get_schema()
+    key = (name, schema.fingerprint(spec.table))
+    plan = _plan_cache.get(key)
+    if plan is None:
+        with _plan_lock:
+            plan = _plan_cache.get(key)
+            if plan is None:
+                plan = compile_plan(name, spec, frozenset(schema.columns(spec.table)))
+                _plan_cache[key] = plan
+    return plan
@@ -0,0 +1,148 @@
+"""
+The all-orders PDF report.
+
+render_orders_report() takes plain data (the decoded orders_report rows)
+and returns the PDF bytes, so it can run in a pdf_render worker process.
+"""
+from io import BytesIO
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+
+
+def render_orders_report(orders_data, generated_at):
+    """
+    The all-orders report PDF, as bytes
+    """
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
+    styles = getSampleStyleSheet()
+    elements = []
+
+    # Title
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=20,
+        textColor=colors.darkblue,
+        alignment=1,  # Center alignment
+        spaceAfter=30
+    )
+
+    elements.append(Paragraph("🍪 Sweet Delights Bakery - All Orders Report", title_style))
+    elements.append(Spacer(1, 20))
+
+    # Report info
+    report_info_style = ParagraphStyle(
+        'ReportInfo',
+        parent=styles['Normal'],
+        fontSize=11,
+        alignment=1,
+        spaceAfter=20
+    )
+
+    current_date = generated_at.strftime('%B %d, %Y at %I:%M %p')
+    elements.append(Paragraph(f"Generated on: {current_date}", report_info_style))
+    elements.append(Spacer(1, 20))
+
+    # Create table headers
+    table_data = [['Order ID', 'Customer Name', 'Total Amount', 'Date', 'Payment', 'Items', 'Quantity', 'Discount']]
+
+    # Process orders data
+    total_revenue = 0
+    total_orders = len(orders_data)
+    total_items = 0
+    total_discount_amount = 0
+
+    for order in orders_data:
+        try:
+            order_id = str(order['order_id'])
+            customer_name = order['customer_name'] or 'Unknown'
+            total_amount = order['total_amount'] if order['total_amount'] else 0
+            order_date = order['order_date']
+            payment_method = (order['payment_method'] or 'Cash').title()
+            discount_applied = bool(order['discount_applied'])
+            discount_amount = order['discount_amount'] if order['discount_amount'] else 0
+
+            # Item count and quantity come from the JOIN
+            item_count = order['item_count'] or 0
+            total_quantity = order['total_quantity']
+
+            # Format date
+            date_str = order_date.strftime("%m/%d/%Y") if order_date else "N/A"
+
+            # Discount display
+            discount_display = f"${discount_amount:.2f}" if discount_applied and discount_amount > 0 else "None"
+
+            table_data.append([
+                order_id,
+                customer_name,
+                f"${total_amount:.2f}",
+                date_str,
+                payment_method,
+                str(item_count),
+                str(total_quantity),
+                discount_display
+            ])
+
+            # Add to totals
+            total_revenue += total_amount
+            total_items += total_quantity
+            if discount_applied and discount_amount > 0:
+                total_discount_amount += discount_amount
+
+        except Exception as row_error:
+            print(f"❌ Error processing row: {str(row_error)}")
+            continue
+
+
+
+    # Summary table
+    summary_data = [
+        ['Total Revenue:', f"${total_revenue:.2f}"],
+        ['Total Orders:', total_orders],
+        ['Total Items Sold:', total_items],
+        ['Total Discount Given:', f"${total_discount_amount:.2f}"]
+    ]
+
+    summary_table = Table(summary_data, colWidths=[2.5*inch, 1.5*inch])
+    summary_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+        ('FONTNAME', (0, 0), (-1, -2), 'Helvetica'),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -2), 11),
+        ('FONTSIZE', (0, -1), (-1, -1), 14),
+        ('TEXTCOLOR', (0, -1), (-1, -1), colors.darkblue),
+        ('LINEABOVE', (0, -1), (-1, -1), 2, colors.black),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+    ]))
+
+    # Center the summary table
+    summary_container = Table([[summary_table]], colWidths=[6.5*inch])
+    summary_container.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ]))
+
+    elements.append(summary_container)
+    elements.append(Spacer(1, 30))
+
+    # Footer
+    footer_style = ParagraphStyle(
+        'Footer',
+        parent=styles['Normal'],
+        fontSize=10,
+        alignment=1,
+        textColor=colors.grey
+    )
+
+    elements.append(Paragraph("🍪 Sweet Delights Bakery Management System", footer_style))
+    elements.append(Paragraph("Thank you for using our system!", footer_style))
+
+    # Build PDF
+    print("📄 Building PDF document...")
+    doc.build(elements)
+
+    return buffer.getvalue()
@@ -0,0 +1,232 @@
+"""
+Streaming all-orders PDF export.
+
+report_pdf.py builds the report with ReportLab, which keeps every row and
+every page in memory until the document is finished. For large order
+histories this module writes the PDF itself instead, a page at a time:
+orders are read with fetchmany() from the (server-side, forward-only)
+cursor, each full page is emitted as soon as its rows are in, and the
+response streams to the client while the next chunk is fetched.
+
+The pages are plain text tables in the standard Helvetica fonts, so
+nothing has to be embedded. Only the byte offsets of the objects written
+so far (for the xref table) grow with the report - 8 bytes per object.
+"""
+import zlib
+from array import array
+
+from query_plans import get_plan
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792  # US letter, points
+MARGIN = 36
+ROW_HEIGHT = 14
+FONT_SIZE = 8
+
+# (heading, width in points, right-aligned)
+COLUMNS = (
+    ('Order ID', 100, False),
+    ('Customer Name', 130, False),
+    ('Total Amount', 62, True),
+    ('Date', 56, False),
+    ('Payment', 58, False),
+    ('Items', 34, True),
+    ('Quantity', 44, True),
+    ('Discount', 56, True),
+)
+
+# Objects 1-4 are fixed; pages add two objects each from 5 on
+CATALOG, PAGES, FONT, FONT_BOLD = 1, 2, 3, 4
+
+
+def pdf_text(value):
+    """
+    A PDF string literal for text in the standard fonts (WinAnsi)
+    """
+    text = str(value).encode('cp1252', 'replace').decode('cp1252')
+    return '(' + text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') + ')'
+
+
+def fit(text, width, size=FONT_SIZE):
+    # Helvetica averages about half an em per character
+    max_chars = int(width / (size * 0.5))
+    return text if len(text) <= max_chars else text[:max_chars - 1] + '~'
+
+
+class PdfStreamWriter:
+    """
+    Writes a PDF incrementally: call page() per page, then finish()
+    """
+
+    def __init__(self):
+        self.offsets = array('Q', [0] * (FONT_BOLD + 1))
+        self.position = 0
+        self.pages = array('Q')
+
+    def _out(self, data):
+        self.position += len(data)
+        return data
+
+    def _object(self, number, body):
+        if number >= len(self.offsets):
+            self.offsets.extend([0] * (number + 1 - len(self.offsets)))
+        self.offsets[number] = self.position
+        return self._out(f'{number} 0 obj\n'.encode('latin-1') + body + b'\nendobj\n')
+
+    def begin(self):
+        header = self._out(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        return (header
+                + self._object(FONT, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+                + self._object(FONT_BOLD, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>'))
+
+    def page(self, content):
+        """
+        Bytes for one page, given its content stream operators
+        """
+        stream = zlib.compress(content.encode('cp1252'))
+        content_number = len(self.offsets)
+        page_number = content_number + 1
+        self.pages.append(page_number)
+        return (self._object(content_number, f'<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n'.encode('latin-1')
+                             + stream + b'\nendstream')
+                + self._object(page_number, (
+                    f'<< /Type /Page /Parent {PAGES} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}]'
+                    f' /Resources << /Font << /F1 {FONT} 0 R /F2 {FONT_BOLD} 0 R >> >>'
+                    f' /Contents {content_number} 0 R >>').encode('latin-1')))
+
+    def finish(self):
+        """
+        Page tree, catalog, xref and trailer, in chunks
+        """
+        yield self._object(CATALOG, f'<< /Type /Catalog /Pages {PAGES} 0 R >>'.encode('latin-1'))
+
+        self.offsets[PAGES] = self.position
+        yield self._out(f'{PAGES} 0 obj\n<< /Type /Pages /Count {len(self.pages)} /Kids ['.encode('latin-1'))
+        for start in range(0, len(self.pages), 1000):
+            yield self._out(''.join(f' {n} 0 R' for n in self.pages[start:start + 1000]).encode('latin-1'))
+        yield self._out(b' ] >>\nendobj\n')
+
+        xref_position = self.position
+        yield f'xref\n0 {len(self.offsets)}\n0000000000 65535 f \n'.encode('latin-1')
+        for start in range(1, len(self.offsets), 1000):
+            yield ''.join(f'{offset:010d} 00000 n \n' for offset in self.offsets[start:start + 1000]).encode('latin-1')
+        yield (f'trailer\n<< /Size {len(self.offsets)} /Root {CATALOG} 0 R >>\n'
+               f'startxref\n{xref_position}\n%%EOF\n').encode('latin-1')
+
+
+def text_at(x, y, text, font='F1', size=FONT_SIZE):
+    return f'BT /{font} {size} Tf {x:.1f} {y:.1f} Td {pdf_text(text)} Tj ET\n'
+
+
+def table_row(y, cells, font='F1'):
+    ops = []
+    x = MARGIN
+    for (_, width, right), cell in zip(COLUMNS, cells):
+        cell = fit(cell, width - 4)
+        if right:
+            # Approximate right alignment from the character count
+            ops.append(text_at(x + width - 4 - len(cell) * FONT_SIZE * 0.5, y, cell, font))
+        else:
+            ops.append(text_at(x + 2, y, cell, font))
+        x += width
+    return ''.join(ops)
+
+
+def report_row(order):
+    """
+    Table cells for one order, in the layout of the ReportLab report
+    """
+    total_amount = order['total_amount'] if order['total_amount'] else 0
+    discount_applied = bool(order['discount_applied'])
+    discount_amount = order['discount_amount'] if order['discount_amount'] else 0
+    order_date = order['order_date']
+    return [
+        str(order['order_id']),
+        order['customer_name'] or 'Unknown',
+        f"${total_amount:.2f}",
+        order_date.strftime("%m/%d/%Y") if order_date else "N/A",
+        (order['payment_method'] or 'Cash').title(),
+        str(order['item_count'] or 0),
+        str(order['total_quantity'] or 0),
+        f"${discount_amount:.2f}" if discount_applied and discount_amount > 0 else "None",
+    ]
+
+
+def stream_orders_report(conn, generated_at, chunk_size=1000):
+    """
+    Generator of PDF bytes for the all-orders report
+    """
+    writer = PdfStreamWriter()
+    yield writer.begin()
+
+    top = PAGE_HEIGHT - MARGIN
+    header = table_row(top - 60, [heading for heading, _, _ in COLUMNS], font='F2')
+    first_page = (text_at(MARGIN, top - 16, 'Sweet Delights Bakery - All Orders Report', 'F2', 16)
+                  + text_at(MARGIN, top - 34, f"Generated on: {generated_at.strftime('%B %d, %Y at %I:%M %p')}", size=10))
+    rows_top = top - 60 - ROW_HEIGHT
+    rows_per_page = int((rows_top - MARGIN) / ROW_HEIGHT)
+
+    total_revenue = 0
+    total_orders = 0
+    total_items = 0
+    total_discount_amount = 0
+
+    plan = get_plan('orders_report')
+    cursor = conn.cursor()
+    cursor.execute(plan.sql)
+    page_ops = [first_page, header]
+    page_rows = 0
+    page_count = 0
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for order in plan.decode_all(rows):
+                try:
+                    cells = report_row(order)
+                except Exception as row_error:
+                    print(f"❌ Error processing row: {str(row_error)}")
+                    continue
+                page_ops.append(table_row(rows_top - page_rows * ROW_HEIGHT, cells))
+                page_rows += 1
+
+                total_orders += 1
+                total_revenue += order['total_amount'] or 0
+                total_items += order['total_quantity'] or 0
+                discount_amount = order['discount_amount'] or 0
+                if order['discount_applied'] and discount_amount > 0:
+                    total_discount_amount += discount_amount
+
+                if page_rows == rows_per_page:
+                    page_count += 1
+                    page_ops.append(text_at(PAGE_WIDTH - MARGIN - 40, MARGIN / 2, f'Page {page_count}', size=8))
+                    yield writer.page(''.join(page_ops))
+                    page_ops = [header]
+                    page_rows = 0
+    finally:
+        cursor.close()
+
+    # Summary after the last row, on a fresh page if this one is full
+    summary = [
+        ('Total Revenue:', f"${total_revenue:.2f}"),
+        ('Total Orders:', total_orders),
+        ('Total Items Sold:', total_items),
+        ('Total Discount Given:', f"${total_discount_amount:.2f}"),
+    ]
+    y = rows_top - (page_rows + 1) * ROW_HEIGHT
+    if y - len(summary) * ROW_HEIGHT * 1.5 < MARGIN + 30:
+        page_count += 1
+        page_ops.append(text_at(PAGE_WIDTH - MARGIN - 40, MARGIN / 2, f'Page {page_count}', size=8))
+        yield writer.page(''.join(page_ops))
+        page_ops = []
+        y = top - 20
+    for label, value in summary:
+        page_ops.append(text_at(MARGIN + 250, y, label, 'F2', 11))
+        page_ops.append(text_at(MARGIN + 400, y, value, size=11))
+        y -= ROW_HEIGHT * 1.5
+    page_ops.append(text_at(MARGIN, y - 20, 'Sweet Delights Bakery Management System - Thank you for using our system!', size=9))
+    page_count += 1
+    page_ops.append(text_at(PAGE_WIDTH - MARGIN - 40, MARGIN / 2, f'Page {page_count}', size=8))
+    yield writer.page(''.join(page_ops))
+
+    yield from writer.finish()
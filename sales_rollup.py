@@ -0,0 +1,100 @@
+"""
+Incremental sales rollup for the admin dashboard.
+
+Every order insert also bumps a row of sales_daily and a row of
+sales_totals in the same transaction. Both are striped over SALES_BUCKETS
+rows, picked by the session id, so concurrent orders from different
+connections update different rows instead of queueing on one row lock.
+The dashboard reads the SALES_BUCKETS totals rows plus today's and
+yesterday's daily rows, whatever the size of the orders table and however
+many days of trading there have been.
+"""
+import datetime
+
+# Rows per day and all-time totals rows; orders on different connections mostly land in different ones
+SALES_BUCKETS = 8
+
+# Bump of the bucket's totals row, then upsert of the order's day/bucket row;
+# params are (total, total, order_date, order_date, total)
+RECORD_SALE_SQL = f"""
+DECLARE @bucket TINYINT = @@SPID % {SALES_BUCKETS};
+UPDATE sales_totals SET order_count = order_count + 1, revenue = revenue + ? WHERE bucket = @bucket;
+UPDATE sales_daily WITH (UPDLOCK, SERIALIZABLE)
+    SET order_count = order_count + 1, revenue = revenue + ?
+    WHERE sales_date = CAST(? AS DATE) AND bucket = @bucket;
+IF @@ROWCOUNT = 0
+    INSERT INTO sales_daily (sales_date, bucket, order_count, revenue) VALUES (CAST(? AS DATE), @bucket, 1, ?)
+"""
+
+# All-time totals, then today's count and sales and yesterday's sales; the
+# daily rows are a seek on (sales_date, bucket) for just those two days
+LIVE_STATS_SQL = """
+SELECT t.order_count, t.revenue, d.today_orders, d.today_sales, d.yesterday_sales
+FROM (SELECT SUM(order_count) AS order_count, SUM(revenue) AS revenue FROM sales_totals) t
+CROSS JOIN (SELECT SUM(CASE WHEN sales_date = ? THEN order_count END) AS today_orders,
+                   SUM(CASE WHEN sales_date = ? THEN revenue END) AS today_sales,
+                   SUM(CASE WHEN sales_date = ? THEN revenue END) AS yesterday_sales
+            FROM sales_daily WHERE sales_date IN (?, ?)) d
+"""
+
+REBUILD_SQL = f"""
+SET NOCOUNT ON;
+DELETE FROM sales_daily;
+INSERT INTO sales_daily (sales_date, bucket, order_count, revenue)
+    SELECT CAST(order_date AS DATE), 0, COUNT(*), ISNULL(SUM(total_price), 0)
+    FROM orders GROUP BY CAST(order_date AS DATE);
+DELETE FROM sales_totals;
+INSERT INTO sales_totals (bucket, order_count, revenue)
+    SELECT b.bucket, CASE WHEN b.bucket = 0 THEN o.order_count ELSE 0 END,
+           CASE WHEN b.bucket = 0 THEN o.revenue ELSE 0 END
+    FROM (VALUES {', '.join(f'({bucket})' for bucket in range(SALES_BUCKETS))}) b (bucket)
+    CROSS JOIN (SELECT COUNT(*) AS order_count, ISNULL(SUM(total_price), 0) AS revenue FROM orders) o;
+SET NOCOUNT OFF
+"""
+
+
+def record_sale_statement(order):
+    """
+    (sql, params) that adds one order to the rollup; runs in the order's transaction
+    """
+    total = order['total_price']
+    return RECORD_SALE_SQL.strip(), [total, total, order['order_date'], order['order_date'], total]
+
+
+def rebuild_rollup(conn):
+    """
+    Recompute the rollup from the orders table (after bulk loads or deletes)
+    """
+    cursor = conn.cursor()
+    cursor.execute(REBUILD_SQL)
+    conn.commit()
+    cursor.close()
+
+
+def live_stats(conn, now=None):
+    """
+    Today's and all-time sales figures from the rollup
+    """
+    today = (now or datetime.datetime.now()).date()
+    yesterday = today - datetime.timedelta(days=1)
+
+    cursor = conn.cursor()
+    cursor.execute(LIVE_STATS_SQL, (today, today, yesterday, today, yesterday))
+    row = cursor.fetchone()
+    cursor.close()
+
+    order_count, total_revenue, today_orders, today_sales, yesterday_sales = row if row else (0, 0, 0, 0, 0)
+    total_revenue = float(total_revenue or 0)
+    today_sales = float(today_sales or 0)
+    yesterday_sales = float(yesterday_sales or 0)
+    growth = ((today_sales - yesterday_sales) / yesterday_sales * 100) if yesterday_sales else 0
+
+    return {
+        'order_count': order_count or 0,
+        'total_revenue': total_revenue,
+        'avg_order': total_revenue / order_count if order_count else 0,
+        'today_orders': today_orders or 0,
+        'today_sales': today_sales,
+        'yesterday_sales': yesterday_sales,
+        'growth': round(growth, 1),
+    }
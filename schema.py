@@ -0,0 +1,107 @@
+"""
+Cached table schema for the Bakery Management System.
+
+Routes used to probe INFORMATION_SCHEMA / sys.columns on every request to
+find out which optional columns exist. The registry reads the columns of the
+tables below once and keeps them in memory until a migration runs or
+invalidate() is called.
+"""
+import hashlib
+import threading
+
+from flask import current_app
+
+from db_pool import get_db_connection
+
+TRACKED_TABLES = ('orders', 'order_items', 'products', 'product_stock')
+
+
+class SchemaRegistry:
+    """
+    In-memory map of table name -> ordered tuple of column names
+    """
+
+    def __init__(self, tables=TRACKED_TABLES):
+        self.tables = tuple(tables)
+        self._lock = threading.Lock()
+        # (columns, column sets, fingerprints) swapped in as one unit
+        self._snapshot = None
+        self.loads = 0
+
+    def load(self, conn):
+        """
+        Introspect all tracked tables in a single round trip
+        """
+        placeholders = ', '.join('?' for _ in self.tables)
+        cursor = conn.cursor()
+        cursor.execute(f"""
+        SELECT TABLE_NAME, COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_NAME IN ({placeholders})
+        ORDER BY TABLE_NAME, ORDINAL_POSITION
+        """, self.tables)
+
+        columns = {table: [] for table in self.tables}
+        for table_name, column_name in cursor.fetchall():
+            columns.setdefault(table_name.lower(), []).append(column_name)
+        cursor.close()
+
+        snapshot = (
+            {table: tuple(cols) for table, cols in columns.items()},
+            {table: frozenset(cols) for table, cols in columns.items()},
+            {table: hashlib.sha1(','.join(cols).encode('utf-8')).hexdigest()[:16]
+             for table, cols in columns.items()},
+        )
+        with self._lock:
+            self._snapshot = snapshot
+            self.loads += 1
+        return snapshot
+
+    def invalidate(self):
+        """
+        Drop the cached schema; the next lookup re-reads it
+        """
+        with self._lock:
+            self._snapshot = None
+
+    @property
+    def loaded(self):
+        return self._snapshot is not None
+
+    def _current(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self.load(get_db_connection())
+        return snapshot
+
+    def columns(self, table):
+        """
+        Ordered column names of a table (empty if the table doesn't exist)
+        """
+        return self._current()[0].get(table, ())
+
+    def has_column(self, table, column):
+        return column in self._current()[1].get(table, ())
+
+    def fingerprint(self, table):
+        """
+        Short hash of a table's column list; changes whenever the columns do
+        """
+        return self._current()[2].get(table, '')
+
+
+def get_schema(app=None):
+    """
+    Get the schema registry for this app
+    """
+    app = app or current_app._get_current_object()
+    registry = app.extensions.get('schema_registry')
+    if registry is None:
+        registry = app.extensions.setdefault('schema_registry', SchemaRegistry())
+    return registry
+
+
+def invalidate_schema(app=None):
+    """
+    Forget the cached schema, e.g. after running a migration
+    """
+    get_schema(app).invalidate()
@@ -0,0 +1,168 @@
+"""
+Stock reservation for placed orders.
+
+product_stock holds the units on hand, one row per tracked product (no
+row means the product's stock isn't tracked). It is kept out of products
+so a sale doesn't bump products.row_version, which versions the POS
+catalog and the search index. reserve_stock() takes every cart line off
+the shelf with one conditional UPDATE inside the caller's order
+transaction:
+
+    UPDATE product_stock SET on_hand = on_hand - requested WHERE on_hand >= requested
+
+The check and the decrement are a single statement, so two tills selling
+the last tray can't both succeed - the second one's UPDATE waits on the
+first one's row lock and then finds too little stock. If any tracked line
+comes up short, InsufficientStock is raised with every shortfall and the
+caller rolls the transaction back, which also undoes the lines that did
+fit. Only the sold products' stock rows are locked (ROWLOCK, in product id
+order so overlapping carts can't deadlock); the table is never locked.
+"""
+from schema import get_schema
+
+# Two parameters per cart line: SQL Server takes at most 2100 parameters
+# per request and 1000 rows per VALUES list
+MAX_LINES = 1000
+
+
+class InsufficientStock(Exception):
+    """
+    One or more cart lines asked for more than is on hand
+    """
+
+    def __init__(self, shortfalls):
+        self.shortfalls = shortfalls
+        super().__init__(self.describe())
+
+    def describe(self):
+        parts = []
+        for item in self.shortfalls:
+            if item['available'] is None:
+                parts.append(f"{item['name']} is no longer available")
+            else:
+                parts.append(f"{item['name']}: {item['requested']} requested, {item['available']} in stock")
+        return 'Not enough stock - ' + '; '.join(parts)
+
+
+def parse_stock(value):
+    """
+    Units on hand from the product form: None for blank (not tracked).
+    Raises ValueError for anything but a whole number of 0 or more.
+    """
+    value = (value or '').strip()
+    if not value:
+        return None
+    stock = int(value)
+    if stock < 0:
+        raise ValueError('Stock cannot be negative')
+    return stock
+
+
+def requested_units(cart_items):
+    """
+    {product_id: units} for a cart, with repeated products added up
+    """
+    requested = {}
+    for item in cart_items:
+        product_id = int(item['id'])
+        units = int(item['quantity'])
+        if units <= 0:
+            raise ValueError(f'Invalid quantity for {item.get("name") or product_id}')
+        requested[product_id] = requested.get(product_id, 0) + units
+    return requested
+
+
+def supports_stock():
+    return get_schema().has_column('product_stock', 'on_hand')
+
+
+def stock_column():
+    """
+    SELECT expression for a products row's units on hand (NULL if untracked)
+    """
+    if not supports_stock():
+        return 'NULL'
+    return '(SELECT on_hand FROM product_stock WHERE product_stock.product_id = products.id)'
+
+
+def set_stock(cursor, product_id, stock):
+    """
+    Record a counted stock level from the product form; None stops tracking it
+    """
+    if stock is None:
+        cursor.execute('DELETE FROM product_stock WHERE product_id = ?', (product_id,))
+        return
+    cursor.execute("""
+    UPDATE product_stock SET on_hand = ? WHERE product_id = ?;
+    IF @@ROWCOUNT = 0
+        INSERT INTO product_stock (product_id, on_hand) VALUES (?, ?)
+    """, (stock, product_id, product_id, stock))
+
+
+def reservation_sql(line_count):
+    """
+    The batch that reserves line_count distinct products; returns one row
+    per line that could not be reserved (product_id, requested, available, name)
+    """
+    statements = [
+        'SET NOCOUNT ON',
+        'DECLARE @lines TABLE (product_id INT PRIMARY KEY, requested INT NOT NULL)',
+        'DECLARE @reserved TABLE (product_id INT PRIMARY KEY)',
+        'INSERT INTO @lines (product_id, requested) VALUES ' + ', '.join('(?, ?)' for _ in range(line_count)),
+    ]
+    statements.append("""
+    UPDATE s SET on_hand = s.on_hand - l.requested
+    OUTPUT INSERTED.product_id INTO @reserved (product_id)
+    FROM @lines l
+    INNER JOIN product_stock s WITH (ROWLOCK) ON s.product_id = l.product_id
+    INNER JOIN products p ON p.id = l.product_id
+    WHERE s.on_hand >= l.requested AND COALESCE(p.active, 1) = 1
+    OPTION (FORCE ORDER, LOOP JOIN)
+    """)
+    # Untracked products (no stock row) always fit; missing or deleted ones never do
+    statements.append("""
+    SELECT l.product_id, l.requested,
+           CASE WHEN COALESCE(p.active, 1) = 1 THEN s.on_hand END AS available, p.name
+    FROM @lines l
+    LEFT JOIN products p ON p.id = l.product_id
+    LEFT JOIN product_stock s ON s.product_id = l.product_id
+    WHERE NOT EXISTS (SELECT 1 FROM @reserved r WHERE r.product_id = l.product_id)
+        AND (p.id IS NULL OR s.product_id IS NOT NULL OR COALESCE(p.active, 1) = 0)
+    ORDER BY l.product_id
+    """)
+    # NOCOUNT outlives the batch on a pooled connection
+    statements.append('SET NOCOUNT OFF')
+    return ';\n'.join(statements)
+
+
+def reserve_stock(conn, cart_items):
+    """
+    Take a cart's units off the shelf, inside the caller's transaction.
+    Raises InsufficientStock (the caller must roll back) if any line is short.
+    """
+    if not supports_stock():
+        return
+    requested = requested_units(cart_items)
+    if not requested:
+        return
+    if len(requested) > MAX_LINES:
+        raise ValueError(f'An order can have at most {MAX_LINES} different products')
+    params = []
+    # Product id order: the table variable's key drives the UPDATE, so
+    # every order locks the rows it shares with others in the same order
+    for product_id in sorted(requested):
+        params.extend((product_id, requested[product_id]))
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(reservation_sql(len(requested)), params)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    if rows:
+        raise InsufficientStock([{
+            'product_id': row[0],
+            'requested': row[1],
+            'available': row[2],
+            'name': row[3] or f'Product {row[0]}',
+        } for row in rows])
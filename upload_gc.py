@@ -0,0 +1,259 @@
+"""
+Background garbage collection for the uploads folder.
+
+Product routes never delete files themselves: replacing or deleting an
+image only releases its reference (upload_store.py). The sweeper runs on
+a background thread every UPLOAD_GC_INTERVAL seconds and reconciles the
+folder with the database:
+
+- blobs unreferenced for longer than the grace period are purged;
+- any other file that no active product (or blob row) refers to - leaked
+  legacy uploads, variants of replaced images, abandoned temp files - is
+  deleted once it is older than the grace period;
+- active products whose image file is missing are reported as dangling.
+
+References are read and files deleted in batches, with a short pause in
+between, so a sweep never holds a long transaction or saturates the disk.
+Worker processes take turns through a SQL Server application lock, so
+only one of them sweeps at a time.
+"""
+import os
+import re
+import threading
+import time
+
+from flask import current_app
+
+from db_pool import get_db_connection
+from image_variants import VARIANT_SIZES, parse_variants
+from upload_store import blob_files, purge_released, released_blobs
+
+VARIANT_RE = re.compile(r'^(.*)\.(%s)\.[a-z0-9]+$' % '|'.join(VARIANT_SIZES))
+SWEEP_LOCK = 'bms-upload-sweep'
+BATCH_PAUSE = 0.05
+
+
+class SweepReport:
+    """
+    What one sweep found and did
+    """
+
+    def __init__(self):
+        self.purged = []
+        self.deleted = []
+        self.dangling = []
+        self.scanned = 0
+        self.kept = 0
+        self.skipped = False
+
+    def as_dict(self):
+        return {
+            'scanned': self.scanned,
+            'kept': self.kept,
+            'purged': len(self.purged),
+            'deleted': len(self.deleted),
+            'dangling': self.dangling,
+            'skipped': self.skipped,
+        }
+
+
+def owner_name(filename):
+    """
+    The upload a file belongs to: itself, or the original a variant was made from
+    """
+    match = VARIANT_RE.match(filename)
+    return match.group(1) if match else filename
+
+
+def load_references(conn, batch_size=500):
+    """
+    (referenced names, referenced stems, [(id, name, image)] of active products)
+    """
+    cursor = conn.cursor()
+    names = set()
+    stems = set()
+    products = []
+
+    cursor.execute("SELECT id, name, image, image_filename, image_variants FROM products "
+                   "WHERE COALESCE(active, 1) = 1 AND COALESCE(image_filename, image, '') <> ''")
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for product_id, product_name, image, image_filename, variants in rows:
+            for name in (image, image_filename):
+                if name:
+                    name = os.path.basename(name)
+                    names.add(name)
+                    stems.add(os.path.splitext(name)[0])
+            names.update(parse_variants(variants).values())
+            products.append((product_id, product_name, os.path.basename(image_filename or image)))
+
+    # Blobs still referenced, or released too recently to purge
+    cursor.execute('SELECT name FROM upload_blobs')
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for (name,) in rows:
+            names.add(name)
+            stems.add(os.path.splitext(name)[0])
+    cursor.close()
+    return names, stems, products
+
+
+def is_referenced(filename, names, stems):
+    if filename in names:
+        return True
+    owner = owner_name(filename)
+    return owner != filename and owner in stems
+
+
+def sweep_uploads(conn, upload_dir, grace_seconds=3600, batch_size=500, dry_run=False):
+    """
+    Reconcile the uploads folder with the products table; returns a SweepReport
+    """
+    report = SweepReport()
+    purging = set()
+    if dry_run:
+        # List the purge candidates; their files count as purged, not kept
+        report.purged = released_blobs(conn, grace_seconds)
+        purging = {filename for name in report.purged for filename in blob_files(name)}
+    else:
+        report.purged = purge_released(conn, upload_dir, grace_seconds)
+
+    names, stems, products = load_references(conn, batch_size)
+    cutoff = time.time() - grace_seconds
+
+    batch = []
+    with os.scandir(upload_dir) as entries:
+        for entry in entries:
+            if not entry.is_file() or entry.name in purging:
+                continue
+            report.scanned += 1
+            if is_referenced(entry.name, names, stems):
+                report.kept += 1
+                continue
+            # Young files may belong to an upload whose transaction hasn't committed
+            if entry.stat().st_mtime > cutoff:
+                report.kept += 1
+                continue
+            batch.append(entry.name)
+            if len(batch) >= batch_size:
+                _delete_batch(upload_dir, batch, report, dry_run)
+                batch = []
+    _delete_batch(upload_dir, batch, report, dry_run)
+
+    for product_id, product_name, image in products:
+        if not os.path.exists(os.path.join(upload_dir, image)):
+            report.dangling.append({'id': product_id, 'name': product_name, 'image': image})
+    return report
+
+
+def _delete_batch(upload_dir, batch, report, dry_run):
+    for filename in batch:
+        if not dry_run:
+            try:
+                os.remove(os.path.join(upload_dir, filename))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"⚠️ Could not delete orphaned upload {filename}: {e}")
+                continue
+        report.deleted.append(filename)
+    if batch and not dry_run:
+        time.sleep(BATCH_PAUSE)
+
+
+def try_sweep_lock(conn):
+    """
+    Take the cross-process sweep lock without waiting; False if another process holds it
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+    DECLARE @result INT;
+    EXEC @result = sp_getapplock @Resource = ?, @LockMode = 'Exclusive',
+        @LockOwner = 'Session', @LockTimeout = 0;
+    SELECT @result
+    """, (SWEEP_LOCK,))
+    result = cursor.fetchone()[0]
+    cursor.close()
+    return result >= 0
+
+
+def release_sweep_lock(conn):
+    cursor = conn.cursor()
+    cursor.execute("EXEC sp_releaseapplock @Resource = ?, @LockOwner = 'Session'", (SWEEP_LOCK,))
+    cursor.close()
+
+
+def run_sweep(app, dry_run=False):
+    """
+    One locked sweep with the app's settings (needs an app context)
+    """
+    conn = get_db_connection()
+    report = SweepReport()
+    if not try_sweep_lock(conn):
+        report.skipped = True
+        return report
+    try:
+        report = sweep_uploads(conn, app.config['UPLOAD_FOLDER'],
+                               app.config.get('UPLOAD_GC_GRACE', 3600),
+                               app.config.get('UPLOAD_GC_BATCH', 500),
+                               dry_run=dry_run)
+    finally:
+        release_sweep_lock(conn)
+    return report
+
+
+class UploadSweeper:
+    """
+    Daemon thread running run_sweep() every `interval` seconds
+    """
+
+    def __init__(self, app, interval):
+        self.app = app
+        self.interval = interval
+        self.pid = os.getpid()
+        self.last_report = None
+        self._thread = threading.Thread(target=self._run, name='upload-sweeper', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                with self.app.app_context():
+                    report = run_sweep(self.app)
+                self.last_report = report
+                if report.deleted or report.purged or report.dangling:
+                    print(f"🧹 Upload sweep: {len(report.purged)} purged, {len(report.deleted)} orphans deleted, "
+                          f"{len(report.dangling)} products with missing images")
+                for product in report.dangling:
+                    print(f"⚠️ Product {product['id']} ({product['name']}) points at missing image {product['image']}")
+            except Exception as e:
+                print(f"❌ Upload sweep failed: {e}")
+
+
+_sweeper_lock = threading.Lock()
+
+
+def get_upload_sweeper(app=None):
+    """
+    Start (once per process) and return the app's upload sweeper; None if disabled
+    """
+    app = app or current_app._get_current_object()
+    interval = app.config.get('UPLOAD_GC_INTERVAL', 0)
+    if not interval:
+        return None
+    sweeper = app.extensions.get('upload_sweeper')
+    if sweeper is None or sweeper.pid != os.getpid():
+        with _sweeper_lock:
+            sweeper = app.extensions.get('upload_sweeper')
+            if sweeper is None or sweeper.pid != os.getpid():
+                sweeper = UploadSweeper(app, interval)
+                sweeper.start()
+                app.extensions['upload_sweeper'] = sweeper
+    return sweeper
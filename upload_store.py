@@ -0,0 +1,157 @@
+"""
+Content-addressed storage for uploaded product images.
+
+An upload is hashed while it streams to a temporary file and stored once
+under its SHA-256 (e.g. 3f9a...c2.jpg), however many products use it.
+upload_blobs counts the products referencing each blob: assigning an image
+acquires a reference and replacing or deleting one releases it, inside the
+product's own transaction. Blobs nobody has referenced for a while are
+removed by purge_released().
+
+Since a blob's name is its content, its URL never changes meaning and is
+served with a far-future immutable Cache-Control.
+"""
+import hashlib
+import os
+import re
+import uuid
+
+from image_variants import VARIANT_SIZES
+
+HASH_LENGTH = 40
+BLOB_NAME_RE = re.compile(r'^[0-9a-f]{%d}(\.[a-z0-9]+)?$' % HASH_LENGTH)
+CHUNK_SIZE = 64 * 1024
+
+
+def is_blob_name(filename):
+    """
+    True for content-addressed names (as opposed to legacy uuid_filename uploads)
+    """
+    return bool(filename and BLOB_NAME_RE.match(filename))
+
+
+class StagedUpload:
+    """
+    An upload hashed into a temporary file, waiting to be placed under its blob name
+    """
+
+    def __init__(self, upload_dir, name, size, tmp_path):
+        self.upload_dir = upload_dir
+        self.name = name
+        self.size = size
+        self.tmp_path = tmp_path
+
+    @property
+    def path(self):
+        return os.path.join(self.upload_dir, self.name)
+
+    def place(self):
+        """
+        Move the blob into place; call after acquiring its reference
+        """
+        if os.path.exists(self.path):
+            # Same bytes are already stored
+            self.discard()
+        else:
+            os.replace(self.tmp_path, self.path)
+
+    def discard(self):
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+
+def stage_upload(file_storage, upload_dir):
+    """
+    Stream an uploaded file to disk, hashing it on the way
+    """
+    extension = os.path.splitext(file_storage.filename or '')[1].lower()
+    if not re.match(r'^\.[a-z0-9]+$', extension):
+        extension = ''
+    tmp_path = os.path.join(upload_dir, f'.upload-{uuid.uuid4().hex}.tmp')
+    digest = hashlib.sha256()
+    size = 0
+    with open(tmp_path, 'wb') as f:
+        while True:
+            chunk = file_storage.stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+            size += len(chunk)
+    return StagedUpload(upload_dir, digest.hexdigest()[:HASH_LENGTH] + extension, size, tmp_path)
+
+
+def acquire_blob(cursor, name, size=None):
+    """
+    Add a product reference to a blob (creating its row on first use)
+    """
+    cursor.execute("""
+    UPDATE upload_blobs WITH (UPDLOCK, SERIALIZABLE)
+        SET ref_count = ref_count + 1, released_at = NULL
+        WHERE name = ?;
+    IF @@ROWCOUNT = 0
+        INSERT INTO upload_blobs (name, size, ref_count) VALUES (?, ?, 1)
+    """, (name, name, size))
+
+
+def release_blob(cursor, name):
+    """
+    Drop a product reference; the blob is purged once unreferenced for a while
+    """
+    if not name:
+        return
+    cursor.execute("""
+    UPDATE upload_blobs
+        SET ref_count = ref_count - 1,
+            released_at = CASE WHEN ref_count = 1 THEN GETDATE() ELSE released_at END
+        WHERE name = ? AND ref_count > 0
+    """, (name,))
+
+
+def blob_files(name):
+    """
+    The blob and every variant that may have been made from it
+    """
+    stem = os.path.splitext(name)[0]
+    return [name] + [f'{stem}.{variant}.{ext}' for variant in VARIANT_SIZES for ext in ('webp', 'jpg')]
+
+
+def released_blobs(conn, grace_seconds=3600):
+    """
+    Names of the blobs purge_released() would delete now, without deleting them
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+    SELECT name FROM upload_blobs
+    WHERE ref_count = 0 AND released_at < DATEADD(SECOND, -?, GETDATE())
+    """, (int(grace_seconds),))
+    names = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return names
+
+
+def purge_released(conn, upload_dir, grace_seconds=3600):
+    """
+    Delete blobs with no references for longer than the grace period.
+    Returns the names purged.
+    """
+    cursor = conn.cursor()
+    # Rows stay locked until commit, so nobody can re-acquire a blob
+    # while its file is being removed
+    cursor.execute("""
+    DELETE FROM upload_blobs
+    OUTPUT DELETED.name
+    WHERE ref_count = 0 AND released_at < DATEADD(SECOND, -?, GETDATE())
+    """, (int(grace_seconds),))
+    names = [row[0] for row in cursor.fetchall()]
+    for name in names:
+        for filename in blob_files(name):
+            try:
+                os.remove(os.path.join(upload_dir, filename))
+            except FileNotFoundError:
+                pass
+    conn.commit()
+    cursor.close()
+    return names